@@ -6,7 +6,9 @@ const foodSchema = new mongoose.Schema({
   price: { type: Number, required: true },
   category: { type: String },
   image: { type: String },
-  available: { type: Boolean, default: true }
+  available: { type: Boolean, default: true },
+  // Portions the kitchen can make per day; the ML service ranks foods forecast to sell out last
+  dailyCapacity: { type: Number, min: 0 }
 });
 
 const orderSchema = new mongoose.Schema({
@@ -18,5 +20,9 @@ const orderSchema = new mongoose.Schema({
   pickupTime: { type: Date }
 });
 
+// Per-user history and time-window queries from the ML service
+orderSchema.index({ user: 1, orderedAt: -1 });
+orderSchema.index({ orderedAt: -1 });
+
 module.exports.Food = mongoose.model('Food', foodSchema);
 module.exports.Order = mongoose.model('Order', orderSchema);
\ No newline at end of file
@@ -41,6 +41,10 @@ function setCachedRecommendations(userId, recommendations) {
 function clearUserCache(userId) {
   const cacheKey = `rec_${userId}`;
   recommendationsCache.delete(cacheKey);
+
+  // Also drop the ML service's cached result; failures are non-fatal
+  axios.post(`${ML_SERVICE_URL}/cache/invalidate`, { user_id: userId }, { timeout: 2000 })
+    .catch(error => console.error('Error invalidating ML service cache:', error.message));
 }
 
 // Call Python ML service
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
@@ -8,7 +8,25 @@ import pymongo
 from dotenv import load_dotenv
 import json
 import random
-from collections import Counter, defaultdict
+from collections import Counter
+import threading
+import time
+from ingestion import IngestionWorker
+from catalog import FoodCatalog
+from columnar import IdSet, OrderTable, score_aggregated, to_microseconds
+from cache import RecommendationCache
+from coldstart import CohortDefaults
+from cooccurrence import CooccurrenceModel
+from interactions import InteractionMatrix
+from materialize import MaterializedRecommendations
+from datastore import MongoDataStore, OrderAggregates
+from forecast import DemandForecast, parse_day
+from metrics import Metrics
+from parking_index import ParkingIndex, to_datetime
+from popularity import DecayedPopularity
+from retrain import MIN_PARALLEL_ORDERS, parallel_analyze
+from snapshot import (SnapshotError, SnapshotWatcher, current_stamp, read_snapshot, snapshot_lock,
+                      write_snapshot)
 
 # Load environment variables
 load_dotenv()
@@ -20,6 +38,9 @@ CORS(app)
 def get_mongo_client():
     try:
         mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/smartcampus')
+        if not mongo_uri:
+            print("🔄 MONGO_URI is empty - using mock data")
+            return None
         print(f"🔌 Connecting to MongoDB: {mongo_uri.replace('mongodb+srv://', 'mongodb+srv://[HIDDEN]@')}")
 
         client = pymongo.MongoClient(
@@ -44,39 +65,92 @@ def get_mongo_client():
 mongo_client = get_mongo_client()
 db = mongo_client['smartcampus'] if mongo_client is not None else None
 
+# Scoring implementation: 'dict' (per-order Python loops), 'columnar' (vectorized numpy) or
+# 'pushdown' (per-food totals grouped by MongoDB aggregation pipelines)
+ENGINE_MODES = ('dict', 'columnar', 'pushdown')
+ENGINE_MODE = os.getenv('ML_ENGINE_MODE', 'dict')
+# Processes used to shard full retrains over the order history; 1 keeps the serial path
+TRAIN_WORKERS = int(os.getenv('ML_TRAIN_WORKERS', 1))
+# Days after which an order counts half towards "popular now"
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv('ML_POPULARITY_HALF_LIFE_DAYS', 7))
+
+# Order and parking derived state, swapped in as a whole after a rebuild
+MODEL_STATE = ('popularity', 'user_preferences', 'order_table', 'cooccurrence', 'order_ids',
+               'last_order_id', 'hydrated_users', 'parking', 'parking_index', 'aggregated', 'aggregated_through')
+
+def user_roles(users):
+    """user id -> role from user documents"""
+    return {str(user.get('_id')): user['role'] for user in users if user.get('role')}
+
 class RecommendationEngine:
-    def __init__(self):
-        self.food_popularity = Counter()
-        self.user_preferences = defaultdict(Counter)
-        self.parking_usage = defaultdict(Counter)
+    def __init__(self, store=None, snapshot_path=None, train_workers=None, metrics=None, pushdown=None):
+        self.store = store
+        self.metrics = metrics or Metrics()
+        self.snapshot_path = snapshot_path
+        self.train_workers = TRAIN_WORKERS if train_workers is None else train_workers
+        # Build from server-side aggregates instead of loading every order
+        self.pushdown = ENGINE_MODE == 'pushdown' if pushdown is None else pushdown
+        self.snapshot_info = None
+        self.snapshot_stamp = None
+        # A published snapshot this worker cannot serve from, so it is not re-read on every poll
+        self.rejected_stamp = None
+        # Time-decayed ordered quantity per food, ranked as "popular now"
+        self.popularity = DecayedPopularity(POPULARITY_HALF_LIFE_DAYS)
+        # Integer-encoded user x food quantities and user x slot reservation counts
+        self.user_preferences = InteractionMatrix()
+
+        # Resident model state, built once and then updated with deltas
+        self.order_table = OrderTable()
+        self.cooccurrence = CooccurrenceModel()
+        self.order_ids = IdSet()
+        self.last_order_id = None
+        # Set when popularity and preferences came from aggregates covering orders up to aggregated_through
+        self.aggregated = False
+        self.aggregated_through = None
+        # Orders before history_start are only loaded per user, on first request
+        self.history_start = None
+        self.hydrated_users = set()
+        self.catalog = FoodCatalog()
+        # user id -> role, for cold-start cohorts
+        self.user_roles = {}
+        self.parking = {}
+        self.parking_index = ParkingIndex()
+        # Demand forecast whose predicted sell-outs and full slots recommendations move to the end
+        self.forecast = None
+        self.loaded = False
+        self.lock = threading.RLock()
+
+        # Data versions used to key cached results: global and per user
+        self.data_version = 0
+        self.user_versions = Counter()
+        # Called with a user id whenever that user's orders or parking change
+        self.user_listeners = []
 
     def load_data(self):
-        """Load and preprocess data from MongoDB with fallback"""
-        if mongo_client is None or db is None:
+        """Load data from MongoDB, mock data without a database, or None when the load fails"""
+        if self.store is None:
             print("🔄 Using mock data (MongoDB not available)")
             return self.get_mock_data()
 
         try:
-            # Load orders data
-            orders = list(db.orders.find({}))
-            users = list(db.users.find({}))
-            foods = list(db.foods.find({}))
-            parking_reservations = list(db.parking.find({}))
-
-            return {
-                'orders': orders,
-                'users': users,
-                'foods': foods,
-                'parking': parking_reservations
-            }
+            # Only the fields and time window the engine uses
+            self.history_start = self.store.horizon_start()
+            if self.pushdown:
+                try:
+                    return self.store.load_aggregates(start=self.history_start,
+                                                      half_life_days=POPULARITY_HALF_LIFE_DAYS)
+                except pymongo.errors.OperationFailure as e:
+                    print(f"⚠️  Aggregation pipeline failed ({e}); loading orders instead")
+            return self.store.load_all(start=self.history_start)
         except Exception as e:
-            print(f"❌ Error loading data from MongoDB: {e}")
-            print("🔄 Falling back to mock data")
-            return self.get_mock_data()
+            # The resident model outlives this load: keep serving it rather than swapping in mock data
+            print(f"❌ Error loading data from MongoDB: {e}; keeping the current model")
+            return None
 
     def get_mock_data(self):
         """Provide mock data when MongoDB is not available"""
         return {
+            'source': 'mock',
             'orders': [
                 {
                     '_id': 'mock_order_1',
@@ -181,43 +255,408 @@ class RecommendationEngine:
         }
 
 
+    def reset(self):
+        """Drop all resident state"""
+        with self.lock:
+            self.popularity.clear()
+            self.user_preferences.clear()
+            self.order_table.clear()
+            self.cooccurrence.clear()
+            self.order_ids.clear()
+            self.last_order_id = None
+            self.aggregated = False
+            self.aggregated_through = None
+            self.hydrated_users.clear()
+            self.parking.clear()
+            self.parking_index.clear()
+            self.data_version += 1
+
     def analyze_data(self, orders, parking_data):
         """Analyze order and parking data for recommendations"""
-        # Reset counters
-        self.food_popularity.clear()
-        self.user_preferences.clear()
-        self.parking_usage.clear()
+        with self.lock:
+            self.reset()
+
+            # Analyze food popularity and user preferences
+            # Streamed orders have no length up front; sharding always pays off at full-load scale
+            streamed = not isinstance(orders, list)
+            if isinstance(orders, OrderAggregates):
+                self.apply_aggregates(orders)
+            elif self.train_workers > 1 and (streamed or len(orders) >= MIN_PARALLEL_ORDERS):
+                parallel_analyze(self, orders, self.train_workers)
+            else:
+                for order in orders:
+                    self.apply_order(order)
+
+                self.cooccurrence.freeze()
+                self.user_preferences.compact()
+
+            # Analyze parking usage
+            for reservation in parking_data:
+                self.apply_reservation(reservation)
+            self.parking_index.compact()
+
+        return True
+
+    def apply_aggregates(self, aggregates):
+        """Build popularity, preferences and co-occurrence from server-side (user, food) totals"""
+        with self.lock:
+            # Rows arrive in first-seen order, so interning matches apply_order
+            for row in aggregates.rows:
+                self.user_preferences.add(str(row['user']), str(row.get('food', '')), row['quantity'])
+            self.user_preferences.compact()
+            half_life_days, origin = aggregates.decay
+            self.popularity = DecayedPopularity.from_totals([str(row['_id']) for row in aggregates.popularity],
+                                                            [row['decayed'] for row in aggregates.popularity],
+                                                            half_life_days, to_microseconds(origin))
+            self.popularity.set_categories(self.catalog)
+            self.cooccurrence = CooccurrenceModel.from_interactions(self.user_preferences)
+            self.last_order_id = aggregates.last_order_id
+            self.aggregated = True
+            self.aggregated_through = aggregates.last_order_id
+
+    def apply_order(self, order, history_only=False):
+        """Apply a single new order to the resident model"""
+        with self.lock:
+            order_id = order.get('_id')
+            if order_id is not None:
+                # Already counted by the aggregates; ObjectIds grow with insert time
+                if self.aggregated_through is not None and order_id <= self.aggregated_through:
+                    return False
+                if str(order_id) in self.order_ids:
+                    return False
+                self.order_ids.add(str(order_id))
+                if self.last_order_id is None or order_id > self.last_order_id:
+                    self.last_order_id = order_id
 
-        # Analyze food popularity and user preferences
-        for order in orders:
             user_id = str(order.get('user', ''))
-            if user_id:
+            self.touch_user(order.get('user'))
+            ordered_at = self.order_table.append(order)
+            if user_id and not history_only:
                 for item in order.get('items', []):
                     food_id = str(item.get('food', ''))
                     quantity = item.get('quantity', 1)
 
-                    self.food_popularity[food_id] += quantity
-                    self.user_preferences[user_id][food_id] += quantity
+                    if self.user_preferences.add(user_id, food_id, quantity):
+                        self.cooccurrence.add_user_food(self.user_preferences.items_of(user_id), food_id)
+                    self.popularity.add(food_id, quantity, ordered_at)
+
+            return True
 
-        # Analyze parking usage
-        for reservation in parking_data:
-            user_id = str(reservation.get('user', ''))
-            slot = reservation.get('slot', '')
-            if user_id and slot:
-                self.parking_usage[user_id][slot] += 1
+    def touch_user(self, user_id):
+        """Bump a user's data version and tell listeners their inputs changed"""
+        user_id = str(user_id)
+        self.user_versions[user_id] += 1
+        for listener in self.user_listeners:
+            listener(user_id)
+
+    def apply_reservation(self, reservation):
+        """Apply a new or updated parking document, replacing its previous contribution"""
+        with self.lock:
+            parking_id = str(reservation.get('_id'))
+            self.remove_reservation(parking_id)
+
+            # Affinity and occupancy history accumulate; replacing a document never removes it
+            self.parking_index.record(reservation)
+
+            self.parking[parking_id] = reservation
+            self.touch_user(reservation.get('user'))
+
+    def remove_reservation(self, parking_id):
+        """Remove a parking document's contribution from the resident model"""
+        with self.lock:
+            previous = self.parking.pop(str(parking_id), None)
+            if previous is None:
+                return
+            self.touch_user(previous.get('user'))
+            self.parking_index.forget_slot(previous.get('slot', ''), parking_id)
+
+    def apply_food(self, food):
+        """Add or replace a food document in the resident catalog"""
+        with self.lock:
+            if self.catalog.upsert(food):
+                self.popularity.set_categories(self.catalog)
+                self.data_version += 1
+
+    def remove_food(self, food_id):
+        """Drop a deleted food document from the resident catalog"""
+        with self.lock:
+            if self.catalog.remove(food_id):
+                self.popularity.set_categories(self.catalog)
+                self.data_version += 1
+
+    def sync_foods(self, foods):
+        """Reconcile the resident catalog with a full read of the foods collection"""
+        with self.lock:
+            if self.catalog.replace_all(foods):
+                self.popularity.set_categories(self.catalog)
+                self.data_version += 1
+
+    def sync_parking(self, parking_reservations):
+        """Reconcile resident parking state with a full read of the parking collection"""
+        with self.lock:
+            current_ids = {str(p.get('_id')) for p in parking_reservations}
+            for parking_id in [pid for pid in self.parking if pid not in current_ids]:
+                self.remove_reservation(parking_id)
+            for reservation in parking_reservations:
+                if self.parking.get(str(reservation.get('_id'))) != reservation:
+                    self.apply_reservation(reservation)
+
+    def build(self):
+        """Load all collections once and build the resident model"""
+        return self.build_from(self.load_data())
+
+    def build_from(self, data):
+        """Build the resident model from already loaded collections"""
+        if not data:
+            return None
 
+        # Orders may stream from an open cursor: build off to the side so requests keep
+        # using the current model until the new one is complete
+        model = RecommendationEngine(train_workers=self.train_workers, metrics=self.metrics)
+        try:
+            model.analyze_data(data['orders'], data['parking'])
+        except Exception as e:
+            print(f"❌ Error building the model: {e}; keeping the current model")
+            return None
+
+        with self.lock:
+            for name in MODEL_STATE:
+                setattr(self, name, getattr(model, name))
+            self.user_versions.update(model.user_versions)
+            self.data_version += 1
+            self.catalog = FoodCatalog(data['foods'])
+            self.popularity.set_categories(self.catalog)
+            self.user_roles = user_roles(data.get('users', []))
+            self.loaded = True
+            # The ingestion worker applied changes made during the load to the old model and moved its
+            # high-water mark past them: replay them into the new one before anything else sees it
+            try:
+                replayed = self.catch_up()
+            except Exception as e:
+                print(f"⚠️  Could not replay changes made during the build: {e}")
+                replayed = 0
+
+        print(f"📊 Model built: {len(data['orders'])} orders, {len(data['foods'])} foods, "
+              f"{len(data['parking'])} parking records" + (f", {replayed} newer orders replayed" if replayed else ''))
+        if self.snapshot_path and data.get('source') != 'mock':
+            try:
+                self.save_snapshot()
+            except Exception as e:
+                print(f"⚠️  Could not save snapshot {self.snapshot_path}: {e}")
+        return data
+
+    def boot(self):
+        """Restore the last snapshot and replay changes made since, or build from scratch"""
+        # Workers starting together wait for whichever one builds a missing snapshot
+        with snapshot_lock(self.snapshot_path):
+            if self.snapshot_path and os.path.exists(self.snapshot_path):
+                try:
+                    meta = self.load_snapshot()
+                    replayed = self.catch_up()
+                    print(f"📦 Model restored from snapshot taken {meta['created_at']}, "
+                          f"{replayed} newer orders replayed")
+                    return True
+                except Exception as e:
+                    print(f"⚠️  Could not restore snapshot {self.snapshot_path}: {e}; rebuilding")
+            return self.build() is not None
+
+    def refresh_snapshot(self):
+        """Swap to a snapshot another worker has published since ours"""
+        if not self.snapshot_path:
+            return False
+        stamp = current_stamp(self.snapshot_path)
+        if stamp is None or stamp in (self.snapshot_stamp, self.rejected_stamp):
+            return False
+        try:
+            meta = self.load_snapshot()
+        except SnapshotError as e:
+            print(f"⚠️  Not switching to snapshot {self.snapshot_path}: {e}")
+            self.rejected_stamp = stamp
+            return False
+        replayed = self.catch_up()
+        print(f"🔄 Switched to snapshot taken {meta['created_at']}, {replayed} newer orders replayed")
         return True
 
-    def get_popular_recommendations(self, user_id, foods_data, top_n=3):
+    def catch_up(self):
+        """Apply orders newer than the high-water mark and reconcile foods and parking"""
+        if self.store is None:
+            return 0
+        replayed = sum(1 for order in self.store.load_orders(after_id=self.last_order_id)
+                       if self.apply_order(order))
+        self.sync_foods(self.store.load_foods())
+        self.sync_parking(self.store.load_parking())
+        self.user_roles = user_roles(self.store.load_users())
+        return replayed
+
+    def to_snapshot(self):
+        """Metadata and arrays describing the resident model"""
+        with self.lock:
+            self.cooccurrence.freeze()
+            table_meta, table_arrays = self.order_table.to_snapshot()
+            cooccurrence_meta, cooccurrence_arrays = self.cooccurrence.to_snapshot()
+            preferences_meta, preferences_arrays = self.user_preferences.to_snapshot()
+            parking_meta, parking_arrays = self.parking_index.to_snapshot()
+
+            meta = {
+                'created_at': datetime.now().isoformat(),
+                'data_version': self.data_version,
+                'last_order_id': self.last_order_id,
+                'aggregated': self.aggregated,
+                'aggregated_through': self.aggregated_through,
+                'history_start': self.history_start,
+                'hydrated_users': list(self.hydrated_users),
+                'decayed_popularity': self.popularity.to_snapshot(),
+                'user_preferences': preferences_meta,
+                'catalog': list(self.catalog.by_id.values()),
+                'user_roles': self.user_roles,
+                'parking': list(self.parking.values()),
+                'parking_index': parking_meta,
+                'order_table': table_meta,
+                'cooccurrence': cooccurrence_meta
+            }
+            arrays = {
+                'order_ids': self.order_ids.to_array()
+            }
+            for prefix, component_arrays in (('order_table', table_arrays),
+                                             ('cooccurrence', cooccurrence_arrays),
+                                             ('user_preferences', preferences_arrays),
+                                             ('parking_index', parking_arrays)):
+                arrays.update({f'{prefix}.{name}': array for name, array in component_arrays.items()})
+        return meta, arrays
+
+    def save_snapshot(self, path=None):
+        """Persist the resident model so the next start skips the full MongoDB load"""
+        path = path or self.snapshot_path
+        meta, arrays = self.to_snapshot()
+        self.snapshot_stamp = write_snapshot(path, meta, arrays)
+        self.snapshot_info = {'path': path, 'created_at': meta['created_at'],
+                              'bytes': self.snapshot_stamp[2], 'restored': False}
+        print(f"💾 Snapshot saved to {path} ({self.snapshot_stamp[2] / 1e6:.1f} MB)")
+        return meta
+
+    def load_snapshot(self, path=None):
+        """Replace the resident model with a snapshot's contents in one swap"""
+        path = path or self.snapshot_path
+        meta, arrays, stamp = read_snapshot(path)
+        # Aggregated models cannot serve the per-order modes and full ones skip the pushdown build
+        if meta.get('aggregated', False) != self.pushdown:
+            built = 'pushdown' if meta.get('aggregated') else 'full'
+            raise SnapshotError(f"Snapshot holds a {built} model but this engine "
+                                f"{'uses' if self.pushdown else 'does not use'} pushdown mode")
+
+        def prefixed(prefix):
+            return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+        # Build the new state off to the side; requests keep using the current one meanwhile
+        if 'decayed_popularity' in meta:
+            popularity = DecayedPopularity.from_snapshot(meta['decayed_popularity'])
+        else:
+            # Older snapshots hold all-time counts only; they rank until the next retrain
+            popularity = DecayedPopularity(POPULARITY_HALF_LIFE_DAYS)
+            for food_id, quantity in meta['popularity']:
+                popularity.add(food_id, quantity)
+        catalog = FoodCatalog(meta['catalog'])
+        popularity.set_categories(catalog)
+        state = {
+            'popularity': popularity,
+            # Large tables stay backed by the shared read-only mapping
+            'user_preferences': InteractionMatrix.from_snapshot(meta['user_preferences'],
+                                                                prefixed('user_preferences.')),
+            'order_table': OrderTable.from_snapshot(meta['order_table'], prefixed('order_table.')),
+            'cooccurrence': CooccurrenceModel.from_snapshot(meta['cooccurrence'], prefixed('cooccurrence.')),
+            'order_ids': IdSet.from_array(arrays['order_ids']),
+            'last_order_id': meta['last_order_id'],
+            'aggregated': meta.get('aggregated', False),
+            'aggregated_through': meta.get('aggregated_through'),
+            'history_start': meta['history_start'],
+            'hydrated_users': set(meta['hydrated_users']),
+            'catalog': catalog,
+            'user_roles': meta.get('user_roles', {}),
+            'parking': {str(p.get('_id')): p for p in meta['parking']},
+            'parking_index': ParkingIndex.from_snapshot(meta['parking_index'], prefixed('parking_index.'))
+        }
+
+        with self.lock:
+            for name, value in state.items():
+                setattr(self, name, value)
+            self.data_version += 1
+            self.loaded = True
+            self.snapshot_stamp = stamp
+
+        self.snapshot_info = {'path': path, 'created_at': meta['created_at'], 'bytes': stamp[2], 'restored': True}
+        return meta
+
+    def is_cold_start(self, user_id):
+        """Whether a user has no order or parking history, so their cohort's defaults apply"""
+        user_id = str(user_id)
+        with self.lock:
+            # Orders before the bulk-load horizon are unknown until the user's history is loaded once
+            if self.history_start is not None and user_id not in self.hydrated_users:
+                return False
+            return not (self.order_table.has_user(user_id) or user_id in self.user_preferences
+                        or self.parking_index.has_user(user_id))
+
+    def needs_user_history(self, user_id):
+        """Whether a user's orders older than the bulk-load horizon still have to be loaded"""
+        # Pushdown scoring aggregates the full history server-side instead
+        return (self.store is not None and self.history_start is not None and not self.aggregated
+                and str(user_id) not in self.hydrated_users)
+
+    def ensure_user_history(self, user_id):
+        """Load a user's orders older than the bulk-load horizon with an indexed query"""
+        if not self.needs_user_history(user_id):
+            return 0
+        return self.apply_user_history(user_id, self.store.load_user_orders(user_id, before=self.history_start))
+
+    def apply_user_history(self, user_id, orders):
+        """Apply a user's pre-horizon orders and mark the user as hydrated"""
+        with self.lock:
+            # Older history feeds personal scoring only; global tables stay horizon-limited
+            applied = sum(1 for order in orders if self.apply_order(order, history_only=True))
+            self.hydrated_users.add(str(user_id))
+        return applied
+
+    def load_user_foods(self, user_id, now):
+        """A user's per-food totals aggregated by MongoDB, or None to score in process"""
+        if self.store is None:
+            return None
+        try:
+            return self.store.aggregate_user_foods(user_id, now)
+        except pymongo.errors.OperationFailure as e:
+            print(f"⚠️  Pushdown aggregation failed for {user_id}: {e}; scoring in process")
+            return None
+
+    def check_mode(self, mode):
+        """Validate an engine mode against the modes this model can serve"""
+        if mode not in ENGINE_MODES:
+            raise ValueError(f"Unknown engine mode '{mode}', expected one of {', '.join(ENGINE_MODES)}")
+        # Aggregated models hold no order history to score in process
+        if self.aggregated and mode != 'pushdown':
+            raise ValueError(f"Engine mode '{mode}' is unavailable: the model was built from aggregates")
+
+    def version(self, user_id):
+        """Version of the data a user's recommendations depend on"""
+        with self.lock:
+            return self.data_version, self.user_versions.get(str(user_id), 0)
+
+    def ensure_loaded(self):
+        """Build the resident model on first use"""
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self.build()
+        return self.loaded
+
+    def get_popular_recommendations(self, user_id, catalog, top_n=3, now=None):
         """Get recommendations based on popularity and user preferences"""
         user_id = str(user_id)
         user_ordered_foods = set(self.user_preferences.get(user_id, {}).keys())
 
-        # Get most popular foods that user hasn't ordered
+        # Walk the decayed popularity heap for the most popular foods the user hasn't ordered
         recommendations = []
-        for food_id, popularity in self.food_popularity.most_common():
+        for food_id, popularity in self.popularity.ranked(now=now):
             if food_id not in user_ordered_foods:
-                food_doc = next((f for f in foods_data if str(f.get('_id')) == food_id), None)
+                food_doc = catalog.get(food_id, available_only=True)
                 if food_doc:
                     recommendations.append({
                         'id': food_id,
@@ -231,9 +670,34 @@ class RecommendationEngine:
 
         return recommendations
 
-    def calculate_time_weights(self, orders):
+    def get_collaborative_recommendations(self, user_id, catalog, top_n=3, now=None):
+        """Get item-item collaborative recommendations, topped up with popular foods"""
+        user_id = str(user_id)
+        user_foods = self.user_preferences.get(user_id, {})
+
+        # Foods most often ordered by users who ordered the same foods as this user
+        recommendations = []
+        for food_id, score in self.cooccurrence.recommend(user_foods, top_n, accept=catalog.is_available):
+            food_doc = catalog.get(food_id)
+            recommendations.append({
+                'id': food_id,
+                'name': food_doc.get('name', 'Unknown'),
+                'price': food_doc.get('price', 0),
+                'score': score,
+                'reason': 'Popular among similar users'
+            })
+
+        # Fall back to overall popularity when there is not enough co-occurrence signal
+        if len(recommendations) < top_n:
+            chosen = {rec['id'] for rec in recommendations}
+            popular = self.get_popular_recommendations(user_id, catalog, top_n=top_n + len(chosen), now=now)
+            recommendations.extend([rec for rec in popular if rec['id'] not in chosen][:top_n - len(recommendations)])
+
+        return recommendations
+
+    def calculate_time_weights(self, orders, now=None):
         """Calculate time-weighted scores for orders"""
-        now = datetime.now()
+        now = now or datetime.now()
 
         for order in orders:
             order_date = order.get('orderedAt', now)
@@ -248,12 +712,12 @@ class RecommendationEngine:
 
         return orders
 
-    def analyze_trends(self, user_id, orders):
+    def analyze_trends(self, user_id, orders, now=None):
         """Analyze user behavior trends"""
         if not orders:
             return {'food_trends': {}, 'parking_trends': {}, 'has_recent_activity': False}
 
-        now = datetime.now()
+        now = now or datetime.now()
         seven_days_ago = now - timedelta(days=7)
         thirty_days_ago = now - timedelta(days=30)
 
@@ -308,7 +772,7 @@ class RecommendationEngine:
             'trend_period': '7_days'
         }
 
-    def get_personal_recommendations(self, user_id, orders, trends, foods_data, top_n=3):
+    def get_personal_recommendations(self, user_id, orders, trends, catalog, top_n=3):
         """Get personalized recommendations based on user's history and trends"""
         if not orders:
             return []
@@ -323,8 +787,8 @@ class RecommendationEngine:
                 quantity = item.get('quantity', 1)
 
                 if food_id not in food_scores:
-                    # Find food details from foods data instead of database query
-                    food_doc = next((f for f in foods_data if str(f.get('_id')) == food_id), None)
+                    # Find food details from the catalog index instead of database query
+                    food_doc = catalog.get(food_id, available_only=True)
                     if food_doc:
                         food_scores[food_id] = {
                             'id': food_id,
@@ -354,131 +818,506 @@ class RecommendationEngine:
         sorted_foods = sorted(food_scores.values(), key=lambda x: x['weighted_score'], reverse=True)
         return sorted_foods[:top_n]
 
-# Initialize recommendation engine
-engine = RecommendationEngine()
+    def recommend(self, user_id, mode=None, now=None, at=None, user_foods=None):
+        """Build food and parking recommendations for one user from the resident model"""
+        mode = mode or ENGINE_MODE
+        final_food_recs, trends = self.recommend_foods(user_id, mode=mode, now=now, user_foods=user_foods)
+        return {
+            'foods': final_food_recs,
+            'parking': self.recommend_parking(user_id, at=at),
+            'lastUpdated': datetime.now().isoformat(),
+            'algorithm': 'python_rule_based',
+            'engine_mode': mode,
+            'trends': trends
+        }
 
-@app.route('/health', methods=['GET'])
-def health_check():
+    def recommend_foods(self, user_id, mode=None, now=None, user_foods=None):
+        """Final food recommendations for one user, with the trends behind them"""
+        user_id = str(user_id)
+        mode = mode or ENGINE_MODE
+        self.check_mode(mode)
+        now = now or datetime.now()
+        stage = self.metrics.stage
+        with stage('load'):
+            self.ensure_user_history(user_id)
+            # Aggregated outside the lock; without a database pushdown scores in process
+            if mode == 'pushdown' and user_foods is None:
+                user_foods = self.load_user_foods(user_id, now)
+
+        with self.lock:
+            if user_foods is not None:
+                # Per-food totals were grouped by MongoDB; only the ranking happens here
+                with stage('personal'):
+                    personal_recs, trends = score_aggregated(user_foods, self.catalog)
+            elif mode != 'dict':
+                # Time weights, trends and personal scores in one vectorized pass over the order table
+                with stage('personal'):
+                    personal_recs, trends = self.order_table.score_user(user_id, self.catalog, now)
+            else:
+                # Get user's orders and calculate time weights
+                with stage('analysis'):
+                    user_orders = self.order_table.order_dicts(user_id)
+                    user_orders = self.calculate_time_weights(user_orders, now)
+
+                # Analyze trends
+                with stage('trends'):
+                    trends = self.analyze_trends(user_id, user_orders, now)
+
+                # Get personal recommendations
+                with stage('personal'):
+                    personal_recs = self.get_personal_recommendations(user_id, user_orders, trends, self.catalog)
+
+            # Get collaborative recommendations, topped up from overall popularity
+            with stage('popular'):
+                collaborative_recs = self.get_collaborative_recommendations(user_id, self.catalog, now=now)
+
+            # Combine recommendations
+            all_food_recs = personal_recs + collaborative_recs
+
+            # Remove duplicates and sort
+            food_recommendations = {}
+            for rec in all_food_recs:
+                food_id = rec['id']
+                if food_id not in food_recommendations:
+                    food_recommendations[food_id] = rec
+                else:
+                    # If collaborative score exists, boost the recommendation
+                    if 'Popular among similar users' in rec.get('reason', ''):
+                        food_recommendations[food_id]['weighted_score'] = (
+                            food_recommendations[food_id].get('weighted_score', 0) +
+                            rec.get('score', 0) * 0.5
+                        )
+                        food_recommendations[food_id]['reason'] = 'Your favorite + popular among similar users'
+
+            # Sort final recommendations, foods predicted to have sold out last, and add reasons
+            ranked = sorted(food_recommendations.values(),
+                            key=lambda x: x.get('weighted_score', x.get('score', 0)),
+                            reverse=True)
+            sold_out = self.forecast.avoid_foods(now) if self.forecast is not None else ()
+            if sold_out:
+                ranked.sort(key=lambda x: x['id'] in sold_out)
+            final_food_recs = []
+            for rec in ranked[:3]:
+                rec_copy = rec.copy()
+                if 'Popular among similar users' in rec.get('reason', ''):
+                    rec_copy['reason'] = 'Popular among similar students'
+                elif rec.get('total_orders', 0) > 1:
+                    rec_copy['reason'] = f'Ordered {rec["total_orders"]} times'
+                else:
+                    rec_copy['reason'] = 'Based on your order history'
+                final_food_recs.append(rec_copy)
+
+            return final_food_recs, trends
+
+    def recommend_parking(self, user_id, at=None):
+        """Parking from the slot affinity index, at the requested time (default: now)"""
+        with self.lock, self.metrics.stage('parking'):
+            full = self.forecast.avoid_slots(at) if self.forecast is not None else ()
+            return self.parking_index.recommend(str(user_id), at=at, avoid=full)
+
+    def popular_foods(self, category=None, limit=10, now=None):
+        """Available foods ranked by decayed popularity, overall or within one category"""
+        foods = []
+        with self.lock, self.metrics.stage('popular'):
+            for food_id, score in self.popularity.ranked(category, now):
+                food_doc = self.catalog.get(food_id, available_only=True)
+                if food_doc:
+                    foods.append({
+                        'id': food_id,
+                        'name': food_doc.get('name', 'Unknown'),
+                        'price': food_doc.get('price', 0),
+                        'category': food_doc.get('category'),
+                        'score': score
+                    })
+                    if len(foods) >= limit:
+                        break
+        return foods
+
+    def active_user_ids(self):
+        """Users with any order or parking history in the resident model"""
+        with self.lock:
+            user_ids = list(self.order_table.users.ids)
+            # Aggregated models know ordering users from their preferences only
+            user_ids.extend(u for u in self.user_preferences if not self.order_table.has_user(u))
+            user_ids.extend(u for u in self.parking_index.users()
+                            if not self.order_table.has_user(u) and u not in self.user_preferences)
+        return user_ids
+
+    def recommend_many(self, user_ids, mode=None, at=None):
+        """Yield (user_id, recommendations) pairs scored as of the same moment"""
+        now = datetime.now()
+        for user_id in user_ids:
+            try:
+                result = self.recommend(user_id, mode=mode, now=now, at=at)
+            except Exception as e:
+                print(f"Error generating recommendations for {user_id}: {e}")
+                result = None
+            yield user_id, result
+
+# Initialize recommendation engine and build the resident model once at startup
+horizon_days = float(os.getenv('ML_ORDER_HORIZON_DAYS') or 0) or None
+# Orders per cursor batch during full loads; 0 reads whole collections into memory first
+load_batch_size = int(os.getenv('ML_LOAD_BATCH_SIZE', 5000)) or None
+data_store = MongoDataStore(db, horizon_days=horizon_days, batch_size=load_batch_size) if db is not None else None
+# Snapshot of the trained model, written on every build and restored at startup
+snapshot_path = os.getenv('ML_SNAPSHOT_PATH', 'model_snapshot.bin') if data_store is not None else None
+# Stage timing histograms for /metrics, optionally echoed per request as a Server-Timing header
+metrics = Metrics()
+server_timing = os.getenv('ML_SERVER_TIMING', 'false').lower() == 'true'
+engine = RecommendationEngine(data_store, snapshot_path=snapshot_path or None, metrics=metrics)
+engine.boot()
+
+# Other workers publish snapshots on /train; follow them so no worker stays stale
+snapshot_watcher = None
+snapshot_poll = float(os.getenv('ML_SNAPSHOT_POLL', 5))
+if engine.snapshot_path and snapshot_poll > 0:
+    snapshot_watcher = SnapshotWatcher(engine, snapshot_poll).start()
+
+# Cache of computed food recommendations, keyed by user and data version; parking is live, so never cached
+recommendation_cache = RecommendationCache(
+    max_entries=int(os.getenv('ML_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('ML_CACHE_TTL', 300))
+)
+
+# Precomputed top-N recommendations in the default engine mode, refreshed in the background
+materialized = None
+if os.getenv('ML_MATERIALIZE', 'true').lower() != 'false':
+    materialized = MaterializedRecommendations(
+        engine, ENGINE_MODE,
+        max_entries=int(os.getenv('ML_MATERIALIZE_SIZE', 10000)),
+        max_age=float(os.getenv('ML_MATERIALIZE_MAX_AGE', 300)),
+        interval=float(os.getenv('ML_MATERIALIZE_INTERVAL', 2))
+    ).start()
+
+# Defaults for users without any history, by role and time of day: built before serving, then refreshed
+cold_start = None
+if os.getenv('ML_COLD_START', 'true').lower() != 'false':
+    cold_start = CohortDefaults(engine, max_age=float(os.getenv('ML_COLD_START_MAX_AGE', 300))).warm_up()
+
+# Next-day food demand and parking occupancy, kept fresh in the background and consulted by recommendations
+demand_forecast = None
+if os.getenv('ML_FORECAST', 'true').lower() != 'false':
+    demand_forecast = DemandForecast(
+        engine,
+        full_occupancy=float(os.getenv('ML_FORECAST_FULL_OCCUPANCY', 0.8)),
+        max_age=float(os.getenv('ML_FORECAST_MAX_AGE', 300))
+    ).warm_up()
+    engine.forecast = demand_forecast
+
+# Stream new orders, foods and parking changes into the resident model
+ingestion_worker = None
+if db is not None and os.getenv('ML_INGESTION', 'true').lower() != 'false':
+    ingestion_worker = IngestionWorker(data_store, engine).start()
+
+def recommendation_params(mode=None, at=None):
+    """Validate the engine mode and optional ISO 'at' time of a recommendations request"""
+    mode = mode or ENGINE_MODE
+    engine.check_mode(mode)
+    if at is not None:
+        parsed = to_datetime(at)
+        if parsed is None:
+            raise ValueError("Invalid 'at' time, expected ISO 8601")
+        at = parsed
+    return mode, at
+
+def batch_params(body):
+    """Validate a batch request body; user ids are None when every active user is asked for"""
+    mode, at = recommendation_params(body.get('engine'), body.get('at'))
+    if body.get('all_active'):
+        return mode, at, None
+    user_ids = body.get('user_ids')
+    if not isinstance(user_ids, list) or not user_ids:
+        raise ValueError("Provide a non-empty 'user_ids' list or 'all_active': true")
+    return mode, at, [str(user_id) for user_id in user_ids]
+
+def batch_lines(user_ids, mode, at):
+    """NDJSON lines of a batch, one per user"""
+    for user_id, recommendations in engine.recommend_many(user_ids, mode=mode, at=at):
+        if recommendations is None:
+            line = {'user_id': user_id, 'error': 'Could not generate recommendations'}
+        else:
+            line = {'user_id': user_id, 'recommendations': recommendations}
+        yield json.dumps(line) + '\n'
+
+def invalidate_summary(user_id=None):
+    """Drop cached and materialized recommendations for one user, or for everyone"""
+    user_id = str(user_id) if user_id else None
+    removed = recommendation_cache.invalidate(user_id)
+    if materialized is not None:
+        removed += materialized.invalidate(user_id)
+    return {
+        'status': 'success',
+        'scope': 'user' if user_id else 'global',
+        'removed': removed
+    }
+
+def popular_params(limit=None):
+    """Validate the optional 'limit' of a popular foods request"""
+    try:
+        limit = int(limit) if limit is not None else 10
+    except ValueError:
+        raise ValueError("Invalid 'limit', expected an integer") from None
+    if not 1 <= limit <= 100:
+        raise ValueError("Invalid 'limit', expected 1 to 100")
+    return limit
+
+def popular_summary(category, limit):
+    return {
+        'category': category,
+        'half_life_days': engine.popularity.half_life_days,
+        'foods': engine.popular_foods(category, limit),
+        'lastUpdated': datetime.now().isoformat()
+    }
+
+def forecast_params(day=None):
+    """Validate the optional 'date' of a forecast request"""
+    if demand_forecast is None:
+        raise ValueError('Demand forecasts are disabled (ML_FORECAST=false)')
+    if day is None:
+        return None
+    day = parse_day(day)
+    if day > datetime.now().date() + timedelta(days=demand_forecast.horizon_days):
+        raise ValueError(f"Invalid 'date', forecasts reach at most {demand_forecast.horizon_days} days ahead")
+    return day
+
+def forecast_summary(day, food=None, slot=None):
+    return demand_forecast.summary(day, food=food, slot=slot)
+
+def cache_version(user_id, mode):
+    """Cache key version for a user's food recommendations"""
+    return (mode,) + engine.version(user_id)
+
+def cache_entry(recommendations):
+    """The cacheable part of a response: another user taking a slot does not change our version"""
+    return dict(recommendations, parking=None)
+
+def from_cache(user_id, entry, at=None):
+    """A cached response with parking computed for this request, as materialized lookups do"""
+    return dict(entry, parking=engine.recommend_parking(user_id, at=at))
+
+def materialized_lookup(user_id, mode, at=None):
+    """Precomputed recommendations for a default-mode request about now, or None to compute them"""
+    if materialized is None or at is not None or mode != materialized.mode:
+        return None
+    with metrics.stage('lookup'):
+        return materialized.get(user_id)
+
+def cold_start_lookup(user_id, mode, at=None, role=None):
+    """Cohort defaults for a user without any history, or None to take the personalized path"""
+    if cold_start is None or not engine.is_cold_start(user_id):
+        return None
+    with metrics.stage('lookup'):
+        return cold_start.get(user_id, mode, at=at, role=role)
+
+def fetch_headers():
+    """Report MongoDB transfer for the current request"""
+    if data_store is None:
+        return {}
+    fetched = data_store.stats.current()
+    return {
+        'X-Fetch-Documents': str(fetched['documents']),
+        'X-Fetch-Bytes': str(fetched['bytes']),
+        'X-Fetch-Queries': str(fetched['queries'])
+    }
+
+def health_status():
     mongo_status = "connected" if mongo_client is not None and db is not None else "disconnected"
-    return jsonify({
+    return {
         'status': 'healthy',
         'service': 'ml_recommendation_engine',
         'mongodb': mongo_status,
-        'real_time_updates': mongo_status == "connected"
-    })
+        'real_time_updates': ingestion_worker is not None and ingestion_worker.is_alive(),
+        'ingestion': ingestion_worker.status() if ingestion_worker is not None else None,
+        'cache': recommendation_cache.stats(),
+        'materialized': materialized.stats() if materialized is not None else None,
+        'cold_start': cold_start.stats() if cold_start is not None else None,
+        'forecast': demand_forecast.stats() if demand_forecast is not None else None,
+        'snapshot': engine.snapshot_info,
+        'datastore': {
+            'order_horizon_days': data_store.horizon_days,
+            'fetched': data_store.stats.snapshot()
+        } if data_store is not None else None
+    }
+
+def metric_series():
+    """Counters and gauges exported next to the stage histograms on /metrics"""
+    series = []
+    if data_store is not None:
+        fetched = data_store.stats.snapshot()
+        for key, description in (('queries', 'MongoDB round trips'), ('documents', 'Documents fetched'),
+                                 ('bytes', 'BSON bytes fetched')):
+            series.append((f'ml_mongo_{key}_total', description, 'counter',
+                           [({'collection': collection}, counts.get(key, 0))
+                            for collection, counts in sorted(fetched.items())]))
+    cache = recommendation_cache.stats()
+    for key in ('hits', 'misses', 'evictions', 'expirations', 'invalidations'):
+        series.append((f'ml_cache_{key}_total', f'Recommendation cache {key}', 'counter', [({}, cache[key])]))
+    series.append(('ml_cache_entries', 'Recommendation cache entries', 'gauge', [({}, cache['entries'])]))
+    if materialized is not None:
+        stats = materialized.stats()
+        for key in ('hits', 'misses', 'refreshed'):
+            series.append((f'ml_materialized_{key}_total', f'Materialized recommendation {key}', 'counter',
+                           [({}, stats[key])]))
+        for key in ('entries', 'dirty'):
+            series.append((f'ml_materialized_{key}', f'Materialized recommendation {key} users', 'gauge',
+                           [({}, stats[key])]))
+    if cold_start is not None:
+        stats = cold_start.stats()
+        series.append(('ml_cold_start_served_total', 'Recommendations served from cohort defaults', 'counter',
+                       [({}, stats['served'])]))
+        series.append(('ml_cold_start_cohorts', 'Cohorts with precomputed defaults', 'gauge',
+                       [({}, stats['cohorts'])]))
+    if demand_forecast is not None:
+        stats = demand_forecast.stats()
+        series.append(('ml_forecast_builds_total', 'Demand forecasts built', 'counter', [({}, stats['builds'])]))
+        series.append(('ml_forecast_sold_out_foods', 'Foods predicted to sell out on forecast days', 'gauge',
+                       [({}, stats['sold_out_foods'])]))
+    series.append(('ml_data_version', 'Resident model data version', 'gauge', [({}, engine.data_version)]))
+    return series
+
+def timing_headers(total_seconds):
+    """Server-Timing header with the current request's stages and its total, when enabled"""
+    if not server_timing:
+        return {}
+    stages = metrics.server_timing()
+    total = f'total;dur={total_seconds * 1000:.3f}'
+    return {'Server-Timing': f'{stages}, {total}' if stages else total}
+
+def train_summary(data):
+    return {
+        'status': 'success',
+        'message': 'Data analyzed successfully',
+        'orders_count': len(data['orders']),
+        'foods_count': len(data['foods']),
+        'fetched': data_store.stats.current() if data_store is not None else None
+    }
+
+@app.before_request
+def begin_fetch_stats():
+    g.request_start = time.perf_counter()
+    metrics.begin_request()
+    if data_store is not None:
+        data_store.stats.begin_request()
+
+@app.after_request
+def add_fetch_stats(response):
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    if request.endpoint is not None:
+        metrics.observe('ml_request_seconds', elapsed, route=request.endpoint)
+    response.headers.update(fetch_headers())
+    response.headers.update(timing_headers(elapsed))
+    metrics.end_request()
+    return response
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    return jsonify(health_status())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(metric_series()), mimetype='text/plain; version=0.0.4')
 
 @app.route('/recommendations/<user_id>', methods=['GET'])
 def get_recommendations(user_id):
     try:
-        # Load fresh data
-        data = engine.load_data()
-        if not data:
-            return jsonify({'error': 'Could not load data'}), 500
+        try:
+            mode, at = recommendation_params(request.args.get('engine'), request.args.get('at'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        with metrics.stage('load'):
+            if not engine.ensure_loaded():
+                return jsonify({'error': 'Could not load data'}), 500
+
+        recommendations = (cold_start_lookup(user_id, mode, at, request.args.get('role'))
+                           or materialized_lookup(user_id, mode, at))
+        if recommendations is None:
+            with metrics.stage('load'):
+                engine.ensure_user_history(user_id)
+
+            version = cache_version(user_id, mode)
+            cached = recommendation_cache.get(user_id, version)
+            if cached is None:
+                recommendations = engine.recommend(user_id, mode=mode, at=at)
+                recommendation_cache.put(user_id, version, cache_entry(recommendations))
+            else:
+                recommendations = from_cache(user_id, cached, at)
+
+        with metrics.stage('serialize'):
+            return jsonify(recommendations)
 
-        # Analyze the data
-        engine.analyze_data(data['orders'], data['parking'])
+    except Exception as e:
+        print(f"Error generating recommendations: {e}")
+        return jsonify({'error': str(e)}), 500
 
-        # Get user's orders and calculate time weights
-        user_orders = [o for o in data['orders'] if str(o.get('user')) == user_id]
-        user_orders = engine.calculate_time_weights(user_orders)
+@app.route('/popular', methods=['GET'])
+def get_popular_foods():
+    """Foods popular right now, optionally within one category"""
+    try:
+        try:
+            limit = popular_params(request.args.get('limit'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        # Analyze trends
-        trends = engine.analyze_trends(user_id, user_orders)
+        with metrics.stage('load'):
+            if not engine.ensure_loaded():
+                return jsonify({'error': 'Could not load data'}), 500
 
-        # Get personal recommendations
-        personal_recs = engine.get_personal_recommendations(user_id, user_orders, trends, data['foods'])
+        return jsonify(popular_summary(request.args.get('category'), limit))
 
-        # Get popular recommendations
-        collaborative_recs = engine.get_popular_recommendations(user_id, data['foods'])
-        
-        # Combine recommendations
-        all_food_recs = personal_recs + collaborative_recs
+    except Exception as e:
+        print(f"Error ranking popular foods: {e}")
+        return jsonify({'error': str(e)}), 500
 
-        # Remove duplicates and sort
-        food_recommendations = {}
-        for rec in all_food_recs:
-            food_id = rec['id']
-            if food_id not in food_recommendations:
-                food_recommendations[food_id] = rec
-            else:
-                # If collaborative score exists, boost the recommendation
-                if 'Popular among similar users' in rec.get('reason', ''):
-                    food_recommendations[food_id]['weighted_score'] = (
-                        food_recommendations[food_id].get('weighted_score', 0) +
-                        rec.get('score', 0) * 0.5
-                    )
-                    food_recommendations[food_id]['reason'] = 'Your favorite + popular among similar users'
-
-        # Sort final recommendations and add reasons
-        final_food_recs = []
-        for rec in sorted(food_recommendations.values(),
-                         key=lambda x: x.get('weighted_score', x.get('score', 0)),
-                         reverse=True)[:3]:
-            rec_copy = rec.copy()
-            if 'Popular among similar users' in rec.get('reason', ''):
-                rec_copy['reason'] = 'Popular among similar students'
-            elif rec.get('total_orders', 0) > 1:
-                rec_copy['reason'] = f'Ordered {rec["total_orders"]} times'
-            else:
-                rec_copy['reason'] = 'Based on your order history'
-            final_food_recs.append(rec_copy)
-
-        # Get parking recommendations based on frequency
-        parking_recs = []
-        user_parking = [p for p in data['parking'] if str(p.get('user')) == user_id and p.get('status') in ['reserved', 'occupied']]
-
-        if user_parking:
-            parking_freq = {}
-            for reservation in user_parking:
-                slot = reservation.get('slot')
-                if slot:
-                    parking_freq[slot] = parking_freq.get(slot, 0) + 1
-
-            sorted_parking = sorted(parking_freq.items(), key=lambda x: x[1], reverse=True)
-            for slot, count in sorted_parking[:3]:
-                parking_recs.append({
-                    'slot': slot,
-                    'score': count,
-                    'reason': f'Reserved {count} times' if count > 1 else 'Your preferred spot'
-                })
-        else:
-            # Fallback parking recommendations from mock data
-            parking_recs = [
-                {
-                    'slot': 'A-02',
-                    'score': 2,
-                    'reason': 'Your preferred spot'
-                }
-            ]
+@app.route('/forecast', methods=['GET'])
+def get_forecast():
+    """Expected orders per food and occupancy per slot for each hour of a day (default: tomorrow)"""
+    try:
+        try:
+            day = forecast_params(request.args.get('date'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        return jsonify({
-            'foods': final_food_recs,
-            'parking': parking_recs,
-            'lastUpdated': datetime.now().isoformat(),
-            'algorithm': 'python_rule_based',
-            'trends': trends
-        })
+        with metrics.stage('load'):
+            if not engine.ensure_loaded():
+                return jsonify({'error': 'Could not load data'}), 500
+
+        return jsonify(forecast_summary(day, request.args.get('food'), request.args.get('slot')))
 
     except Exception as e:
-        print(f"Error generating recommendations: {e}")
+        print(f"Error forecasting demand: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/recommendations/batch', methods=['POST'])
+def get_batch_recommendations():
+    """Stream recommendations for many users as NDJSON, one line per user"""
+    try:
+        mode, at, user_ids = batch_params(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not engine.ensure_loaded():
+        return jsonify({'error': 'Could not load data'}), 500
+    if user_ids is None:
+        user_ids = engine.active_user_ids()
+    return Response(stream_with_context(batch_lines(user_ids, mode, at)), mimetype='application/x-ndjson')
+
+@app.route('/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """Drop cached recommendations for one user, or for everyone when no user_id is given"""
+    body = request.get_json(silent=True) or {}
+    return jsonify(invalidate_summary(body.get('user_id')))
+
 @app.route('/train', methods=['POST'])
 def train_models():
     """Endpoint to retrain ML models"""
     try:
-        data = engine.load_data()
+        # Rebuild the resident model from a full reload
+        data = engine.build()
         if not data:
             return jsonify({'error': 'Could not load data'}), 500
 
-        success = engine.analyze_data(data['orders'], data['parking'])
-
-        return jsonify({
-            'status': 'success',
-            'message': 'Data analyzed successfully',
-            'orders_count': len(data['orders']),
-            'foods_count': len(data['foods'])
-        })
+        return jsonify(train_summary(data))
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
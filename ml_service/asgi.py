@@ -0,0 +1,394 @@
+"""
+Async serving path for the ML service
+ASGI application exposing the same /health, /metrics, /popular, /forecast,
+/recommendations/<user_id>, /recommendations/batch, /cache/invalidate and
+/train contracts as the Flask app. MongoDB reads on the request path use the
+async driver (motor) so I/O waits do not pin a worker, scoring and anything
+that takes the engine lock run in a bounded thread pool, and concurrent
+requests for the same user share one in-flight computation. Batches stream
+as NDJSON while the users after them are still being scored.
+
+Run with: gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+"""
+
+import asyncio
+import contextvars
+import inspect
+import itertools
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+
+import app as ml
+from datastore import AsyncMongoDataStore
+
+USER_ROUTE = re.compile(r'^/recommendations/([^/]+)$')
+# Users scored per executor hop while streaming a batch
+BATCH_CHUNK_USERS = 50
+
+
+class Coalescer:
+    """Concurrent callers with the same key await one shared computation"""
+
+    def __init__(self):
+        self.inflight = {}
+        self.coalesced = 0
+
+    async def run(self, key, factory):
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # One caller disconnecting must not cancel the work for the others
+        return await asyncio.shield(task)
+
+
+executor_workers = int(os.getenv('ML_ASYNC_WORKERS', 4))
+executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix='ml-scoring')
+coalescer = Coalescer()
+async_store = None
+
+
+def run_in_executor(fn, *args):
+    # Carry the request context so stage timings recorded in the thread reach this request
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(executor, context.run, fn, *args)
+
+
+def connect_async_store():
+    """Async client for the same database the resident model was built from"""
+    if ml.db is None:
+        return None
+    client = AsyncIOMotorClient(
+        os.getenv('MONGO_URI', 'mongodb://localhost:27017/smartcampus'),
+        serverSelectionTimeoutMS=10000,
+        connectTimeoutMS=10000,
+        socketTimeoutMS=10000,
+        maxPoolSize=10,
+        retryWrites=True,
+        retryReads=True
+    )
+    # Share fetch counters so /health totals cover both serving paths
+    return AsyncMongoDataStore(client['smartcampus'], ml.data_store.horizon_days, stats=ml.data_store.stats,
+                               batch_size=ml.data_store.batch_size)
+
+
+async def load_data():
+    """Async counterpart of RecommendationEngine.load_data"""
+    if async_store is None:
+        return ml.engine.load_data()
+    try:
+        ml.engine.history_start = async_store.horizon_start()
+        if ml.engine.pushdown:
+            try:
+                return await async_store.load_aggregates(start=ml.engine.history_start,
+                                                         half_life_days=ml.POPULARITY_HALF_LIFE_DAYS)
+            except OperationFailure as e:
+                print(f"⚠️  Aggregation pipeline failed ({e}); loading orders instead")
+        return await async_store.load_all(start=ml.engine.history_start)
+    except Exception as e:
+        print(f"❌ Error loading data from MongoDB: {e}; keeping the current model")
+        return None
+
+
+async def train():
+    data = await load_data()
+    return await run_in_executor(ml.engine.build_from, data)
+
+
+async def ensure_loaded():
+    if not ml.engine.loaded:
+        await coalescer.run('train', train)
+    return ml.engine.loaded
+
+
+async def ensure_user_history(user_id):
+    if async_store is None or not ml.engine.needs_user_history(user_id):
+        return
+    orders = await coalescer.run(('history', user_id),
+                                 lambda: async_store.load_user_orders(user_id, before=ml.engine.history_start))
+    await run_in_executor(ml.engine.apply_user_history, user_id, orders)
+
+
+async def load_user_foods(user_id, now):
+    """Async counterpart of RecommendationEngine.load_user_foods"""
+    try:
+        return await async_store.aggregate_user_foods(user_id, now)
+    except OperationFailure as e:
+        print(f"⚠️  Pushdown aggregation failed for {user_id}: {e}; scoring in process")
+        return None
+
+
+async def compute_recommendations(user_id, mode, at):
+    now = datetime.now()
+    user_foods = None
+    if mode == 'pushdown' and async_store is not None:
+        with ml.metrics.stage('load'):
+            user_foods = await load_user_foods(user_id, now)
+    return await run_in_executor(
+        lambda: ml.engine.recommend(user_id, mode=mode, now=now, at=at, user_foods=user_foods)
+    )
+
+
+def precomputed_lookup(user_id, mode, at, role):
+    """Cohort defaults or materialized recommendations, or None; both take the engine lock"""
+    return ml.cold_start_lookup(user_id, mode, at, role) or ml.materialized_lookup(user_id, mode, at)
+
+
+def cached_lookup(user_id, mode, at):
+    """(cache version, cached foods with live parking or None); both take the engine lock"""
+    version = ml.cache_version(user_id, mode)
+    cached = ml.recommendation_cache.get(user_id, version)
+    return version, None if cached is None else ml.from_cache(user_id, cached, at)
+
+
+async def get_recommendations(user_id, query):
+    try:
+        mode, at = ml.recommendation_params(query.get('engine'), query.get('at'))
+    except ValueError as e:
+        return 400, {'error': str(e)}
+
+    with ml.metrics.stage('load'):
+        if not await ensure_loaded():
+            return 500, {'error': 'Could not load data'}
+
+    recommendations = await run_in_executor(precomputed_lookup, user_id, mode, at, query.get('role'))
+    if recommendations is not None:
+        return 200, recommendations
+
+    with ml.metrics.stage('load'):
+        await ensure_user_history(user_id)
+
+    version, recommendations = await run_in_executor(cached_lookup, user_id, mode, at)
+    if recommendations is None:
+        recommendations = await coalescer.run(
+            (user_id, version, at),
+            lambda: compute_recommendations(user_id, mode, at)
+        )
+        ml.recommendation_cache.put(user_id, version, ml.cache_entry(recommendations))
+    return 200, recommendations
+
+
+def next_chunk(lines):
+    return ''.join(itertools.islice(lines, BATCH_CHUNK_USERS)).encode()
+
+
+async def stream_batch(lines):
+    """NDJSON chunks of a batch, scored in the executor a few users at a time"""
+    while True:
+        chunk = await run_in_executor(next_chunk, lines)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def get_batch_recommendations(body):
+    try:
+        mode, at, user_ids = ml.batch_params(body)
+    except ValueError as e:
+        return 400, {'error': str(e)}
+
+    if not await ensure_loaded():
+        return 500, {'error': 'Could not load data'}
+    if user_ids is None:
+        user_ids = await run_in_executor(ml.engine.active_user_ids)
+    return 200, stream_batch(ml.batch_lines(user_ids, mode, at))
+
+
+async def invalidate_cache(body):
+    return 200, await run_in_executor(ml.invalidate_summary, body.get('user_id'))
+
+
+async def get_popular_foods(query):
+    try:
+        limit = ml.popular_params(query.get('limit'))
+    except ValueError as e:
+        return 400, {'error': str(e)}
+
+    with ml.metrics.stage('load'):
+        if not await ensure_loaded():
+            return 500, {'error': 'Could not load data'}
+    return 200, await run_in_executor(ml.popular_summary, query.get('category'), limit)
+
+
+async def get_forecast(query):
+    try:
+        day = ml.forecast_params(query.get('date'))
+    except ValueError as e:
+        return 400, {'error': str(e)}
+
+    with ml.metrics.stage('load'):
+        if not await ensure_loaded():
+            return 500, {'error': 'Could not load data'}
+    return 200, await run_in_executor(ml.forecast_summary, day, query.get('food'), query.get('slot'))
+
+
+async def train_models():
+    data = await coalescer.run('train', train)
+    if not data:
+        return 500, {'error': 'Could not load data'}
+    return 200, ml.train_summary(data)
+
+
+def health_check():
+    status = ml.health_status()
+    status['serving'] = {
+        'mode': 'asgi',
+        'executor_workers': executor_workers,
+        'inflight': len(coalescer.inflight),
+        'coalesced': coalescer.coalesced
+    }
+    return 200, status
+
+
+async def dispatch(method, path, query, body=None):
+    """(route name, status, body) for a request; route names match the Flask endpoints"""
+    if path == '/health' and method == 'GET':
+        return ('health_check',) + health_check()
+    if path == '/metrics' and method == 'GET':
+        return 'prometheus_metrics', 200, ml.metrics.render(ml.metric_series())
+    if path == '/popular' and method == 'GET':
+        return ('get_popular_foods',) + await get_popular_foods(query)
+    if path == '/forecast' and method == 'GET':
+        return ('get_forecast',) + await get_forecast(query)
+    if path == '/recommendations/batch' and method == 'POST':
+        return ('get_batch_recommendations',) + await get_batch_recommendations(body or {})
+    if path == '/cache/invalidate' and method == 'POST':
+        return ('invalidate_cache',) + await invalidate_cache(body or {})
+    if path == '/train' and method == 'POST':
+        return ('train_models',) + await train_models()
+    match = USER_ROUTE.match(path)
+    if match and method == 'GET':
+        return ('get_recommendations',) + await get_recommendations(match.group(1), query)
+    return None, 404, {'error': 'Not found'}
+
+
+def encode_body(body):
+    """JSON payload, or plain text for /metrics, and its content type"""
+    if isinstance(body, str):
+        return body.encode(), b'text/plain; version=0.0.4'
+    with ml.metrics.stage('serialize'):
+        return json.dumps(body, default=str).encode(), b'application/json'
+
+
+async def read_json(receive):
+    """JSON object of a request body, or {} when it is missing or invalid"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    try:
+        body = json.loads(b''.join(chunks) or b'{}')
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+def response_headers(content_type, headers=None, length=None):
+    response = [(b'content-type', content_type), (b'access-control-allow-origin', b'*')]
+    if length is not None:
+        response.append((b'content-length', str(length).encode()))
+    response.extend((name.lower().encode(), value.encode()) for name, value in (headers or {}).items())
+    return response
+
+
+async def send_response(send, status, payload, content_type, headers=None):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': response_headers(content_type, headers, len(payload))})
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def send_stream(send, status, chunks, headers=None):
+    """Send each chunk as it is produced, without a content length"""
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': response_headers(b'application/x-ndjson', headers)})
+    async for chunk in chunks:
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def lifespan(receive, send):
+    global async_store
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            async_store = connect_async_store()
+            print(f"⚡ Async serving ready ({executor_workers} scoring threads)")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if ml.ingestion_worker is not None:
+                ml.ingestion_worker.stop()
+            if ml.snapshot_watcher is not None:
+                ml.snapshot_watcher.stop()
+            if ml.materialized is not None:
+                ml.materialized.stop()
+            if ml.cold_start is not None:
+                ml.cold_start.stop()
+            if ml.demand_forecast is not None:
+                ml.demand_forecast.stop()
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    if scope['method'] == 'OPTIONS':
+        await send({'type': 'http.response.start', 'status': 204, 'headers': [
+            (b'access-control-allow-origin', b'*'),
+            (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+            (b'access-control-allow-headers', b'Content-Type, Authorization')
+        ]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    start = time.perf_counter()
+    ml.metrics.begin_request()
+    if ml.data_store is not None:
+        ml.data_store.stats.begin_request()
+    query = {key: values[-1] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+    try:
+        body = await read_json(receive) if scope['method'] == 'POST' else None
+        route, status, body = await dispatch(scope['method'], scope['path'], query, body)
+    except Exception as e:
+        print(f"Error handling {scope['path']}: {e}")
+        route, status, body = None, 500, {'error': str(e)}
+
+    if inspect.isasyncgen(body):
+        # Like Flask, a streamed response is timed before its body is sent
+        elapsed = time.perf_counter() - start
+        ml.metrics.observe('ml_request_seconds', elapsed, route=route)
+        headers = ml.fetch_headers()
+        headers.update(ml.timing_headers(elapsed))
+        ml.metrics.end_request()
+        await send_stream(send, status, body, headers)
+        return
+
+    # Serialize before taking the total so the Server-Timing header covers it
+    payload, content_type = encode_body(body)
+    elapsed = time.perf_counter() - start
+    if route is not None:
+        ml.metrics.observe('ml_request_seconds', elapsed, route=route)
+    headers = ml.fetch_headers()
+    headers.update(ml.timing_headers(elapsed))
+    ml.metrics.end_request()
+    await send_response(send, status, payload, content_type, headers)
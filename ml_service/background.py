@@ -0,0 +1,62 @@
+"""
+Background workers
+The service keeps several things fresh on daemon threads next to the request
+handlers: ingested deltas, materialized recommendations, cold-start defaults,
+demand forecasts and adopted snapshots. BackgroundWorker owns the thread:
+run() calls work() until stopped, pausing for the interval whenever work()
+reports nothing left to do, and reports failures without ending the thread.
+Results derived from the whole model (cold-start defaults, forecasts) are
+stale once the engine's data_version moves past the one they were built from
+or they are older than max_age.
+"""
+
+import threading
+import time
+
+
+class BackgroundWorker:
+    # Daemon thread name and the message printed when work() raises
+    name = 'background-worker'
+    failure = 'Background refresh failed'
+
+    def __init__(self, engine, interval, retry_interval=None):
+        self.engine = engine
+        # Pause when idle, and after a failure
+        self.interval = interval
+        self.retry_interval = interval if retry_interval is None else retry_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def work(self):
+        """One iteration; returns a truthy value when more work is waiting and the pause should be skipped"""
+        raise NotImplementedError
+
+    def failed(self, error):
+        print(f"❌ {self.failure}: {error}")
+
+    def stale(self, data_version, built_at):
+        """Whether a result built from data_version at built_at (monotonic) needs rebuilding"""
+        return (built_at is None or self.engine.data_version != data_version
+                or time.monotonic() - built_at > self.max_age)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                if not self.work():
+                    self._stop.wait(self.interval)
+            except Exception as e:
+                self.failed(e)
+                self._stop.wait(self.retry_interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
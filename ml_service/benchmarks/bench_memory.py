@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Interaction memory benchmark
+Compares the memory held by the previous per-user Counter of str(ObjectId)
+food ids with the integer-encoded InteractionMatrix, for the same user x food
+quantities from the synthetic campus workload, and the previous per-user dict
+of SlotAffinity objects with the interned pair table that serves parking
+recommendations, for the same reservation history. Reported in bytes per 100k
+interactions (distinct user/food or user/slot pairs).
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from interactions import InteractionMatrix  # noqa: E402
+from parking_index import PAIR_COUNT, PAIR_HOURS, PAIR_WEEKDAYS, ParkingIndex  # noqa: E402
+from workload import ARRIVAL_HOURS, generate, weighted_time  # noqa: E402
+
+
+class SlotAffinity:
+    """The previous per (user, slot) record: a count and two histogram arrays"""
+    __slots__ = ('count', 'hours', 'weekdays')
+
+    def __init__(self):
+        self.count = 0
+        self.hours = np.zeros(24, dtype=np.int32)
+        self.weekdays = np.zeros(7, dtype=np.int32)
+
+
+def order_items(orders):
+    """(user_id, food_id, quantity) for every order item, ids as the engine stores them"""
+    return [(str(order['user']), str(item['food']), item.get('quantity', 1))
+            for order in orders for item in order['items']]
+
+
+def build_counters(rows):
+    preferences = defaultdict(Counter)
+    for user_id, food_id, quantity in rows:
+        preferences[user_id][food_id] += quantity
+    return preferences
+
+
+def build_matrix(rows):
+    preferences = InteractionMatrix()
+    for user_id, food_id, quantity in rows:
+        preferences.add(user_id, food_id, quantity)
+    preferences.compact()
+    return preferences
+
+
+def reservations(data, slots, per_user, seed):
+    """(user_id, slot, started_at) for a reservation history; each user keeps to a few slots"""
+    rng = random.Random(seed)
+    names = [f'{chr(ord("A") + i // 50)}-{i % 50 + 1:02d}' for i in range(slots)]
+    now = max(order['orderedAt'] for order in data['orders'])
+    rows = []
+    for user in data['users']:
+        usual = rng.sample(names, k=min(slots, 4))
+        for _ in range(max(0, int(rng.gauss(per_user, per_user / 3)))):
+            rows.append((str(user['_id']), rng.choice(usual), weighted_time(rng, now, 90, ARRIVAL_HOURS)))
+    return rows
+
+
+def build_affinities(rows):
+    user_slots = defaultdict(dict)
+    for user_id, slot, started_at in rows:
+        affinity = user_slots[user_id].get(slot)
+        if affinity is None:
+            affinity = user_slots[user_id][slot] = SlotAffinity()
+        affinity.count += 1
+        affinity.hours[started_at.hour] += 1
+        affinity.weekdays[started_at.weekday()] += 1
+    return user_slots
+
+
+def build_parking_index(rows):
+    index = ParkingIndex()
+    for user_id, slot, started_at in rows:
+        index.add_affinity(user_id, slot, started_at)
+    index.compact()
+    return index
+
+
+def measure(build, rows):
+    """Bytes still allocated once build(rows) returns, and untraced build time in seconds"""
+    start = time.perf_counter()
+    build(rows)
+    seconds = time.perf_counter() - start
+
+    # Fresh id strings so neither side reuses the other's allocations
+    rows = [tuple(''.join(value) if isinstance(value, str) else value for value in row) for row in rows]
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = build(rows)
+    del rows
+    gc.collect()
+    allocated = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return result, allocated, seconds
+
+
+def report(title, results, interactions):
+    """Print one comparison table: (name, bytes, seconds) rows, previous representation first"""
+    print(title)
+    print(f"{'representation':<32}{'MB':>10}{'bytes/100k':>14}{'build s':>10}")
+    for name, allocated, seconds in results:
+        per_100k = allocated / interactions * 100_000
+        print(f"{name:<32}{allocated / 1e6:>10.2f}{per_100k:>14,.0f}{seconds:>10.2f}")
+    print(f"   {results[0][1] / results[1][1]:.1f}x less memory")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--foods', type=int, default=500)
+    parser.add_argument('--orders-per-user', type=int, default=20)
+    parser.add_argument('--parking-slots', type=int, default=200)
+    parser.add_argument('--reservations-per-user', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    data = generate(users=args.users, foods=args.foods, orders_per_user=args.orders_per_user,
+                    parking_slots=0, seed=args.seed)
+    rows = order_items(data['orders'])
+    parking_rows = reservations(data, args.parking_slots, args.reservations_per_user, args.seed)
+    del data
+
+    counters, counter_bytes, counter_seconds = measure(build_counters, rows)
+    matrix, matrix_bytes, matrix_seconds = measure(build_matrix, rows)
+
+    interactions = sum(len(prefs) for prefs in counters.values())
+    assert all(matrix.get(user_id) == dict(prefs) for user_id, prefs in counters.items())
+
+    report(f"📦 {len(counters)} users x {args.foods} foods, {len(rows)} order items, {interactions} interactions",
+           (('dict of Counter (str ids)', counter_bytes, counter_seconds),
+            ('InteractionMatrix (int CSR)', matrix_bytes, matrix_seconds)), interactions)
+    print(f"   {matrix.nbytes() / interactions:.1f} array bytes per interaction")
+    del counters, matrix
+
+    affinities, affinity_bytes, affinity_seconds = measure(build_affinities, parking_rows)
+    index, index_bytes, index_seconds = measure(build_parking_index, parking_rows)
+
+    pairs = sum(len(slots) for slots in affinities.values())
+    for user_id, slots in affinities.items():
+        for slot, pair in index.user_slots[user_id].items():
+            stats, affinity = index.pair_stats[int(pair)], slots[slot]
+            assert stats[PAIR_COUNT] == affinity.count
+            assert (stats[PAIR_HOURS] == affinity.hours).all() and (stats[PAIR_WEEKDAYS] == affinity.weekdays).all()
+
+    print()
+    report(f"🅿️  {len(affinities)} users x {args.parking_slots} slots, {len(parking_rows)} reservations, "
+           f"{pairs} user/slot pairs",
+           (('dict of SlotAffinity', affinity_bytes, affinity_seconds),
+            ('ParkingIndex (interned pairs)', index_bytes, index_seconds)), pairs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Aggregation pushdown benchmark
+Compares building the model from every order document with building it from
+(user, food) totals grouped by an aggregation pipeline, and per-user
+personal scoring from a user's order history with scoring from per-food
+totals aggregated server-side. Reports documents, BSON bytes and time for
+each, and fails if the two approaches disagree. The in-process FakeDatabase
+evaluates pipelines in Python, so its latencies include emulated server work
+and are only indicative; documents and bytes are what a cluster would send.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from workload import close, generate, load_fake_database, offline, strip  # noqa: E402
+
+offline()
+
+import app  # noqa: E402
+from datastore import MongoDataStore  # noqa: E402
+
+
+def transfer(store, fn, *args):
+    """fn's result, seconds, and the documents and bytes it fetched"""
+    before = store.stats.snapshot()
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+    after = store.stats.snapshot()
+    fetched = {key: sum(counts.get(key, 0) - before.get(collection, {}).get(key, 0)
+                        for collection, counts in after.items())
+               for key in ('documents', 'bytes')}
+    return result, seconds, fetched
+
+
+def print_row(name, seconds, fetched):
+    print(f"{name:<44}{fetched['documents']:>12,.0f}{fetched['bytes'] / 1e3:>12,.1f}{seconds * 1000:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--foods', type=int, default=150)
+    parser.add_argument('--orders-per-user', type=int, default=20)
+    parser.add_argument('--sample', type=int, default=100, help='Users whose personal scoring is compared')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    data = generate(users=args.users, foods=args.foods, orders_per_user=args.orders_per_user, seed=args.seed)
+    store = MongoDataStore(load_fake_database(data))
+    print(f"📦 {len(data['users'])} users, {len(data['foods'])} foods, {len(data['orders'])} orders")
+    print(f"{'':<44}{'documents':>12}{'KB':>12}{'ms':>12}")
+
+    loaded = app.RecommendationEngine(store, pushdown=False)
+    _, seconds, fetched = transfer(store, loaded.build)
+    print_row('build from orders', seconds, fetched)
+    aggregated = app.RecommendationEngine(store, pushdown=True)
+    _, seconds, fetched = transfer(store, aggregated.build)
+    print_row('build from aggregates', seconds, fetched)
+
+    differences = ['last_order_id'] if loaded.last_order_id != aggregated.last_order_id else []
+    # First-seen order breaks decayed popularity ties
+    if list(loaded.popularity.values) != list(aggregated.popularity.values):
+        differences.append('popularity order')
+    now = datetime.now()
+    if not close(loaded.popularity.top(now=now), aggregated.popularity.top(now=now)):
+        differences.append('decayed popularity')
+    if any(loaded.user_preferences.get(u) != aggregated.user_preferences.get(u) for u in loaded.user_preferences):
+        differences.append('user_preferences')
+
+    user_ids = [str(u['_id']) for u in random.Random(args.seed).sample(data['users'],
+                                                                       min(args.sample, len(data['users'])))]
+    totals = {'history': [0.0, {'documents': 0, 'bytes': 0}], 'pushdown': [0.0, {'documents': 0, 'bytes': 0}]}
+    for user_id in user_ids:
+        # What a user outside the bulk-load horizon costs in process: their orders, then scoring
+        orders, seconds, fetched = transfer(store, store.load_user_orders, user_id)
+        start = time.perf_counter()
+        expected = loaded.order_table.score_user(user_id, loaded.catalog, now)
+        seconds += time.perf_counter() - start
+        totals['history'][0] += seconds
+        for key in fetched:
+            totals['history'][1][key] += fetched[key]
+
+        rows, seconds, fetched = transfer(store, aggregated.load_user_foods, user_id, now)
+        start = time.perf_counter()
+        actual = app.score_aggregated(rows, aggregated.catalog)
+        seconds += time.perf_counter() - start
+        totals['pushdown'][0] += seconds
+        for key in fetched:
+            totals['pushdown'][1][key] += fetched[key]
+
+        if not close(expected, actual):
+            differences.append(f'personal scores for {user_id}')
+        if not close(strip(loaded.recommend(user_id, mode='columnar', now=now)),
+                     strip(aggregated.recommend(user_id, mode='pushdown', now=now))):
+            differences.append(f'recommendations for {user_id}')
+
+    for name, label in (('history', 'user history + columnar scoring'), ('pushdown', 'user aggregate + ranking')):
+        seconds, fetched = totals[name]
+        print_row(f'{label} (per user)', seconds / len(user_ids),
+                  {key: value / len(user_ids) for key, value in fetched.items()})
+
+    if differences:
+        print(f"❌ Pushdown differs from the in-process path: {', '.join(differences[:5])}")
+        sys.exit(1)
+    print(f"✅ Same model and recommendations for {len(user_ids)} users from aggregates")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Engine mode A/B check
+Scores every user of a synthetic campus workload with both the dict-based
+and the columnar (vectorized) engine modes against the same resident model
+and reports any difference in output, plus the time each mode took.
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from workload import generate, load_fake_database, offline, strip  # noqa: E402
+
+offline()
+
+import app  # noqa: E402
+from datastore import MongoDataStore  # noqa: E402
+
+# Pushdown scores from a database; bench_pushdown.py checks it against columnar
+MODES = ('dict', 'columnar')
+
+
+def compare(engine, user_ids):
+    now = datetime.now()
+    timings = {mode: 0.0 for mode in MODES}
+    mismatches = []
+    for user_id in user_ids:
+        results = {}
+        for mode in MODES:
+            start = time.perf_counter()
+            results[mode] = strip(engine.recommend(user_id, mode=mode, now=now))
+            timings[mode] += time.perf_counter() - start
+        if results['dict'] != results['columnar']:
+            mismatches.append((user_id, results))
+    return timings, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--foods', type=int, default=50)
+    parser.add_argument('--orders-per-user', type=int, default=20)
+    parser.add_argument('--days', type=int, default=60, help='Span of order history')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    data = generate(users=args.users, foods=args.foods, orders_per_user=args.orders_per_user, days=args.days,
+                    seed=args.seed)
+    # Other clients may have written orderedAt as an ISO string; both modes must parse it the same way
+    for order in data['orders'][::2]:
+        order['orderedAt'] = order['orderedAt'].isoformat()
+    engine = app.RecommendationEngine(MongoDataStore(load_fake_database(data)))
+    engine.build()
+
+    user_ids = list(engine.order_table.users.ids)
+    timings, mismatches = compare(engine, user_ids)
+
+    print(f"👥 Users compared: {len(user_ids)}")
+    for mode, seconds in timings.items():
+        print(f"   {mode:>8}: {seconds * 1000:.1f} ms total")
+    if mismatches:
+        user_id, results = mismatches[0]
+        print(f"❌ {len(mismatches)} users differ, first: {user_id}")
+        print(f"   dict:     {results['dict']['foods']}")
+        print(f"   columnar: {results['columnar']['foods']}")
+        sys.exit(1)
+    print("✅ Dict and columnar modes produce identical recommendations")
+
+
+if __name__ == '__main__':
+    main()
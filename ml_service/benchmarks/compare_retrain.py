@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Serial vs parallel retrain check
+Builds the model from the same synthetic campus workload with the serial
+apply_order pass and with the sharded process-pool retrain, reports the time
+each took and fails if any part of the resulting state or any user's
+recommendations differ (decayed popularity up to floating-point summation
+order, since shards sum it separately).
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from workload import close, generate, offline, strip  # noqa: E402
+
+offline()
+
+import app  # noqa: E402
+
+
+def model_state(engine):
+    """Everything the order-derived model holds, in a directly comparable form"""
+    table = engine.order_table
+    cooccurrence = engine.cooccurrence
+    cooccurrence.freeze()
+    n_foods = len(cooccurrence.foods)
+    return {
+        'order_ids': engine.order_ids.to_array().tolist(),
+        'last_order_id': engine.last_order_id,
+        'user_versions': dict(engine.user_versions),
+        # First-seen order breaks decayed popularity ties
+        'popularity_foods': list(engine.popularity.values),
+        'user_preferences': [(user_id, list(engine.user_preferences.get(user_id).items()))
+                             for user_id in engine.user_preferences],
+        'preference_items': engine.user_preferences.items.ids,
+        'order_table': (table.users.ids, table.foods.ids,
+                        [(table.user_order_rows.get(u).tolist(), table.user_item_rows.get(u).tolist())
+                         for u in range(len(table.users))],
+                        [getattr(table, name).values.tolist() for name in ('order_ts', 'order_user', 'item_order',
+                                                                           'item_food', 'item_quantity')]),
+        'cooccurrence_foods': cooccurrence.foods.ids,
+        'item_users': cooccurrence.item_users[:n_foods].tolist(),
+        # Scoring sums each column's contributions row by row, so order within a row is free
+        'cooccurrence_rows': [sorted(zip(*(part.tolist() for part in cooccurrence._frozen_row(row))))
+                              for row in range(n_foods)]
+    }
+
+
+def build(data, workers):
+    engine = app.RecommendationEngine(train_workers=workers)
+    start = time.perf_counter()
+    engine.analyze_data(data['orders'], data['parking'])
+    seconds = time.perf_counter() - start
+    engine.sync_foods(data['foods'])
+    return engine, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--foods', type=int, default=300)
+    parser.add_argument('--orders-per-user', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=max(2, os.cpu_count() or 1))
+    parser.add_argument('--sample', type=int, default=500, help='Users whose recommendations are compared')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    data = generate(users=args.users, foods=args.foods, orders_per_user=args.orders_per_user, seed=args.seed)
+    # Replayed change events can deliver an order twice
+    data['orders'].extend(data['orders'][::97])
+    # Shard even small runs so the parallel path is always the one checked
+    app.MIN_PARALLEL_ORDERS = 0
+
+    serial, serial_seconds = build(data, 1)
+    parallel, parallel_seconds = build(data, args.workers)
+
+    print(f"📦 {len(data['users'])} users, {len(data['foods'])} foods, {len(data['orders'])} orders")
+    print(f"   serial analyze_data:   {serial_seconds:.2f} s")
+    print(f"   {args.workers} workers analyze_data: {parallel_seconds:.2f} s ({serial_seconds / parallel_seconds:.1f}x)")
+
+    serial_state, parallel_state = model_state(serial), model_state(parallel)
+    differences = [name for name in serial_state if serial_state[name] != parallel_state[name]]
+
+    now = datetime.now()
+    if not close(serial.popularity.top(now=now), parallel.popularity.top(now=now)):
+        differences.append('decayed popularity')
+
+    # Shards sum decayed popularity in a different order, so scores are compared up to rounding
+    user_ids = [str(user['_id']) for user in data['users'][:args.sample]]
+    for user_id in user_ids:
+        for mode in ('dict', 'columnar'):
+            if not close(strip(serial.recommend(user_id, mode=mode, now=now)),
+                         strip(parallel.recommend(user_id, mode=mode, now=now))):
+                differences.append(f'recommendations for {user_id} ({mode})')
+
+    if differences:
+        print(f"❌ Parallel retrain differs from serial: {', '.join(differences[:5])}")
+        sys.exit(1)
+    print(f"✅ Identical model state and recommendations for {len(user_ids)} users in both engine modes")
+
+
+if __name__ == '__main__':
+    main()
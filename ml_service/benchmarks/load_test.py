@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Load and concurrency soak test
+Serves the Flask app over real HTTP from forked worker processes (one
+threaded server each, sharing the model built before the fork like gunicorn
+--preload) on a synthetic workload in the in-process MongoDB stand-in. For
+each worker x client thread configuration it drives
+/recommendations/<user_id> from concurrent clients while /train rebuilds the
+model alongside, and reports throughput with p50/p95/p99 latency. Every
+response is checked: recommendations must be well formed, name only known
+foods and slots, and match the single-threaded answer for the same user,
+and every /train must see the whole dataset. A configuration with failed
+checks makes the run exit non-zero.
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from workload import generate, load_fake_database, offline, percentile  # noqa: E402
+
+# Background workers are started per worker process from the command-line flags instead
+offline()
+
+from bson import ObjectId  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+import app  # noqa: E402
+from coldstart import CohortDefaults  # noqa: E402
+from datastore import MongoDataStore  # noqa: E402
+from forecast import DemandForecast  # noqa: E402
+from materialize import MaterializedRecommendations  # noqa: E402
+
+RESPONSE_KEYS = ('foods', 'parking', 'lastUpdated', 'algorithm', 'engine_mode')
+
+
+def summarize(samples, seconds):
+    """Throughput over the run and latency percentiles (ms) for per-request timings in ms"""
+    if not samples:
+        return {'requests': 0}
+    return {
+        'requests': len(samples),
+        'throughput_per_s': round(len(samples) / seconds, 1),
+        'p50_ms': round(percentile(samples, 50), 2),
+        'p95_ms': round(percentile(samples, 95), 2),
+        'p99_ms': round(percentile(samples, 99), 2),
+        'max_ms': round(max(samples), 2)
+    }
+
+
+def parse_counts(value):
+    return [int(count) for count in value.split(',')]
+
+
+def serve(engine, store, args, conn):
+    """Worker process: serve the preloaded model over HTTP until terminated"""
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app.engine = engine
+    app.data_store = store
+    # Threads do not survive the fork, so each worker starts its own
+    if args.materialize:
+        app.materialized = MaterializedRecommendations(engine, args.engine).start()
+    if args.cold_start:
+        app.cold_start = CohortDefaults(engine).warm_up()
+    if args.forecast:
+        app.demand_forecast = engine.forecast = DemandForecast(engine).warm_up()
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    conn.send(server.server_port)
+    server.serve_forever()
+
+
+def request(port, method, path):
+    """(status, body) of one HTTP request on a fresh connection"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        conn.request(method, path)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def answer(recommendations):
+    """The parts of a response that must not change while the data does not"""
+    return ([food.get('id') for food in recommendations['foods']],
+            [slot.get('slot') for slot in recommendations['parking']])
+
+
+def check_recommendations(recommendations, expected, food_ids, slots):
+    """Problems with one recommendations response; empty when it is consistent"""
+    missing = [key for key in RESPONSE_KEYS if key not in recommendations]
+    if missing:
+        return [f"missing {', '.join(missing)}"]
+    foods, parking = answer(recommendations)
+    problems = []
+    if len(foods) != len(set(foods)):
+        problems.append('duplicate foods')
+    if len(foods) > 3:
+        problems.append('more than 3 foods')
+    if any(food_id not in food_ids for food_id in foods):
+        problems.append('unknown food')
+    if any(slot not in slots for slot in parking):
+        problems.append('unknown parking slot')
+    if expected is not None and (foods, parking) != expected:
+        problems.append('differs from the single-threaded result')
+    return problems
+
+
+def run_config(workers, threads, args, engine, store, users, expected, food_ids, slots, n_orders):
+    """Load one worker x thread configuration for args.duration seconds"""
+    context = multiprocessing.get_context('fork')
+    processes, ports = [], []
+    for _ in range(workers):
+        parent, child = context.Pipe()
+        process = context.Process(target=serve, args=(engine, store, args, child), daemon=True)
+        process.start()
+        processes.append(process)
+        ports.append(parent.recv())
+
+    samples, train_samples = [], []
+    problems = Counter()
+    examples = []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def report(problem, detail):
+        with lock:
+            problems[problem] += 1
+            if len(examples) < 5:
+                examples.append(f'{problem}: {detail}')
+
+    def client(i):
+        rng = random.Random(args.seed + i)
+        timings = []
+        while not stop.is_set():
+            new_user = rng.random() < args.new_users
+            user_id = str(ObjectId()) if new_user else rng.choice(users)
+            start = time.perf_counter()
+            try:
+                status, body = request(rng.choice(ports), 'GET', f'/recommendations/{user_id}?engine={args.engine}')
+            except OSError as e:
+                report('connection error', e)
+                continue
+            timings.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                report(f'HTTP {status}', body[:200])
+                continue
+            for problem in check_recommendations(json.loads(body), None if new_user else expected[user_id],
+                                                 food_ids, slots):
+                report(problem, user_id)
+        with lock:
+            samples.extend(timings)
+
+    def trainer():
+        rng = random.Random(args.seed)
+        while not stop.wait(args.train_interval):
+            start = time.perf_counter()
+            try:
+                status, body = request(rng.choice(ports), 'POST', '/train')
+            except OSError as e:
+                report('train connection error', e)
+                continue
+            train_samples.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                report(f'train HTTP {status}', body[:200])
+            elif json.loads(body).get('orders_count') != n_orders:
+                report('train saw a partial dataset', json.loads(body).get('orders_count'))
+
+    clients = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    if args.train_interval > 0:
+        clients.append(threading.Thread(target=trainer))
+    start = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in clients:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    for process in processes:
+        process.terminate()
+        process.join()
+
+    return {
+        'workers': workers,
+        'threads': threads,
+        'recommendations': summarize(samples, seconds),
+        'train': summarize(train_samples, seconds),
+        'problems': dict(problems),
+        'examples': examples
+    }
+
+
+def print_results(results):
+    print(f"{'workers':>8}{'threads':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'trains':>8}{'train p50':>11}{'problems':>10}")
+    for result in results:
+        recs, train = result['recommendations'], result['train']
+        print(f"{result['workers']:>8}{result['threads']:>8}{recs.get('throughput_per_s', 0):>10}"
+              f"{recs.get('p50_ms', '-'):>10}{recs.get('p95_ms', '-'):>10}{recs.get('p99_ms', '-'):>10}"
+              f"{train['requests']:>8}{train.get('p50_ms', '-'):>11}{sum(result['problems'].values()):>10}")
+    for result in results:
+        for example in result['examples']:
+            print(f"⚠️  {result['workers']} workers x {result['threads']} threads: {example}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--foods', type=int, default=150)
+    parser.add_argument('--orders-per-user', type=int, default=20)
+    parser.add_argument('--parking-slots', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sample', type=int, default=500, help='Known users requested')
+    parser.add_argument('--workers', type=parse_counts, default=[1, 2],
+                        help='Comma-separated worker process counts')
+    parser.add_argument('--threads', type=parse_counts, default=[1, 4, 16],
+                        help='Comma-separated concurrent client thread counts')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per configuration')
+    parser.add_argument('--train-interval', type=float, default=2.0,
+                        help='Seconds between /train calls during a run; 0 disables them')
+    parser.add_argument('--new-users', type=float, default=0.1, help='Share of requests for users without history')
+    parser.add_argument('--engine', choices=app.ENGINE_MODES, default=app.ENGINE_MODE)
+    parser.add_argument('--materialize', action='store_true', help='Serve precomputed recommendations')
+    parser.add_argument('--cold-start', action='store_true', help='Serve cohort defaults to new users')
+    parser.add_argument('--forecast', action='store_true', help='Keep demand forecasts for recommendations')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    data = generate(users=args.users, foods=args.foods, orders_per_user=args.orders_per_user,
+                    parking_slots=args.parking_slots, seed=args.seed)
+    store = MongoDataStore(load_fake_database(data))
+    engine = app.RecommendationEngine(store)
+    engine.build()
+
+    rng = random.Random(args.seed)
+    users = [str(u['_id']) for u in rng.sample(data['users'], min(args.sample, len(data['users'])))]
+    if args.forecast:
+        # Forecasts reorder foods and slots, so the reference answers see them too
+        engine.forecast = DemandForecast(engine)
+        engine.forecast.refresh()
+    # Reference answers, computed one at a time before any concurrency
+    expected = {user_id: answer(engine.recommend(user_id, mode=args.engine)) for user_id in users}
+    food_ids = {str(food['_id']) for food in data['foods']}
+    slots = {parking['slot'] for parking in data['parking']}
+
+    print(f"📦 {len(data['users'])} users, {len(data['foods'])} foods, {len(data['orders'])} orders; "
+          f"{args.duration:g} s per configuration, /train every {args.train_interval:g} s")
+    results = []
+    for workers in args.workers:
+        for threads in args.threads:
+            result = run_config(workers, threads, args, engine, store, users, expected, food_ids, slots,
+                                len(data['orders']))
+            print(f"   {workers} workers x {threads} threads: "
+                  f"{result['recommendations'].get('throughput_per_s', 0)} req/s, "
+                  f"{sum(result['problems'].values())} problems")
+            results.append(result)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'timestamp': datetime.now().isoformat(), 'config': vars(args), 'results': results}, f,
+                      indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+    if any(result['problems'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
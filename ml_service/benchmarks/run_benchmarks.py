@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+ML service benchmark suite
+Generates a synthetic campus workload, loads it into the in-process MongoDB
+stand-in, and measures latency percentiles and throughput for load_data,
+analyze_data, analyze_trends, the full /recommendations/<user_id> path (computed,
+cached, materialized, and for new users with and without cold-start cohort
+defaults) and /train, plus peak RSS and peak Python allocations while building the model. Results are saved as JSON;
+pass --compare with an earlier result file to see the change per stage.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from workload import generate, load_fake_database, offline, percentile  # noqa: E402
+
+# Materialization and cold-start defaults are measured as their own stages so the on-demand stages stay comparable
+offline()
+
+import numpy as np  # noqa: E402
+from bson import ObjectId  # noqa: E402
+
+import app  # noqa: E402
+from coldstart import CohortDefaults  # noqa: E402
+from datastore import MongoDataStore  # noqa: E402
+from materialize import MaterializedRecommendations  # noqa: E402
+
+
+def summarize(samples):
+    """Latency percentiles (ms) and throughput for a list of per-call timings in ms"""
+    return {
+        'runs': len(samples),
+        'mean_ms': round(statistics.mean(samples), 4),
+        'p50_ms': round(percentile(samples, 50), 4),
+        'p90_ms': round(percentile(samples, 90), 4),
+        'p95_ms': round(percentile(samples, 95), 4),
+        'p99_ms': round(percentile(samples, 99), 4),
+        'max_ms': round(max(samples), 4),
+        'throughput_per_s': round(len(samples) / (sum(samples) / 1000), 2) if sum(samples) else None
+    }
+
+
+def measure(fn, args_list, warmup=1):
+    """Time fn(*args) for every args tuple, after warmup untimed calls"""
+    for args in args_list[:warmup]:
+        fn(*args)
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def reset_peak_rss():
+    """Reset the process high-water mark so the next peak_rss_mb() covers only what follows (Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def rss_mb(field='VmRSS'):
+    """Current (VmRSS) or peak (VmHWM) resident set size in MB"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Lifetime peak only, in KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def measure_peak_memory(fn):
+    """Peak resident set size while fn() runs, and the peak of Python allocations above the start, in MB"""
+    gc.collect()
+    exact = reset_peak_rss()
+    before = rss_mb()
+    # RSS alone hides allocations that reuse memory freed earlier, so Python allocations are traced too
+    tracemalloc.start()
+    fn()
+    allocated_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    peak = rss_mb('VmHWM')
+    return {'rss_before_mb': round(before, 1), 'peak_rss_mb': round(peak, 1),
+            'peak_delta_mb': round(peak - before, 1), 'peak_allocated_mb': round(allocated_peak / 1e6, 1),
+            'exact_rss': exact}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    data = generate(users=args.users, foods=args.foods, orders_per_user=args.orders_per_user,
+                    parking_slots=args.parking_slots, days=args.days, seed=args.seed)
+    store = MongoDataStore(load_fake_database(data), batch_size=args.load_batch_size or None)
+    engine = app.RecommendationEngine(store)
+    # First build, before other stages leave freed memory for it to reuse
+    memory = measure_peak_memory(engine.build)
+    memory['load_batch_size'] = args.load_batch_size
+
+    # Serve the benchmark model through the real Flask routes
+    app.engine = engine
+    app.data_store = store
+    client = app.app.test_client()
+
+    rng = random.Random(args.seed)
+    user_ids = [str(u['_id']) for u in rng.sample(data['users'], min(args.sample, len(data['users'])))]
+    repeat = [()] * args.repeat
+    results = {}
+
+    print(f"📦 {len(data['users'])} users, {len(data['foods'])} foods, {len(data['orders'])} orders, "
+          f"{len(data['parking'])} parking slots")
+
+    def load_data():
+        loaded = engine.load_data()
+        # Streamed orders are only fetched as they are consumed
+        for _ in loaded['orders']:
+            pass
+
+    results['load_data'] = measure(load_data, repeat)
+    results['analyze_data'] = measure(lambda: engine.analyze_data(data['orders'], data['parking']), repeat)
+
+    now = datetime.now()
+    weighted = {u: engine.calculate_time_weights(engine.order_table.order_dicts(u), now)
+                for u in user_ids}
+    results['analyze_trends'] = measure(lambda u: engine.analyze_trends(u, weighted[u], now),
+                                        [(u,) for u in user_ids])
+
+    def get_recommendations(user_id, cached):
+        if not cached:
+            app.recommendation_cache.invalidate(user_id)
+        response = client.get(f'/recommendations/{user_id}?engine={args.engine}')
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    results['recommendations'] = measure(get_recommendations, [(u, False) for u in user_ids])
+    results['recommendations_cached'] = measure(get_recommendations, [(u, True) for u in user_ids])
+
+    # Cold lookups queue the sample; refresh() precomputes it without the background thread
+    materialized = MaterializedRecommendations(engine, args.engine, batch_size=len(user_ids))
+    for user_id in user_ids:
+        materialized.get(user_id)
+    materialized.refresh()
+    app.materialized = materialized
+    results['recommendations_materialized'] = measure(get_recommendations, [(u, False) for u in user_ids])
+    app.materialized = None
+
+    # Users with no history yet, like new students at semester start
+    new_user_ids = [str(ObjectId()) for _ in user_ids]
+    results['recommendations_new_user'] = measure(get_recommendations, [(u, False) for u in new_user_ids])
+    app.cold_start = CohortDefaults(engine)
+    app.cold_start.build()
+    results['recommendations_cold_start'] = measure(get_recommendations, [(u, False) for u in new_user_ids])
+    app.cold_start = None
+
+    def train():
+        response = client.post('/train')
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    results['train'] = measure(train, repeat)
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'config': vars(args),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'commit': git_commit()
+        },
+        'dataset': {name: len(documents) for name, documents in data.items()},
+        'results': results,
+        'memory': memory
+    }
+
+
+def print_results(report, baseline=None, threshold=10.0):
+    """Print a table of results, with the p50/p95 change against a baseline report"""
+    previous = (baseline or {}).get('results', {})
+    regressions = []
+    print(f"{'stage':<30}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>12}{'Δp50':>9}{'Δp95':>9}")
+    for stage, result in report['results'].items():
+        line = (f"{stage:<30}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}"
+                f"{result['p99_ms']:>10.3f}{result['throughput_per_s'] or 0:>12.1f}")
+        if stage in previous:
+            for key in ('p50_ms', 'p95_ms'):
+                change = (result[key] - previous[stage][key]) / previous[stage][key] * 100 if previous[stage][key] else 0
+                line += f"{change:>+8.1f}%"
+                if change > threshold:
+                    regressions.append((stage, key, change))
+        print(line)
+
+    memory = report.get('memory')
+    if memory:
+        line = (f"{'build peak RSS':<30}{memory['peak_rss_mb']:>10.1f} MB (+{memory['peak_delta_mb']:.1f}), "
+                f"peak allocated {memory['peak_allocated_mb']:.1f} MB")
+        previous_memory = (baseline or {}).get('memory')
+        if previous_memory:
+            line += f" ({memory['peak_allocated_mb'] - previous_memory['peak_allocated_mb']:+.1f} MB)"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--foods', type=int, default=150)
+    parser.add_argument('--orders-per-user', type=int, default=20)
+    parser.add_argument('--parking-slots', type=int, default=100)
+    parser.add_argument('--days', type=int, default=90, help='Span of order history')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sample', type=int, default=300, help='Users timed per-user stages')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of whole-dataset stages')
+    parser.add_argument('--engine', choices=app.ENGINE_MODES, default=app.ENGINE_MODE)
+    parser.add_argument('--load-batch-size', type=int, default=app.load_batch_size or 0,
+                        help='Orders per cursor batch during loads; 0 loads whole collections')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/bench-<time>.json)')
+    parser.add_argument('--compare', help='Earlier result file to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Percent slowdown reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = run(args)
+    regressions = print_results(report, baseline, args.threshold)
+
+    output = args.output or os.path.join(BENCH_DIR, 'results',
+                                         f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Results saved to {output}")
+
+    if regressions:
+        for stage, key, change in regressions:
+            print(f"⚠️  {stage} {key} regressed {change:+.1f}%")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Synthetic campus workload
+Generates users, foods, orders and parking slots shaped like campus traffic:
+Zipf-skewed food popularity, each user sticking to a personal subset of the
+menu, order times clustered around breakfast, lunch and dinner on weekdays,
+and parking reservations starting in the morning. Everything is derived from
+a seed so runs are reproducible, and can be loaded into the in-process
+FakeDatabase stand-in behind a MongoDataStore. Also holds what the benchmark
+scripts share: the environment that keeps `import app` offline, latency
+percentiles and result comparison.
+"""
+
+import os
+import random
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from fakedb import FakeDatabase
+
+CATEGORIES = ['Main Course', 'Beverage', 'Snack', 'Breakfast', 'Dessert']
+# Relative order volume per hour of day: breakfast, lunch and dinner peaks
+MEAL_HOURS = [0, 0, 0, 0, 0, 0, 1, 6, 8, 4, 2, 4, 10, 9, 4, 2, 2, 3, 7, 6, 3, 1, 0, 0]
+# Relative order volume per weekday, Monday first
+WEEKDAYS = [1.0, 1.0, 1.0, 1.0, 0.9, 0.35, 0.25]
+# Relative parking arrivals per hour of day
+ARRIVAL_HOURS = [0, 0, 0, 0, 0, 0, 2, 8, 10, 6, 3, 2, 3, 2, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0]
+# No database connection, snapshot file or background workers for the module-level engine in app;
+# benchmarks build their own engines on a FakeDatabase and start any workers they measure themselves
+OFFLINE_ENV = {
+    'MONGO_URI': '',
+    'ML_SNAPSHOT_PATH': '',
+    'ML_INGESTION': 'false',
+    'ML_MATERIALIZE': 'false',
+    'ML_COLD_START': 'false',
+    'ML_FORECAST': 'false'
+}
+
+
+def offline():
+    """Keep a later `import app` from connecting to MongoDB, writing a snapshot or starting workers"""
+    os.environ.update(OFFLINE_ENV)
+
+
+def weighted_time(rng, now, days, hours):
+    """A timestamp within the last `days` days following the weekday and hour weights"""
+    while True:
+        day = now.date() - timedelta(days=rng.randrange(days))
+        if rng.random() < WEEKDAYS[day.weekday()]:
+            break
+    hour = rng.choices(range(24), weights=hours)[0]
+    moment = datetime(day.year, day.month, day.day, hour, rng.randrange(60), rng.randrange(60))
+    return min(moment, now)
+
+
+def generate(users=1000, foods=100, orders_per_user=20, parking_slots=100, days=90,
+             seed=42, now=None):
+    """Build a {'users', 'foods', 'orders', 'parking'} dataset"""
+    rng = random.Random(seed)
+    now = now or datetime.now()
+
+    food_docs = [{
+        '_id': ObjectId(),
+        'name': f'Food {i}',
+        'price': rng.randint(20, 300),
+        'category': rng.choice(CATEGORIES),
+        'available': rng.random() > 0.05
+    } for i in range(foods)]
+    food_weights = [1.0 / (rank + 1) for rank in range(foods)]
+
+    user_docs = [{'_id': ObjectId(), 'role': 'staff' if rng.random() < 0.1 else 'student'}
+                 for _ in range(users)]
+
+    orders = []
+    for user in user_docs:
+        favourites = rng.choices(food_docs, weights=food_weights, k=min(foods, 8))
+        for _ in range(max(0, int(rng.gauss(orders_per_user, orders_per_user / 3)))):
+            orders.append({
+                'user': user['_id'],
+                'items': [{'food': rng.choice(favourites)['_id'], 'quantity': rng.choices([1, 2, 3], [6, 3, 1])[0]}
+                          for _ in range(rng.choices([1, 2, 3], [6, 3, 1])[0])],
+                'orderedAt': weighted_time(rng, now, days, MEAL_HOURS),
+                'status': 'completed'
+            })
+    # Mongo _ids increase with insertion time
+    orders.sort(key=lambda order: order['orderedAt'])
+    for order in orders:
+        order['_id'] = ObjectId()
+
+    parking = []
+    for i in range(parking_slots):
+        slot = {'_id': ObjectId(), 'slot': f'{chr(ord("A") + i // 50)}-{i % 50 + 1:02d}', 'status': 'available'}
+        started_at = weighted_time(rng, now, 2, ARRIVAL_HOURS)
+        if rng.random() < 0.5:
+            slot.update(status=rng.choice(['reserved', 'occupied']), user=rng.choice(user_docs)['_id'],
+                        reservedAt=started_at)
+            if slot['status'] == 'occupied':
+                slot['occupiedAt'] = started_at + timedelta(minutes=rng.randint(1, 20))
+        elif rng.random() < 0.7:
+            # Last session on this slot has ended
+            slot.update(user=None, reservedAt=started_at,
+                        endedAt=min(now, started_at + timedelta(hours=rng.uniform(0.5, 8))))
+        parking.append(slot)
+
+    return {'users': user_docs, 'foods': food_docs, 'orders': orders, 'parking': parking}
+
+
+def load_fake_database(data, **kwargs):
+    """Load a generated dataset into an in-process MongoDB stand-in"""
+    return FakeDatabase.from_data(data, **kwargs)
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def strip(result):
+    """A recommendations response without the fields that differ between runs and engine modes"""
+    return {k: v for k, v in result.items() if k not in ('lastUpdated', 'engine_mode')}
+
+
+def close(left, right):
+    """Equal up to floating-point summation order"""
+    if isinstance(left, float) or isinstance(right, float):
+        return abs(left - right) <= 1e-9 * max(1.0, abs(left), abs(right))
+    if isinstance(left, dict) and isinstance(right, dict):
+        return left.keys() == right.keys() and all(close(left[k], right[k]) for k in left)
+    if isinstance(left, (list, tuple)) and isinstance(right, (list, tuple)):
+        return len(left) == len(right) and all(close(a, b) for a, b in zip(left, right))
+    return left == right
@@ -0,0 +1,83 @@
+"""
+Recommendation result cache
+Bounded LRU cache with a TTL. Each entry is stored with the data version it
+was computed from, so any change to a user's orders or parking (or to the
+catalog) makes their cached result stale without an explicit purge.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class RecommendationCache:
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        """Return the cached value for key if it is fresh and matches version"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            entry_version, expires_at, value = entry
+            if entry_version != version:
+                del self.entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, version, value):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (version, time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Drop one key, or every entry when key is None; returns entries removed"""
+        with self.lock:
+            if key is None:
+                removed = len(self.entries)
+                self.entries.clear()
+            else:
+                removed = 1 if self.entries.pop(key, None) is not None else 0
+            self.invalidations += removed
+            return removed
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
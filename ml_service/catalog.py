@@ -0,0 +1,97 @@
+"""
+Food catalog index
+Food documents keyed by stringified id with category and availability
+secondary indexes, so scoring paths resolve foods in O(1) instead of scanning
+the whole menu for every candidate.
+"""
+
+from collections import defaultdict
+
+
+def is_available(food):
+    """Foods are available unless explicitly marked otherwise"""
+    return food.get('available', True) is not False
+
+
+class FoodCatalog:
+    def __init__(self, foods=()):
+        self.by_id = {}
+        self.by_category = defaultdict(set)
+        self.available_ids = set()
+        self.version = 0
+        for food in foods:
+            self._add(food)
+
+    def _add(self, food):
+        food_id = str(food.get('_id'))
+        self.by_id[food_id] = food
+        self.by_category[food.get('category')].add(food_id)
+        if is_available(food):
+            self.available_ids.add(food_id)
+
+    def _remove(self, food_id):
+        food = self.by_id.pop(food_id, None)
+        if food is None:
+            return None
+        category_ids = self.by_category[food.get('category')]
+        category_ids.discard(food_id)
+        if not category_ids:
+            del self.by_category[food.get('category')]
+        self.available_ids.discard(food_id)
+        return food
+
+    def upsert(self, food):
+        """Add or replace a food; returns True when the catalog changed"""
+        food_id = str(food.get('_id'))
+        if self.by_id.get(food_id) == food:
+            return False
+        self._remove(food_id)
+        self._add(food)
+        self.version += 1
+        return True
+
+    def remove(self, food_id):
+        """Remove a food; returns True when the catalog changed"""
+        if self._remove(str(food_id)) is None:
+            return False
+        self.version += 1
+        return True
+
+    def replace_all(self, foods):
+        """Reconcile with a full read of the collection, touching only changed entries"""
+        foods = {str(f.get('_id')): f for f in foods}
+        changed = False
+        for food_id in [fid for fid in self.by_id if fid not in foods]:
+            changed |= self.remove(food_id)
+        for food in foods.values():
+            changed |= self.upsert(food)
+        return changed
+
+    def get(self, food_id, available_only=False):
+        """Look up a food document by id, optionally hiding unavailable items"""
+        food_id = str(food_id)
+        if available_only and food_id not in self.available_ids:
+            return None
+        return self.by_id.get(food_id)
+
+    def is_available(self, food_id):
+        return str(food_id) in self.available_ids
+
+    def in_category(self, category, available_only=True):
+        """Food documents in a category"""
+        ids = self.by_category.get(category, ())
+        if available_only:
+            ids = [food_id for food_id in ids if food_id in self.available_ids]
+        return [self.by_id[food_id] for food_id in ids]
+
+    def categories(self):
+        return list(self.by_category)
+
+    def __contains__(self, food_id):
+        return str(food_id) in self.by_id
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self):
+        return iter(self.by_id.values())
@@ -0,0 +1,203 @@
+"""
+Cold-start cohort defaults
+Users without any order or parking history get the defaults of their cohort:
+their role (from the users collection, or passed by the caller) and the part
+of the day. Each cohort's foods are ranked by time-decayed quantity ordered
+by that role in that daypart, topped up from the role's whole-day ranking,
+the daypart across all roles and overall popularity. All cohorts are built
+in one vectorized pass over the resident order table, at boot and again in
+the background whenever the model changes or the defaults age out, so a
+cold-start request is a dictionary lookup plus the time-dependent parking
+pick with no per-request data loading.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from background import BackgroundWorker
+from columnar import MISSING_TS, to_microseconds
+
+ANY_ROLE = 'all'
+ANY_DAYPART = 'all_day'
+# (name, first hour); night runs past midnight until breakfast
+DAYPARTS = (('breakfast', 5), ('lunch', 11), ('dinner', 16), ('night', 21))
+HOUR_US = 3_600_000_000
+
+
+def hour_dayparts():
+    """Daypart index for each hour of the day"""
+    index = np.full(24, len(DAYPARTS) - 1, dtype=np.int64)
+    for i, (_, start) in enumerate(DAYPARTS):
+        end = DAYPARTS[i + 1][1] if i + 1 < len(DAYPARTS) else 24
+        index[start:end] = i
+    return index
+
+
+HOUR_DAYPART = hour_dayparts()
+
+
+def daypart(at):
+    return DAYPARTS[HOUR_DAYPART[at.hour]][0]
+
+
+def cohort_reason(role, part):
+    who = 'Popular among students' if role == ANY_ROLE else f'Popular with {role} users'
+    return who if part == ANY_DAYPART else f'{who} at {part}'
+
+
+class CohortDefaults(BackgroundWorker):
+    name = 'cold-start'
+    failure = 'Cold-start defaults refresh failed'
+
+    def __init__(self, engine, top_n=3, max_age=300, interval=5.0):
+        super().__init__(engine, interval)
+        self.top_n = top_n
+        # Defaults are rebuilt when the model changes or once this many seconds old
+        self.max_age = max_age
+
+        # (role, daypart) -> food recommendations
+        self.defaults = {}
+        self.data_version = None
+        self.built_at = None
+        self.built_at_iso = None
+        self.lock = threading.Lock()
+        self.served = 0
+        self.builds = 0
+        self.last_build_seconds = 0.0
+
+    def cohort_weights(self, now):
+        """(roles, per role x daypart x food decayed quantities, food ids) from the resident order table"""
+        # Models built from aggregates keep no order table; their cohorts fall back to overall popularity
+        engine = self.engine
+        with engine.lock:
+            table = engine.order_table
+            columns = table.columns()
+            user_ids, food_ids = list(table.users.ids), list(table.foods.ids)
+            user_roles = dict(engine.user_roles)
+            rate = engine.popularity.rate
+        order_ts, order_user, item_order = columns['order_ts'], columns['order_user'], columns['item_order']
+        item_food, item_quantity = columns['item_food'], columns['item_quantity']
+
+        roles = sorted({role for role in user_roles.values() if role})
+        role_index = {role: i for i, role in enumerate(roles)}
+        # Users without a known role only count towards the all-roles cohorts (index len(roles))
+        user_role = np.array([role_index.get(user_roles.get(user_id), len(roles)) for user_id in user_ids]
+                             or [0], dtype=np.int64)
+        counted_user = np.array([user_id not in ('', 'None') for user_id in user_ids] or [False])
+
+        item_ts = order_ts[item_order]
+        item_user = order_user[item_order]
+        keep = (item_ts != MISSING_TS) & counted_user[item_user]
+        item_ts, item_user, foods = item_ts[keep], item_user[keep], item_food[keep]
+        weights = item_quantity[keep] * np.exp(-rate * (to_microseconds(now) - item_ts))
+        parts = HOUR_DAYPART[(item_ts // HOUR_US) % 24]
+
+        # Roles plus an all-roles row, dayparts plus an all-day column
+        n_roles, n_parts, n_foods = len(roles) + 1, len(DAYPARTS) + 1, len(food_ids)
+        cells = (user_role[item_user] * n_parts + parts) * n_foods + foods
+        counts = np.bincount(cells, weights=weights, minlength=n_roles * n_parts * n_foods)
+        counts = counts.reshape(n_roles, n_parts, n_foods)
+        counts[-1] = counts[:-1].sum(axis=0) + counts[-1]
+        counts[:, -1] = counts[:, :-1].sum(axis=1)
+        return roles + [ANY_ROLE], counts, food_ids
+
+    def build(self, now=None):
+        """Recompute every cohort's defaults; returns the number of cohorts"""
+        now = now or datetime.now()
+        start = time.perf_counter()
+        data_version = self.engine.data_version
+        roles, counts, food_ids = self.cohort_weights(now)
+        parts = [name for name, _ in DAYPARTS] + [ANY_DAYPART]
+
+        # Best candidates per cohort; unavailable foods are skipped when the defaults are assembled
+        candidates = {}
+        for r, role in enumerate(roles):
+            for p, part in enumerate(parts):
+                order = np.argsort(-counts[r, p], kind='stable')[:4 * self.top_n + 16]
+                candidates[role, part] = [(food_ids[f], float(counts[r, p, f]))
+                                          for f in order if counts[r, p, f] > 0]
+
+        defaults = {}
+        with self.engine.lock:
+            catalog = self.engine.catalog
+            overall = [(food_id, score, 'Popular among students')
+                       for food_id, score in self.engine.popularity.top(4 * self.top_n + 16, now=now)]
+            for role in roles:
+                for part in parts:
+                    # Narrowest cohort first, then broader ones, then overall popularity
+                    sources = dict.fromkeys([(role, part), (role, ANY_DAYPART), (ANY_ROLE, part),
+                                             (ANY_ROLE, ANY_DAYPART)])
+                    ranked = [(food_id, score, cohort_reason(*source))
+                              for source in sources for food_id, score in candidates[source]] + overall
+                    foods, seen = [], set()
+                    for food_id, score, reason in ranked:
+                        food_doc = catalog.get(food_id, available_only=True)
+                        if food_doc and food_id not in seen:
+                            seen.add(food_id)
+                            foods.append({
+                                'id': food_id,
+                                'name': food_doc.get('name', 'Unknown'),
+                                'price': food_doc.get('price', 0),
+                                'score': score,
+                                'reason': reason
+                            })
+                            if len(foods) >= self.top_n:
+                                break
+                    defaults[role, part] = foods
+
+        with self.lock:
+            self.defaults = defaults
+            self.data_version = data_version
+            self.built_at = time.monotonic()
+            self.built_at_iso = now.isoformat()
+            self.builds += 1
+            self.last_build_seconds = time.perf_counter() - start
+        return len(defaults)
+
+    def warm_up(self):
+        """Build every cohort before serving, then keep them fresh in the background"""
+        if self.engine.loaded:
+            cohorts = self.build()
+            print(f"🧊 Cold-start defaults ready for {cohorts} cohorts")
+        return self.start()
+
+    def get(self, user_id, mode, at=None, role=None):
+        """Cohort defaults for a user without history, or None until the first build"""
+        user_id = str(user_id)
+        role = role or self.engine.user_roles.get(user_id) or ANY_ROLE
+        part = daypart(at or datetime.now())
+        with self.lock:
+            foods = self.defaults.get((role, part)) or self.defaults.get((ANY_ROLE, part))
+            if foods is None:
+                return None
+            self.served += 1
+            built_at = self.built_at_iso
+
+        return {
+            'foods': [dict(food) for food in foods],
+            'parking': self.engine.recommend_parking(user_id, at=at),
+            'lastUpdated': built_at,
+            'algorithm': 'python_rule_based',
+            'engine_mode': mode,
+            'trends': {'food_trends': {}, 'parking_trends': {}, 'has_recent_activity': False},
+            'cohort': {'role': role if (role, part) in self.defaults else ANY_ROLE, 'daypart': part}
+        }
+
+    def work(self):
+        if self.engine.loaded and self.stale(self.data_version, self.built_at):
+            self.build()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'running': self.is_alive(),
+                'cohorts': len(self.defaults),
+                'served': self.served,
+                'builds': self.builds,
+                'built_at': self.built_at_iso,
+                'max_age_seconds': self.max_age,
+                'last_build_seconds': round(self.last_build_seconds, 4)
+            }
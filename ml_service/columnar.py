@@ -0,0 +1,419 @@
+"""
+Columnar order history
+Holds every order as numpy columns (user index, food index, quantity and an
+int64 timestamp) so time-decay weights, the 7/30-day trend windows and trend
+ratios are computed with array operations instead of per-order Python loops.
+Produces the same results as the dict-based scoring path, which reads its
+per-user order dicts from this table too, so raw order documents are not kept.
+The same ranking is applied to per-food totals aggregated by MongoDB in the
+pushdown mode.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+DAY_US = 86_400_000_000
+# Orders without a timestamp are treated as placed "now" at scoring time
+MISSING_TS = np.iinfo(np.int64).min
+
+
+def to_microseconds(value):
+    """Convert a naive datetime to int64 microseconds since the epoch"""
+    return (value - EPOCH) // MICROSECOND
+
+
+def parse_timestamp(value):
+    """Parse an orderedAt value the way the dict path does, as int64 microseconds"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return MISSING_TS
+    if not isinstance(value, datetime):
+        return MISSING_TS
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return to_microseconds(value)
+
+
+class Interner:
+    """Maps string ids to dense integer indexes"""
+
+    def __init__(self):
+        self.index = {}
+        self.ids = []
+
+    def intern(self, key):
+        idx = self.index.get(key)
+        if idx is None:
+            idx = self.index[key] = len(self.ids)
+            self.ids.append(key)
+        return idx
+
+    def get(self, key):
+        return self.index.get(key)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class GrowableColumn:
+    """Append-only numpy column: a base array, which can stay backed by a snapshot, plus rows appended since"""
+
+    def __init__(self, dtype, capacity=1024, base=None):
+        self.base = np.empty(0, dtype=dtype) if base is None else base
+        # Appends never write to the base, so a mapped snapshot is not copied into private memory
+        self.tail = np.empty(capacity, dtype=dtype)
+        self.tail_size = 0
+
+    def append(self, value):
+        if self.tail_size == len(self.tail):
+            self.tail = np.resize(self.tail, max(1024, 2 * len(self.tail)))
+        self.tail[self.tail_size] = value
+        self.tail_size += 1
+
+    @property
+    def values(self):
+        """The whole column; a copy only when both a base and appended rows exist"""
+        if not self.tail_size:
+            return self.base
+        if not len(self.base):
+            return self.tail[:self.tail_size]
+        return np.concatenate([self.base, self.tail[:self.tail_size]])
+
+    def take(self, rows):
+        """Values at an int64 array of row indexes"""
+        n_base = len(self.base)
+        if not self.tail_size:
+            return self.base[rows]
+        if not n_base:
+            return self.tail[rows]
+        values = np.empty(len(rows), dtype=self.tail.dtype)
+        in_base = rows < n_base
+        values[in_base] = self.base[rows[in_base]]
+        values[~in_base] = self.tail[rows[~in_base] - n_base]
+        return values
+
+    def __getitem__(self, row):
+        n_base = len(self.base)
+        return self.base[row] if row < n_base else self.tail[row - n_base]
+
+    def __len__(self):
+        return len(self.base) + self.tail_size
+
+
+COLUMNS = ('order_ts', 'order_user', 'item_order', 'item_food', 'item_quantity')
+
+
+class IdSet:
+    """Set of string ids: a sorted byte-string array, which can stay backed by a snapshot, plus ids added since"""
+
+    def __init__(self, sorted_ids=None):
+        self.sorted = np.empty(0, dtype='S1') if sorted_ids is None else sorted_ids
+        self.added = set()
+
+    def clear(self):
+        self.__init__()
+
+    def _in_sorted(self, key):
+        if not len(self.sorted):
+            return False
+        encoded = key.encode()
+        i = int(np.searchsorted(self.sorted, encoded))
+        return i < len(self.sorted) and self.sorted[i] == encoded
+
+    def __contains__(self, key):
+        return key in self.added or self._in_sorted(key)
+
+    def add(self, key):
+        if not self._in_sorted(key):
+            self.added.add(key)
+
+    def __len__(self):
+        return len(self.sorted) + len(self.added)
+
+    def to_array(self):
+        """Every id as one sorted byte-string array"""
+        if not self.added:
+            return self.sorted
+        added = np.array([key.encode() for key in self.added], dtype=bytes)
+        return np.sort(np.concatenate([self.sorted, added])) if len(self.sorted) else np.sort(added)
+
+    @classmethod
+    def from_array(cls, ids):
+        # Snapshots written before the ids were sorted are sorted once on load
+        if len(ids) > 1 and not (ids[:-1] <= ids[1:]).all():
+            ids = np.sort(ids)
+        return cls(ids)
+
+
+class RowGroups:
+    """Row indexes per owner in ascending order: CSR arrays, which can stay mapped, plus rows appended since"""
+
+    def __init__(self, indptr=None, rows=None):
+        self.indptr = np.zeros(1, dtype=np.int64) if indptr is None else indptr
+        self.rows = np.empty(0, dtype=np.int64) if rows is None else rows
+        # owner -> rows appended after the CSR part was built; always past every CSR row
+        self.appended = {}
+
+    @classmethod
+    def group(cls, row_owner, n_owners):
+        """Group rows by owner in one stable sort"""
+        indptr = np.zeros(n_owners + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row_owner, minlength=n_owners), out=indptr[1:])
+        return cls(indptr, np.argsort(row_owner, kind='stable').astype(np.int64))
+
+    def add(self, owner, row):
+        self.appended.setdefault(owner, []).append(row)
+
+    def get(self, owner):
+        """One owner's rows as an int64 array"""
+        rows = self.rows[self.indptr[owner]:self.indptr[owner + 1]] if owner + 1 < len(self.indptr) else self.rows[:0]
+        appended = self.appended.get(owner)
+        return np.concatenate([rows, np.array(appended, dtype=np.int64)]) if appended else rows
+
+
+def rank_personal(food_ids, weighted, total_orders, trends, catalog, top_n=3):
+    """Trend-adjusted personal recommendations from per-food totals listed in first-seen order"""
+    food_scores = []
+    for food_id, score, count in zip(food_ids, weighted, total_orders):
+        food_doc = catalog.get(food_id, available_only=True)
+        if not food_doc:
+            continue
+        food_data = {
+            'id': food_id,
+            'name': food_doc.get('name', 'Unknown'),
+            'price': food_doc.get('price', 0),
+            'weighted_score': score,
+            'total_orders': int(count),
+            'reason': 'Based on your order history'
+        }
+        food_trend = trends['food_trends'].get(food_id, 0)
+        if food_trend > 0.5:
+            food_data['weighted_score'] *= (1 + food_trend * 0.3)
+            food_data['reason'] = 'Trending up in your recent orders'
+        elif food_trend < -0.5:
+            food_data['weighted_score'] *= 0.7
+            food_data['reason'] = 'Less frequent in recent orders'
+        food_scores.append(food_data)
+
+    sorted_foods = sorted(food_scores, key=lambda x: x['weighted_score'], reverse=True)
+    return sorted_foods[:top_n]
+
+
+def score_aggregated(rows, catalog, top_n=3):
+    """score_user's result from per-food totals already aggregated by MongoDB (see user_foods_pipeline)"""
+    if not rows:
+        return [], {'food_trends': {}, 'parking_trends': {}, 'has_recent_activity': False}
+    has_recent = any(row['has_recent'] for row in rows)
+    # Orders with no items form a food-less group that only marks recent activity
+    rows = [row for row in rows if row.get('_id') is not None]
+
+    food_trends = {}
+    for row in rows:
+        if not row['in_window']:
+            continue
+        recent_count, older_count = row['recent'], row['older']
+        if older_count > 0:
+            food_trends[str(row['_id'])] = (recent_count - older_count) / older_count
+        else:
+            food_trends[str(row['_id'])] = 1.0 if recent_count > 0 else 0.0
+    trends = {
+        'food_trends': food_trends,
+        'has_recent_activity': bool(has_recent),
+        'trend_period': '7_days'
+    }
+    return rank_personal([str(row['_id']) for row in rows], [row['weighted'] for row in rows],
+                         [row['total_orders'] for row in rows], trends, catalog, top_n), trends
+
+
+class OrderTable:
+    def __init__(self):
+        self.users = Interner()
+        self.foods = Interner()
+        # Order-level columns
+        self.order_ts = GrowableColumn(np.int64)
+        self.order_user = GrowableColumn(np.int32)
+        # Item-level columns
+        self.item_order = GrowableColumn(np.int64)
+        self.item_food = GrowableColumn(np.int32)
+        self.item_quantity = GrowableColumn(np.float64)
+        # Row indexes per user, in arrival order
+        self.user_order_rows = RowGroups()
+        self.user_item_rows = RowGroups()
+
+    def clear(self):
+        self.__init__()
+
+    def append(self, order):
+        """Append one order and its items; returns the parsed order timestamp"""
+        user_idx = self.users.intern(str(order.get('user')))
+        order_row = len(self.order_ts)
+        timestamp = parse_timestamp(order.get('orderedAt'))
+        self.order_ts.append(timestamp)
+        self.order_user.append(user_idx)
+        self.user_order_rows.add(user_idx, order_row)
+
+        for item in order.get('items', []):
+            self.user_item_rows.add(user_idx, len(self.item_food))
+            self.item_order.append(order_row)
+            self.item_food.append(self.foods.intern(str(item.get('food', ''))))
+            self.item_quantity.append(item.get('quantity', 1))
+        return timestamp
+
+    def columns(self):
+        """The order and item columns by name, as of now"""
+        # Appends never change what these arrays hold, so callers may read them after releasing their lock
+        return {name: getattr(self, name).values for name in COLUMNS}
+
+    def to_snapshot(self, groups=True):
+        """Metadata and arrays for a model snapshot; groups=False leaves out the per-user row groups"""
+        meta = {'users': self.users.ids, 'foods': self.foods.ids}
+        arrays = self.columns()
+        if groups:
+            # Per-user row groups in CSR form, so loading workers map them instead of regrouping
+            for name, grouped in self._grouped().items():
+                arrays[f'{name}.indptr'] = grouped.indptr
+                arrays[f'{name}.rows'] = grouped.rows
+        return meta, arrays
+
+    @classmethod
+    def from_snapshot(cls, meta, arrays):
+        """Rebuild from to_snapshot() output; columns stay backed by the snapshot until appended to"""
+        table = cls()
+        for key in meta['users']:
+            table.users.intern(key)
+        for key in meta['foods']:
+            table.foods.intern(key)
+        table._set_columns(arrays)
+        return table
+
+    @classmethod
+    def concat(cls, parts):
+        """One table from to_snapshot() outputs of consecutive slices of the order stream"""
+        table = cls()
+        columns = {name: [] for name in COLUMNS}
+        order_offset = 0
+        for meta, arrays in parts:
+            # Remap each part's local user and food indexes onto the merged interners
+            users = np.array([table.users.intern(key) for key in meta['users']] or [0], dtype=np.int32)
+            foods = np.array([table.foods.intern(key) for key in meta['foods']] or [0], dtype=np.int32)
+            columns['order_ts'].append(arrays['order_ts'])
+            columns['order_user'].append(users[arrays['order_user']])
+            columns['item_order'].append(arrays['item_order'] + order_offset)
+            columns['item_food'].append(foods[arrays['item_food']])
+            columns['item_quantity'].append(arrays['item_quantity'])
+            order_offset += len(arrays['order_ts'])
+
+        table._set_columns({name: np.concatenate([getattr(table, name).values] + chunks)
+                            for name, chunks in columns.items()})
+        return table
+
+    def _set_columns(self, arrays):
+        for name in COLUMNS:
+            setattr(self, name, GrowableColumn(arrays[name].dtype, base=arrays[name]))
+
+        if 'user_order_rows.indptr' in arrays:
+            self.user_order_rows = RowGroups(arrays['user_order_rows.indptr'], arrays['user_order_rows.rows'])
+            self.user_item_rows = RowGroups(arrays['user_item_rows.indptr'], arrays['user_item_rows.rows'])
+        else:
+            groups = self._grouped()
+            self.user_order_rows = groups['user_order_rows']
+            self.user_item_rows = groups['user_item_rows']
+
+    def _grouped(self):
+        """Per-user order and item rows regrouped from the columns"""
+        n_users = len(self.users)
+        order_user = self.order_user.values
+        return {'user_order_rows': RowGroups.group(order_user, n_users),
+                'user_item_rows': RowGroups.group(order_user[self.item_order.values], n_users)}
+
+    def order_dicts(self, user_id):
+        """One user's orders as {'items', 'orderedAt'} dicts for the dict scoring path"""
+        user_idx = self.users.get(str(user_id))
+        if user_idx is None:
+            return []
+
+        items = {}
+        for row in self.user_item_rows.get(user_idx).tolist():
+            quantity = float(self.item_quantity[row])
+            items.setdefault(int(self.item_order[row]), []).append({
+                'food': self.foods.ids[self.item_food[row]],
+                'quantity': int(quantity) if quantity.is_integer() else quantity
+            })
+
+        orders = []
+        for row in self.user_order_rows.get(user_idx).tolist():
+            order = {'items': items.get(row, [])}
+            timestamp = int(self.order_ts[row])
+            # Orders without a parseable timestamp count as placed "now", like the dict path
+            if timestamp != MISSING_TS:
+                order['orderedAt'] = EPOCH + timestamp * MICROSECOND
+            orders.append(order)
+        return orders
+
+    def has_user(self, user_id):
+        return self.users.get(str(user_id)) is not None
+
+    def user_history(self, user_id, now_us):
+        """Order timestamps plus item rows (order position, food, quantity) for one user"""
+        user_idx = self.users.get(str(user_id))
+        if user_idx is None:
+            return None
+
+        order_rows = self.user_order_rows.get(user_idx)
+        item_rows = self.user_item_rows.get(user_idx)
+        order_ts = self.order_ts.take(order_rows)
+        order_ts = np.where(order_ts == MISSING_TS, now_us, order_ts)
+
+        # Map global order rows to positions within this user's history
+        item_order = np.searchsorted(order_rows, self.item_order.take(item_rows))
+        return (order_ts, item_order, self.item_food.take(item_rows), self.item_quantity.take(item_rows))
+
+    def score_user(self, user_id, catalog, now, top_n=3):
+        """Vectorized equivalent of calculate_time_weights + analyze_trends + get_personal_recommendations"""
+        now_us = to_microseconds(now)
+        history = self.user_history(user_id, now_us)
+        if history is None or len(history[0]) == 0:
+            return [], {'food_trends': {}, 'parking_trends': {}, 'has_recent_activity': False}
+        order_ts, item_order, item_food, item_quantity = history
+
+        # Exponential time decay per order, using whole elapsed days like the dict path
+        days_diff = (now_us - order_ts) // DAY_US
+        time_weight = np.exp(-days_diff / 30)
+
+        # 7-day and 7-30-day windows
+        recent = order_ts > now_us - 7 * DAY_US
+        older = ~recent & (order_ts > now_us - 30 * DAY_US)
+
+        # Compact the user's foods to 0..k-1 in first-seen order
+        food_keys, first_seen, local_food = np.unique(item_food, return_index=True, return_inverse=True)
+        n_foods = len(food_keys)
+
+        item_recent = recent[item_order]
+        item_older = older[item_order]
+        recent_counts = np.bincount(local_food, weights=item_quantity * item_recent, minlength=n_foods)
+        older_counts = np.bincount(local_food, weights=item_quantity * item_older, minlength=n_foods)
+        in_window = (np.bincount(local_food, weights=item_recent | item_older, minlength=n_foods) > 0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = (recent_counts - older_counts) / older_counts
+        trend = np.where(older_counts > 0, ratio, np.where(recent_counts > 0, 1.0, 0.0))
+
+        food_ids = [self.foods.ids[f] for f in food_keys]
+        trends = {
+            'food_trends': {food_ids[i]: float(trend[i]) for i in np.flatnonzero(in_window)},
+            'has_recent_activity': bool(recent.any()),
+            'trend_period': '7_days'
+        }
+
+        weighted = np.bincount(local_food, weights=item_quantity * time_weight[item_order], minlength=n_foods)
+        total_orders = np.bincount(local_food, minlength=n_foods)
+
+        # Build candidates in first-seen order so ties sort exactly like the dict path
+        order = np.argsort(first_seen, kind='stable')
+        return rank_personal([food_ids[i] for i in order], weighted[order], total_orders[order],
+                             trends, catalog, top_n), trends
@@ -0,0 +1,238 @@
+"""
+Item-item co-occurrence model
+Counts, for every pair of foods, how many users have ordered both. Counts are
+frozen into CSR arrays (indptr/indices/data) for scoring, so a user's
+collaborative recommendations are a sparse vector-matrix product over the
+foods they have ordered rather than a scan of the whole catalog. Incremental
+updates go to a small overlay of changed rows that is merged on the next
+freeze, so the CSR arrays themselves are never written in place.
+"""
+
+import numpy as np
+
+from columnar import Interner
+
+
+def _pair_keys(indptr, indices, n_foods):
+    """row * n_foods + column for every ordered pair of distinct entries within each CSR row"""
+    lengths = np.diff(indptr)
+    entry_lengths = np.repeat(lengths, lengths)
+    entry_starts = np.repeat(indptr[:-1], lengths)
+    offsets = np.arange(entry_lengths.sum()) - np.repeat(np.cumsum(entry_lengths) - entry_lengths, entry_lengths)
+    left = np.repeat(indices, entry_lengths).astype(np.int64)
+    right = indices[np.repeat(entry_starts, entry_lengths) + offsets]
+    keep = left != right
+    return left[keep] * n_foods + right[keep]
+
+
+class CooccurrenceModel:
+    def __init__(self):
+        self.foods = Interner()
+        # Number of users who ordered each food (cosine normalisation)
+        self.item_users = np.zeros(0, dtype=np.float64)
+
+        # Frozen pair counts in CSR form: row food -> other foods, users who ordered both
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int32)
+        self.data = np.empty(0, dtype=np.float64)
+        # Rows changed since the last freeze: row food -> {other food: users who ordered both}
+        self.pairs = {}
+
+    def clear(self):
+        self.__init__()
+
+    def _intern(self, food_id):
+        idx = self.foods.intern(food_id)
+        if idx >= len(self.item_users):
+            self.item_users = np.concatenate([self.item_users, np.zeros(max(64, len(self.item_users)))])
+        return idx
+
+    def _frozen_row(self, row):
+        if row + 1 >= len(self.indptr):
+            return self.indices[:0], self.data[:0]
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def _mutable_row(self, row):
+        """Overlay copy of a row, seeded from the frozen arrays on first change"""
+        others = self.pairs.get(row)
+        if others is None:
+            indices, counts = self._frozen_row(row)
+            others = self.pairs[row] = dict(zip(indices.tolist(), counts.tolist()))
+        return others
+
+    def add_user_food(self, user_foods, food_id):
+        """Record that a user who already ordered user_foods ordered food_id for the first time"""
+        new_idx = self._intern(food_id)
+        self.item_users[new_idx] += 1
+        row = self._mutable_row(new_idx)
+        for other_id in user_foods:
+            other_idx = self._intern(other_id)
+            if other_idx == new_idx:
+                continue
+            row[other_idx] = row.get(other_idx, 0) + 1
+            other_row = self._mutable_row(other_idx)
+            other_row[new_idx] = other_row.get(new_idx, 0) + 1
+
+    def build(self, user_preferences):
+        """Rebuild from scratch from user -> {food: quantity} preferences"""
+        self.clear()
+        for foods in user_preferences.values():
+            seen = []
+            for food_id in foods:
+                self.add_user_food(seen, food_id)
+                seen.append(food_id)
+        self.freeze()
+
+    @classmethod
+    def from_interactions(cls, matrix, block_pairs=1 << 22):
+        """Build from a user x food InteractionMatrix with vectorized pair counting"""
+        matrix.compact()
+        model = cls()
+        for food_id in matrix.items.ids:
+            model.foods.intern(food_id)
+        n_foods = len(model.foods)
+        model.item_users = np.bincount(matrix.indices, minlength=n_foods).astype(np.float64)
+        if not n_foods:
+            return model
+
+        # Every ordered pair of distinct foods within each user's row, a block of users at a time
+        lengths = np.diff(matrix.indptr)
+        pair_totals = np.cumsum(lengths ** 2)
+        block_ends = np.searchsorted(pair_totals, np.arange(block_pairs, pair_totals[-1], block_pairs), side='right')
+        keys, counts = [], []
+        start = 0
+        for end in block_ends.tolist() + [len(lengths)]:
+            if end <= start:
+                continue
+            lo, hi = matrix.indptr[start], matrix.indptr[end]
+            block_keys, block_counts = np.unique(
+                _pair_keys(matrix.indptr[start:end + 1] - lo, matrix.indices[lo:hi], n_foods), return_counts=True)
+            keys.append(block_keys)
+            counts.append(block_counts)
+            start = end
+
+        keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        model.indptr = np.zeros(n_foods + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n_foods, minlength=n_foods), out=model.indptr[1:])
+        model.indices = (keys % n_foods).astype(np.int32)
+        model.data = np.bincount(inverse, weights=np.concatenate(counts), minlength=len(keys))
+        return model
+
+    def freeze(self):
+        """Merge changed rows into fresh CSR arrays"""
+        n_rows = len(self.foods)
+        frozen_rows = len(self.indptr) - 1
+        lengths = np.zeros(n_rows, dtype=np.int64)
+        lengths[:frozen_rows] = np.diff(self.indptr)
+        for row, others in self.pairs.items():
+            lengths[row] = len(others)
+
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        data = np.empty(indptr[-1], dtype=np.float64)
+        for row in range(n_rows):
+            start, end = indptr[row], indptr[row + 1]
+            others = self.pairs.get(row)
+            if others is not None:
+                indices[start:end] = np.fromiter(others.keys(), dtype=np.int32, count=len(others))
+                data[start:end] = np.fromiter(others.values(), dtype=np.float64, count=len(others))
+            elif row < frozen_rows:
+                indices[start:end], data[start:end] = self._frozen_row(row)
+
+        self.indptr, self.indices, self.data = indptr, indices, data
+        self.pairs = {}
+
+    def _row(self, row):
+        others = self.pairs.get(row)
+        if others is not None:
+            return (np.fromiter(others.keys(), dtype=np.int32, count=len(others)),
+                    np.fromiter(others.values(), dtype=np.float64, count=len(others)))
+        return self._frozen_row(row)
+
+    def score_vector(self, user_foods):
+        """Sparse product of a {food_id: weight} vector with the cosine similarity matrix"""
+        # Refreeze once a meaningful share of rows has changed since the last freeze
+        if len(self.pairs) > max(16, len(self.foods) // 8):
+            self.freeze()
+
+        rows, weights = [], []
+        for food_id, weight in user_foods.items():
+            idx = self.foods.get(food_id)
+            if idx is not None:
+                rows.append(idx)
+                weights.append(weight)
+        if not rows:
+            return None
+
+        item_users = self.item_users
+        columns, values = [], []
+        for row, weight in zip(rows, weights):
+            indices, counts = self._row(row)
+            columns.append(indices)
+            values.append(weight * counts / np.sqrt(item_users[row] * item_users[indices]))
+
+        columns = np.concatenate(columns)
+        if not len(columns):
+            return None
+        scores = np.bincount(columns, weights=np.concatenate(values), minlength=len(self.foods))
+        scores[rows] = 0.0
+        return scores
+
+    def score(self, user_foods):
+        """Non-zero similarity scores as a {food_id: score} dict"""
+        scores = self.score_vector(user_foods)
+        if scores is None:
+            return {}
+        return {self.foods.ids[i]: float(scores[i]) for i in np.flatnonzero(scores > 0)}
+
+    def recommend(self, user_foods, top_n=3, accept=None):
+        """Top-N foods most similar to a user's history, filtered by accept(food_id)"""
+        scores = self.score_vector(user_foods)
+        if scores is None:
+            return []
+
+        candidates = np.flatnonzero(scores > 0)
+        results = []
+        for idx in candidates[np.argsort(-scores[candidates], kind='stable')]:
+            food_id = self.foods.ids[idx]
+            if accept is None or accept(food_id):
+                results.append((food_id, float(scores[idx])))
+                if len(results) >= top_n:
+                    break
+        return results
+
+    def to_snapshot(self):
+        """Metadata and arrays for a model snapshot (call after freeze)"""
+        meta = {'foods': self.foods.ids}
+        arrays = {
+            'item_users': self.item_users[:len(self.foods)],
+            'indptr': self.indptr,
+            'indices': self.indices,
+            'data': self.data
+        }
+        return meta, arrays
+
+    @classmethod
+    def from_snapshot(cls, meta, arrays):
+        """Rebuild from to_snapshot() output; the CSR arrays stay backed by the snapshot"""
+        model = cls()
+        for key in meta['foods']:
+            model.foods.intern(key)
+        # Per-food user counts are updated in place, so they are copied
+        model.item_users = np.array(arrays['item_users'], dtype=np.float64)
+        model.indptr = arrays['indptr']
+        model.indices = arrays['indices']
+        model.data = arrays['data']
+        return model
+
+    def stats(self):
+        pairs = int(self.indptr[-1])
+        for row, others in self.pairs.items():
+            pairs += len(others) - len(self._frozen_row(row)[0])
+        return {
+            'foods': len(self.foods),
+            'pairs': pairs,
+            'dirty_rows': len(self.pairs)
+        }
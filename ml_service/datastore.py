@@ -0,0 +1,404 @@
+"""
+MongoDB data-access layer
+Fetches only the fields the recommendation engine reads, optionally limits
+orders to a recent horizon, loads per-user history with an indexed
+{user: id} query, and counts documents/bytes fetched so the transfer cost
+of each request can be observed (from the size of the raw BSON batches, so
+nothing is encoded again to measure it). Bulk order loads can stream from the cursor
+in batches so a full retrain never holds the whole collection as dicts. In
+pushdown mode popularity, per-user quantities and the trend windows are
+computed by aggregation pipelines and only the grouped totals are transferred.
+"""
+
+import asyncio
+import math
+import threading
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+
+import bson
+from bson import ObjectId
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+
+ORDER_FIELDS = {'user': 1, 'items.food': 1, 'items.quantity': 1, 'orderedAt': 1, 'status': 1}
+FOOD_FIELDS = {'name': 1, 'price': 1, 'category': 1, 'available': 1, 'dailyCapacity': 1}
+USER_FIELDS = {'role': 1}
+PARKING_FIELDS = {'slot': 1, 'user': 1, 'status': 1, 'reservedAt': 1, 'occupiedAt': 1, 'endedAt': 1}
+DAY_MS = 86_400_000
+HOUR_MS = 3_600_000
+EPOCH = datetime(1970, 1, 1)
+
+
+def user_key(user_id):
+    """Match the stored user reference, which is an ObjectId for real data"""
+    user_id = str(user_id)
+    return ObjectId(user_id) if ObjectId.is_valid(user_id) else user_id
+
+
+class FetchStats:
+    """Documents, bytes and queries fetched, in total and for the current request"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = defaultdict(Counter)
+        # Per request: one context per thread (Flask) or per asyncio task (ASGI)
+        self.request_counts = ContextVar('fetch_stats', default=None)
+
+    def begin_request(self):
+        self.request_counts.set(Counter())
+
+    def record(self, collection, documents, size):
+        with self.lock:
+            totals = self.totals[collection]
+            totals['documents'] += documents
+            totals['bytes'] += size
+            totals['queries'] += 1
+        current = self.request_counts.get()
+        if current is not None:
+            current['documents'] += documents
+            current['bytes'] += size
+            current['queries'] += 1
+
+    def current(self):
+        current = self.request_counts.get() or Counter()
+        return {key: current[key] for key in ('documents', 'bytes', 'queries')}
+
+    def snapshot(self):
+        with self.lock:
+            return {collection: dict(counts) for collection, counts in self.totals.items()}
+
+
+def preferences_pipeline(query):
+    """Quantity per (user, food) over the matched orders, in first-seen order like apply_order"""
+    return [
+        # apply_order skips orders without a user
+        {'$match': dict(query, user={'$exists': True, '$ne': ''})},
+        # Sorting on the indexed _id before unwinding keeps items in stream order for $first
+        {'$sort': {'_id': 1}},
+        {'$unwind': {'path': '$items', 'includeArrayIndex': 'position'}},
+        {'$group': {
+            '_id': {'user': '$user', 'food': '$items.food'},
+            'quantity': {'$sum': {'$ifNull': ['$items.quantity', 1]}},
+            'first_order': {'$first': '$_id'},
+            'first_position': {'$first': '$position'}
+        }},
+        {'$sort': {'first_order': 1, 'first_position': 1}},
+        {'$project': {'_id': 0, 'user': '$_id.user', 'food': '$_id.food', 'quantity': 1}}
+    ]
+
+
+def order_summary_pipeline(query):
+    """Number of matched orders and the highest _id among them"""
+    return [
+        {'$match': query},
+        {'$group': {'_id': None, 'orders': {'$sum': 1}, 'last_order_id': {'$max': '$_id'}}}
+    ]
+
+
+def popularity_pipeline(query, half_life_days, origin, now):
+    """Per-food quantity decayed with the given half-life and scaled to origin, in first-seen order"""
+    rate = math.log(2) / (half_life_days * DAY_MS)
+    return [
+        {'$match': dict(query, user={'$exists': True, '$ne': ''})},
+        {'$sort': {'_id': 1}},
+        {'$unwind': {'path': '$items', 'includeArrayIndex': 'position'}},
+        {'$group': {
+            '_id': '$items.food',
+            # quantity * exp(rate * (orderedAt - origin)), as DecayedPopularity.add stores it
+            'decayed': {'$sum': {'$multiply': [
+                {'$ifNull': ['$items.quantity', 1]},
+                {'$exp': {'$multiply': [rate, {'$subtract': [{'$ifNull': ['$orderedAt', now]}, origin]}]}}
+            ]}},
+            'first_order': {'$first': '$_id'},
+            'first_position': {'$first': '$position'}
+        }},
+        {'$sort': {'first_order': 1, 'first_position': 1}},
+        {'$project': {'decayed': 1}}
+    ]
+
+
+def user_foods_pipeline(user, now):
+    """Per-food decayed quantity, item count and 7/30-day window totals for one user, for score_aggregated"""
+    recent_start = now - timedelta(days=7)
+    window_start = now - timedelta(days=30)
+    return [
+        {'$match': {'user': user}},
+        {'$sort': {'_id': 1}},
+        # Orders without items are kept as a food-less row so they still count as recent activity
+        {'$unwind': {'path': '$items', 'includeArrayIndex': 'position', 'preserveNullAndEmptyArrays': True}},
+        {'$project': {
+            'food': '$items.food',
+            'quantity': {'$ifNull': ['$items.quantity', 1]},
+            'position': 1,
+            # Orders without a timestamp count as placed "now", like the in-process paths
+            'ordered_at': {'$ifNull': ['$orderedAt', now]}
+        }},
+        {'$addFields': {
+            'recent': {'$gt': ['$ordered_at', recent_start]},
+            'older': {'$and': [{'$lte': ['$ordered_at', recent_start]}, {'$gt': ['$ordered_at', window_start]}]},
+            # Whole elapsed days, as in calculate_time_weights
+            'days': {'$floor': {'$divide': [{'$subtract': [now, '$ordered_at']}, DAY_MS]}}
+        }},
+        {'$group': {
+            '_id': '$food',
+            'weighted': {'$sum': {'$multiply': ['$quantity', {'$exp': {'$divide': [{'$multiply': [-1, '$days']}, 30]}}]}},
+            'total_orders': {'$sum': 1},
+            'recent': {'$sum': {'$cond': ['$recent', '$quantity', 0]}},
+            'older': {'$sum': {'$cond': ['$older', '$quantity', 0]}},
+            'in_window': {'$max': {'$or': ['$recent', '$older']}},
+            'has_recent': {'$max': '$recent'},
+            'first_order': {'$first': '$_id'},
+            'first_position': {'$first': '$position'}
+        }},
+        {'$sort': {'first_order': 1, 'first_position': 1}}
+    ]
+
+
+def demand_pipeline(start, end):
+    """Ordered quantity per (food, hour since the epoch) over orders placed in [start, end), for forecasts"""
+    return [
+        {'$match': {'orderedAt': {'$gte': start, '$lt': end}}},
+        {'$unwind': {'path': '$items'}},
+        {'$group': {
+            '_id': {'food': '$items.food',
+                    'hour': {'$floor': {'$divide': [{'$subtract': ['$orderedAt', EPOCH]}, HOUR_MS]}}},
+            'quantity': {'$sum': {'$ifNull': ['$items.quantity', 1]}}
+        }},
+        {'$project': {'_id': 0, 'food': '$_id.food', 'hour': '$_id.hour', 'quantity': 1}}
+    ]
+
+
+class OrderAggregates:
+    """Server-side (user, food) quantity totals, standing in for the order list in a build"""
+
+    def __init__(self, rows, count=0, last_order_id=None, popularity=(), decay=None):
+        self.rows = rows
+        self.count = count
+        self.last_order_id = last_order_id
+        # Per-food decayed totals and the (half-life, origin) they were computed with
+        self.popularity = popularity
+        self.decay = decay
+
+    @classmethod
+    def from_results(cls, rows, summary, popularity=(), decay=None):
+        summary = summary[0] if summary else {}
+        return cls(rows, summary.get('orders', 0), summary.get('last_order_id'), popularity, decay)
+
+    def __len__(self):
+        """Orders the totals cover"""
+        return self.count
+
+
+class CursorStream:
+    """Single pass over a raw-batch cursor, decoding one batch at a time; fetch stats are recorded when it ends"""
+
+    def __init__(self, cursor, collection, stats, batch_size=None, codec_options=DEFAULT_CODEC_OPTIONS):
+        self.cursor = cursor
+        self.collection = collection
+        self.stats = stats
+        self.batch_size = batch_size
+        self.codec_options = codec_options
+        self.count = 0
+
+    def __iter__(self):
+        size = 0
+        try:
+            for batch in self.cursor:
+                size += len(batch)
+                for document in bson.decode_all(batch, self.codec_options):
+                    self.count += 1
+                    yield document
+        finally:
+            self.stats.record(self.collection, self.count, size)
+
+    def __len__(self):
+        """Documents read so far, which is the total once the stream is consumed"""
+        return self.count
+
+
+class AsyncCursorStream(CursorStream):
+    """Single pass over a motor cursor by a synchronous consumer on another thread, such as a build"""
+
+    def __init__(self, cursor, collection, stats, batch_size, codec_options, loop):
+        super().__init__(cursor, collection, stats, batch_size, codec_options)
+        self.loop = loop
+
+    async def _next_batch(self):
+        try:
+            return await self.cursor.next()
+        except StopAsyncIteration:
+            return None
+
+    def __iter__(self):
+        size = 0
+        try:
+            while True:
+                # Each batch is read on the cursor's event loop; only this batch is held at a time
+                batch = asyncio.run_coroutine_threadsafe(self._next_batch(), self.loop).result()
+                if batch is None:
+                    break
+                size += len(batch)
+                for document in bson.decode_all(batch, self.codec_options):
+                    self.count += 1
+                    yield document
+        finally:
+            self.stats.record(self.collection, self.count, size)
+            # A build that failed part-way leaves the cursor open on the server
+            asyncio.run_coroutine_threadsafe(self.cursor.close(), self.loop)
+
+
+class MongoDataStore:
+    def __init__(self, db, horizon_days=None, stats=None, batch_size=None):
+        self.db = db
+        self.horizon_days = horizon_days
+        self.stats = stats or FetchStats()
+        # Documents per cursor batch for streamed bulk loads; None loads whole lists
+        self.batch_size = batch_size
+
+    def horizon_start(self):
+        """Oldest orderedAt included in bulk loads, or None for full history"""
+        if not self.horizon_days:
+            return None
+        return datetime.now() - timedelta(days=self.horizon_days)
+
+    def _find(self, collection, query, projection, sort=None):
+        cursor = self.db[collection].find_raw_batches(query, projection)
+        if sort:
+            cursor = cursor.sort(sort, 1)
+        if self.batch_size:
+            cursor = cursor.batch_size(self.batch_size)
+        return cursor
+
+    def _stream(self, collection, query, projection, sort=None):
+        return CursorStream(self._find(collection, query, projection, sort=sort), collection, self.stats,
+                            self.batch_size, self.db[collection].codec_options)
+
+    def _fetch(self, collection, query, projection, sort=None):
+        return list(self._stream(collection, query, projection, sort=sort))
+
+    def _aggregate(self, collection, pipeline):
+        cursor = self.db[collection].aggregate_raw_batches(pipeline, allowDiskUse=True)
+        return list(CursorStream(cursor, collection, self.stats, codec_options=self.db[collection].codec_options))
+
+    def _orders_query(self, after_id=None, start=None):
+        query = {}
+        if after_id is not None:
+            query['_id'] = {'$gt': after_id}
+        start = start or self.horizon_start()
+        if start is not None:
+            query['orderedAt'] = {'$gte': start}
+        return query
+
+    def load_orders(self, after_id=None, start=None):
+        """Orders within the horizon, optionally only those newer than after_id"""
+        return self._fetch('orders', self._orders_query(after_id, start), ORDER_FIELDS,
+                           sort='_id' if after_id is not None else None)
+
+    def stream_orders(self, start=None):
+        """Orders within the horizon as a one-pass stream, read batch_size documents at a time"""
+        return self._stream('orders', self._orders_query(start=start), ORDER_FIELDS)
+
+    def load_user_orders(self, user_id, before=None):
+        """One user's order history via the indexed {user: id} query"""
+        query = {'user': user_key(user_id)}
+        if before is not None:
+            query['orderedAt'] = {'$lt': before}
+        return self._fetch('orders', query, ORDER_FIELDS, sort='_id')
+
+    def load_foods(self):
+        return self._fetch('foods', {}, FOOD_FIELDS)
+
+    def load_parking(self):
+        return self._fetch('parking', {}, PARKING_FIELDS)
+
+    def load_users(self):
+        """Every user's role, for cold-start cohorts"""
+        return self._fetch('users', {}, USER_FIELDS)
+
+    def load_all(self, start=None):
+        return {
+            # Streamed orders are consumed by the model build as they arrive
+            'orders': self.stream_orders(start=start) if self.batch_size else self.load_orders(start=start),
+            'foods': self.load_foods(),
+            'parking': self.load_parking(),
+            'users': self.load_users()
+        }
+
+    def load_aggregates(self, start=None, half_life_days=7.0, origin=None):
+        """load_all with orders replaced by (user, food) and decayed per-food totals grouped server-side"""
+        query = self._orders_query(start=start)
+        now = datetime.now()
+        decay = (half_life_days, origin or now)
+        return {
+            'orders': OrderAggregates.from_results(
+                self._aggregate('orders', preferences_pipeline(query)),
+                self._aggregate('orders', order_summary_pipeline(query)),
+                self._aggregate('orders', popularity_pipeline(query, *decay, now)), decay),
+            'foods': self.load_foods(),
+            'parking': self.load_parking(),
+            'users': self.load_users()
+        }
+
+    def aggregate_user_foods(self, user_id, now):
+        """One user's per-food totals over their full history, grouped server-side"""
+        return self._aggregate('orders', user_foods_pipeline(user_key(user_id), now))
+
+    def aggregate_demand(self, start, end):
+        """Hourly ordered quantities per food between two datetimes, grouped server-side"""
+        return self._aggregate('orders', demand_pipeline(start, end))
+
+    def change_stream_pipeline(self, collection):
+        """$project stage limiting change-stream documents to the fields the engine reads"""
+        fields = {'orders': ORDER_FIELDS, 'foods': FOOD_FIELDS, 'parking': PARKING_FIELDS}[collection]
+        projection = {'operationType': 1, 'documentKey': 1, 'ns': 1, 'fullDocument._id': 1}
+        projection.update({f'fullDocument.{field}': 1 for field in fields})
+        return [{'$project': projection}]
+
+
+class AsyncMongoDataStore(MongoDataStore):
+    """The same queries over the async driver (motor); load_* return awaitables"""
+
+    async def _read(self, collection, cursor):
+        documents = []
+        size = 0
+        async for batch in cursor:
+            size += len(batch)
+            documents.extend(bson.decode_all(batch, self.db[collection].codec_options))
+        self.stats.record(collection, len(documents), size)
+        return documents
+
+    async def _fetch(self, collection, query, projection, sort=None):
+        return await self._read(collection, self._find(collection, query, projection, sort=sort))
+
+    async def _aggregate(self, collection, pipeline):
+        return await self._read(collection, self.db[collection].aggregate_raw_batches(pipeline, allowDiskUse=True))
+
+    def stream_orders(self, start=None):
+        """Orders as a one-pass stream for a build running in an executor thread, not on the event loop"""
+        cursor = self._find('orders', self._orders_query(start=start), ORDER_FIELDS)
+        return AsyncCursorStream(cursor, 'orders', self.stats, self.batch_size, self.db['orders'].codec_options,
+                                 asyncio.get_running_loop())
+
+    async def load_all(self, start=None):
+        foods, parking, users = await asyncio.gather(self.load_foods(), self.load_parking(), self.load_users())
+        return {
+            # Streamed orders are read batch by batch as the build in the executor consumes them
+            'orders': self.stream_orders(start=start) if self.batch_size else await self.load_orders(start=start),
+            'foods': foods,
+            'parking': parking,
+            'users': users
+        }
+
+    async def load_aggregates(self, start=None, half_life_days=7.0, origin=None):
+        query = self._orders_query(start=start)
+        now = datetime.now()
+        decay = (half_life_days, origin or now)
+        rows, summary, popularity, foods, parking, users = await asyncio.gather(
+            self._aggregate('orders', preferences_pipeline(query)),
+            self._aggregate('orders', order_summary_pipeline(query)),
+            self._aggregate('orders', popularity_pipeline(query, *decay, now)),
+            self.load_foods(), self.load_parking(), self.load_users()
+        )
+        return {'orders': OrderAggregates.from_results(rows, summary, popularity, decay), 'foods': foods,
+                'parking': parking, 'users': users}
@@ -0,0 +1,544 @@
+"""
+In-process MongoDB stand-in
+Implements the subset of the pymongo API the ML service uses (find with simple
+filters/projections/sorting, the aggregation stages and operators of the
+pushdown pipelines, writes and change streams) so the ingestion and
+data-loading paths can be exercised without a live cluster.
+"""
+
+import copy
+import itertools
+import math
+import threading
+from datetime import datetime, timedelta
+
+import bson
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from pymongo.errors import OperationFailure
+
+# Documents per raw batch when the cursor sets no batch size
+DEFAULT_BATCH_SIZE = 101
+
+
+def _get_path(doc, path):
+    """Resolve a dotted field path, returning a list of matching values"""
+    values = [doc]
+    for part in path.split('.'):
+        next_values = []
+        for value in values:
+            if isinstance(value, list):
+                next_values.extend(v.get(part) for v in value if isinstance(v, dict) and part in v)
+            elif isinstance(value, dict) and part in value:
+                next_values.append(value[part])
+        values = next_values
+    return values
+
+
+def _compare(value, op, expected):
+    try:
+        if op == '$eq':
+            return value == expected
+        if op == '$ne':
+            return value != expected
+        if op == '$gt':
+            return value is not None and value > expected
+        if op == '$gte':
+            return value is not None and value >= expected
+        if op == '$lt':
+            return value is not None and value < expected
+        if op == '$lte':
+            return value is not None and value <= expected
+        if op == '$in':
+            return value in expected
+        if op == '$nin':
+            return value not in expected
+    except TypeError:
+        return False
+    raise OperationFailure(f'Unsupported query operator {op}')
+
+
+def matches(doc, query):
+    """Check whether a document matches a simple MongoDB query"""
+    for field, condition in (query or {}).items():
+        if field == '$and':
+            if not all(matches(doc, q) for q in condition):
+                return False
+            continue
+        if field == '$or':
+            if not any(matches(doc, q) for q in condition):
+                return False
+            continue
+
+        if isinstance(condition, dict) and '$exists' in condition:
+            if bool(_get_path(doc, field)) != bool(condition['$exists']):
+                return False
+            condition = {op: expected for op, expected in condition.items() if op != '$exists'}
+            if not condition:
+                continue
+
+        values = _get_path(doc, field) or [None]
+        if isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+            for op, expected in condition.items():
+                # Negative operators must hold for every array element, positive ones for any
+                combine = all if op in ('$ne', '$nin') else any
+                if not combine(_compare(v, op, expected) for v in values):
+                    return False
+        elif not any(v == condition for v in values):
+            return False
+    return True
+
+
+def _project(doc, projection):
+    """Apply an inclusion projection (dotted paths into arrays supported)"""
+    if not projection:
+        return copy.deepcopy(doc)
+
+    fields = [f for f, include in projection.items() if include]
+    result = {}
+    if projection.get('_id', 1) and '_id' in doc:
+        result['_id'] = doc['_id']
+
+    for field in fields:
+        if field == '_id':
+            continue
+        head, _, rest = field.partition('.')
+        if head not in doc:
+            continue
+        if not rest:
+            result[head] = copy.deepcopy(doc[head])
+        elif isinstance(doc[head], list):
+            existing = result.setdefault(head, [{} for _ in doc[head]])
+            for target, source in zip(existing, doc[head]):
+                if isinstance(source, dict):
+                    target.update(_project(source, {rest: 1, '_id': 0}))
+        elif isinstance(doc[head], dict):
+            result.setdefault(head, {}).update(_project(doc[head], {rest: 1, '_id': 0}))
+    return result
+
+
+def _sort_key(value):
+    # null and missing sort before every other value, as in MongoDB
+    return (0, 0) if value is None else (1, value)
+
+
+def _subtract(left, right):
+    if isinstance(left, datetime) and isinstance(right, datetime):
+        return (left - right) // timedelta(milliseconds=1)
+    if isinstance(left, datetime):
+        return left - timedelta(milliseconds=right)
+    return left - right
+
+
+EXPRESSION_OPERATORS = {
+    '$add': lambda *args: sum(args),
+    '$subtract': _subtract,
+    '$multiply': lambda *args: math.prod(args),
+    '$divide': lambda left, right: left / right,
+    '$floor': math.floor,
+    '$exp': math.exp,
+    '$eq': lambda left, right: left == right,
+    '$ne': lambda left, right: left != right,
+    '$gt': lambda left, right: _sort_key(left) > _sort_key(right),
+    '$gte': lambda left, right: _sort_key(left) >= _sort_key(right),
+    '$lt': lambda left, right: _sort_key(left) < _sort_key(right),
+    '$lte': lambda left, right: _sort_key(left) <= _sort_key(right),
+    '$and': lambda *args: all(args),
+    '$or': lambda *args: any(args),
+    '$not': lambda value: not value,
+}
+
+
+def evaluate(doc, expression):
+    """Evaluate an aggregation expression: '$field' paths, operators and literals"""
+    if isinstance(expression, str) and expression.startswith('$'):
+        values = _get_path(doc, expression[1:])
+        return values[0] if values else None
+    if isinstance(expression, list):
+        return [evaluate(doc, e) for e in expression]
+    if not isinstance(expression, dict):
+        return expression
+
+    if len(expression) == 1 and next(iter(expression)).startswith('$'):
+        op, args = next(iter(expression.items()))
+        if op == '$ifNull':
+            return next((value for value in evaluate(doc, args) if value is not None), None)
+        if op == '$cond':
+            if isinstance(args, dict):
+                args = [args['if'], args['then'], args['else']]
+            return evaluate(doc, args[1] if evaluate(doc, args[0]) else args[2])
+        if op not in EXPRESSION_OPERATORS:
+            raise OperationFailure(f'Unsupported expression operator {op}')
+        args = evaluate(doc, args if isinstance(args, list) else [args])
+        if None in args and op not in ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte', '$and', '$or', '$not'):
+            return None
+        return EXPRESSION_OPERATORS[op](*args)
+    return {key: evaluate(doc, value) for key, value in expression.items()}
+
+
+def _hashable(value):
+    if isinstance(value, dict):
+        return tuple((k, _hashable(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+def _accumulate(state, op, value):
+    """Fold one value into a $group accumulator; state is a one-element list or empty"""
+    if op == '$sum':
+        if not state:
+            state.append(0)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            state[0] += value
+    elif op == '$first':
+        if not state:
+            state.append(value)
+    elif op == '$last':
+        state[:] = [value]
+    elif op in ('$max', '$min'):
+        if value is None:
+            return
+        if not state:
+            state.append(value)
+        elif (_sort_key(value) > _sort_key(state[0])) == (op == '$max') and value != state[0]:
+            state[0] = value
+    elif op == '$push':
+        if not state:
+            state.append([])
+        state[0].append(value)
+    else:
+        raise OperationFailure(f'Unsupported accumulator {op}')
+
+
+def _unwind(docs, spec):
+    if isinstance(spec, str):
+        spec = {'path': spec}
+    field = spec['path'][1:]
+    index_field = spec.get('includeArrayIndex')
+    for doc in docs:
+        values = doc.get(field)
+        if values is not None and not isinstance(values, list):
+            values = [values]
+        if values:
+            for i, value in enumerate(values):
+                unwound = dict(doc)
+                unwound[field] = value
+                if index_field:
+                    unwound[index_field] = i
+                yield unwound
+        elif spec.get('preserveNullAndEmptyArrays'):
+            unwound = {k: v for k, v in doc.items() if k != field or v is not None and v != []}
+            if index_field:
+                unwound[index_field] = None
+            yield unwound
+
+
+def _group(docs, spec):
+    groups = {}
+    for doc in docs:
+        key = evaluate(doc, spec['_id'])
+        entry = groups.setdefault(_hashable(key), (key, {}))
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            (op, expression), = accumulator.items()
+            _accumulate(entry[1].setdefault(field, []), op, evaluate(doc, expression))
+    results = []
+    for key, states in groups.values():
+        result = {'_id': key}
+        result.update({field: state[0] if state else None for field, state in states.items()})
+        results.append(result)
+    return results
+
+
+def _project_stage(doc, spec):
+    result = {}
+    if spec.get('_id', 1) and '_id' in doc:
+        result['_id'] = doc['_id']
+    for field, value in spec.items():
+        if field == '_id':
+            if not isinstance(value, (int, bool)):
+                result['_id'] = evaluate(doc, value)
+            continue
+        if value is True or value == 1:
+            if field in doc:
+                result[field] = doc[field]
+        elif value is not False and value != 0:
+            result[field] = evaluate(doc, value)
+    return result
+
+
+def run_pipeline(docs, pipeline):
+    """Apply aggregation stages to a list of documents"""
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == '$match':
+            docs = [d for d in docs if matches(d, spec)]
+        elif name == '$unwind':
+            docs = list(_unwind(docs, spec))
+        elif name == '$sort':
+            for key, direction in reversed(list(spec.items())):
+                docs.sort(key=lambda d: _sort_key((_get_path(d, key) or [None])[0]), reverse=direction < 0)
+        elif name == '$group':
+            docs = _group(docs, spec)
+        elif name == '$project':
+            docs = [_project_stage(d, spec) for d in docs]
+        elif name == '$addFields':
+            docs = [dict(d, **{field: evaluate(d, value) for field, value in spec.items()}) for d in docs]
+        elif name == '$limit':
+            docs = docs[:spec]
+        else:
+            raise OperationFailure(f'Unsupported aggregation stage {name}')
+    return docs
+
+
+class FakeCursor:
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = []
+        self._limit = 0
+        self._iterator = None
+
+    def sort(self, key, direction=1):
+        self._sort = key if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def _run(self):
+        docs = self._collection._snapshot()
+        docs = [d for d in docs if matches(d, self._query)]
+        for key, direction in reversed(self._sort):
+            docs.sort(key=lambda d: (_get_path(d, key) or [None])[0], reverse=direction < 0)
+        if self._limit:
+            docs = docs[:self._limit]
+        self._collection.database.round_trips += 1
+        return (_project(d, self._projection) for d in docs)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = self._run()
+        return next(self._iterator)
+
+    def close(self):
+        self._iterator = iter(())
+
+
+def _raw_batches(docs, size):
+    """Concatenated BSON of consecutive documents, as find_raw_batches/aggregate_raw_batches return them"""
+    docs = iter(docs)
+    while True:
+        batch = list(itertools.islice(docs, size))
+        if not batch:
+            return
+        yield b''.join(bson.encode(d) for d in batch)
+
+
+class FakeRawBatchCursor(FakeCursor):
+    def __init__(self, collection, query, projection):
+        super().__init__(collection, query, projection)
+        self._batch_size = DEFAULT_BATCH_SIZE
+
+    def batch_size(self, size):
+        self._batch_size = size or DEFAULT_BATCH_SIZE
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = _raw_batches(self._run(), self._batch_size)
+        return next(self._iterator)
+
+
+class FakeChangeStream:
+    """Change stream over a collection's in-memory oplog"""
+
+    def __init__(self, collection, resume_after=None, full_document=None):
+        self._collection = collection
+        self._full_document = full_document
+        if resume_after is not None:
+            self._position = int(resume_after['_data'], 16)
+            if self._position < collection._oplog_floor:
+                raise OperationFailure('Resume token is no longer in the oplog', code=286)
+        else:
+            self._position = collection._sequence
+        self.resume_token = resume_after
+        self.alive = True
+
+    def try_next(self):
+        with self._collection._lock:
+            events = [e for e in self._collection._oplog if e[0] > self._position]
+            if not events:
+                return None
+            seq, event = events[0]
+            current = self._collection._docs.get(event['documentKey']['_id'])
+
+        self._position = seq
+        event = copy.deepcopy(event)
+        if self._full_document == 'updateLookup' and event['operationType'] == 'update':
+            event['fullDocument'] = copy.deepcopy(current)
+        self.resume_token = event['_id']
+        return event
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        change = self.try_next()
+        if change is None:
+            raise StopIteration
+        return change
+
+    def close(self):
+        self.alive = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeCollection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self._docs = {}
+        self._ids = itertools.count(1)
+        self._oplog = []
+        self._oplog_floor = 0
+        self._sequence = 0
+        self._lock = threading.RLock()
+        self.codec_options = DEFAULT_CODEC_OPTIONS
+
+    def _snapshot(self):
+        with self._lock:
+            return list(self._docs.values())
+
+    def _log(self, operation, doc_id, full_document=None):
+        self._sequence += 1
+        event = {
+            '_id': {'_data': f'{self._sequence:016x}'},
+            'operationType': operation,
+            'ns': {'db': self.database.name, 'coll': self.name},
+            'documentKey': {'_id': doc_id},
+        }
+        if full_document is not None:
+            event['fullDocument'] = copy.deepcopy(full_document)
+        self._oplog.append((self._sequence, event))
+
+    def find(self, query=None, projection=None, **kwargs):
+        return FakeCursor(self, query or {}, projection)
+
+    def find_raw_batches(self, query=None, projection=None, **kwargs):
+        return FakeRawBatchCursor(self, query or {}, projection)
+
+    def find_one(self, query=None, projection=None):
+        return next(iter(self.find(query, projection).limit(1)), None)
+
+    def aggregate(self, pipeline, **kwargs):
+        docs = self._snapshot()
+        # A leading $match filters before copying, like an indexed match on a server
+        if pipeline and '$match' in pipeline[0]:
+            docs = [d for d in docs if matches(d, pipeline[0]['$match'])]
+            pipeline = pipeline[1:]
+        docs = run_pipeline(copy.deepcopy(docs), pipeline)
+        self.database.round_trips += 1
+        return iter(docs)
+
+    def aggregate_raw_batches(self, pipeline, **kwargs):
+        return _raw_batches(self.aggregate(pipeline, **kwargs), kwargs.get('batchSize') or DEFAULT_BATCH_SIZE)
+
+    def count_documents(self, query):
+        return sum(1 for d in self._snapshot() if matches(d, query))
+
+    def insert_one(self, document):
+        with self._lock:
+            document.setdefault('_id', f'{self.name}_{next(self._ids)}')
+            self._docs[document['_id']] = copy.deepcopy(document)
+            self._log('insert', document['_id'], document)
+        return document['_id']
+
+    def insert_many(self, documents):
+        return [self.insert_one(d) for d in documents]
+
+    def update_one(self, query, update):
+        with self._lock:
+            doc = next((d for d in self._docs.values() if matches(d, query)), None)
+            if doc is None:
+                return 0
+            doc.update(copy.deepcopy(update.get('$set', {})))
+            for field in update.get('$unset', {}):
+                doc.pop(field, None)
+            self._log('update', doc['_id'])
+        return 1
+
+    def replace_one(self, query, replacement):
+        with self._lock:
+            doc = next((d for d in self._docs.values() if matches(d, query)), None)
+            if doc is None:
+                return 0
+            replacement = dict(copy.deepcopy(replacement), _id=doc['_id'])
+            self._docs[doc['_id']] = replacement
+            self._log('replace', doc['_id'], replacement)
+        return 1
+
+    def delete_one(self, query):
+        with self._lock:
+            doc = next((d for d in self._docs.values() if matches(d, query)), None)
+            if doc is None:
+                return 0
+            del self._docs[doc['_id']]
+            self._log('delete', doc['_id'])
+        return 1
+
+    def truncate_oplog(self):
+        """Drop history so older resume tokens become invalid"""
+        with self._lock:
+            self._oplog = []
+            self._oplog_floor = self._sequence
+
+    def watch(self, pipeline=None, resume_after=None, full_document=None, **kwargs):
+        if not self.database.supports_change_streams:
+            raise OperationFailure('The $changeStream stage is only supported on replica sets', code=40573)
+        return FakeChangeStream(self, resume_after=resume_after, full_document=full_document)
+
+
+class FakeDatabase:
+    """Dictionary of fake collections, accessed like a pymongo Database"""
+
+    def __init__(self, name='smartcampus', supports_change_streams=True):
+        self.name = name
+        self.supports_change_streams = supports_change_streams
+        self.round_trips = 0
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    @classmethod
+    def from_data(cls, data, **kwargs):
+        """Create a database pre-populated from a load_data style dictionary"""
+        database = cls(**kwargs)
+        for name, documents in data.items():
+            if not isinstance(documents, list):
+                continue
+            database[name].insert_many([copy.deepcopy(d) for d in documents])
+            database[name].truncate_oplog()
+        return database
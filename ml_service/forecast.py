@@ -0,0 +1,299 @@
+"""
+Demand forecasts
+Expected orders per food per hour and expected occupancy per parking slot per
+hour for a given day (tomorrow by default), so kitchen and parking staff can
+plan ahead. Food demand blends the same weekday's hourly average over the
+last four weeks with the hourly average of the last seven days, scaled by
+each food's 7-day vs 4-week trend, all from bincounts over the resident order
+table (or, for pushdown models, which keep no per-order rows, over hourly
+per-food totals grouped by MongoDB). Slot occupancy blends the share of that weekday's hours each slot was
+occupied with its share over every day, from the parking index's weekly
+occupancy table. Forecasts are cached per day and rebuilt when the model
+changes or they age out; today's and tomorrow's are kept fresh in the
+background so recommendations can move foods predicted to sell out (foods
+with a dailyCapacity) and slots predicted to be full to the end of their
+lists with a dictionary lookup.
+"""
+
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from background import BackgroundWorker
+from columnar import EPOCH, MISSING_TS
+
+HOUR_US = 3_600_000_000
+EPOCH_DAY = EPOCH.toordinal()
+# Weight of the same-weekday average against the recent daily average
+WEEKDAY_WEIGHT = 0.6
+# Orders per day added to both sides of the trend ratio so sparse foods stay near 1
+TREND_SMOOTHING = 1.0
+TREND_LIMITS = (0.5, 2.0)
+
+
+def weekday(day):
+    """Weekday (Monday = 0) of a date ordinal, elementwise for arrays"""
+    return (day + 6) % 7
+
+
+def weekday_count(first, end, target):
+    """Days with the target weekday in the ordinal range [first, end)"""
+    return sum(1 for day in range(first, end) if weekday(day) == target) if end > first else 0
+
+
+def parse_day(value):
+    """Forecast date from a YYYY-MM-DD string"""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid 'date', expected YYYY-MM-DD") from None
+
+
+class DemandForecast(BackgroundWorker):
+    name = 'forecast'
+    failure = 'Demand forecast refresh failed'
+
+    def __init__(self, engine, weeks=4, full_occupancy=0.8, max_age=300, interval=5.0, horizon_days=14):
+        super().__init__(engine, interval)
+        self.weeks = weeks
+        # Slots expected to be occupied at least this share of an hour count as full
+        self.full_occupancy = full_occupancy
+        self.max_age = max_age
+        # Furthest day ahead a forecast is made for
+        self.horizon_days = horizon_days
+
+        # date ordinal -> forecast
+        self.forecasts = {}
+        self.lock = threading.Lock()
+        self.builds = 0
+        self.last_build_seconds = 0.0
+
+    def ordered_items(self, start, end):
+        """(food ids, then food index, hour since the epoch and quantity per row) for items ordered in [start, end)"""
+        engine = self.engine
+        if engine.aggregated and engine.store is not None:
+            # Aggregated models keep no per-order rows: group the window server-side
+            rows = engine.store.aggregate_demand(datetime.fromordinal(start), datetime.fromordinal(end))
+            food_ids = list(dict.fromkeys(str(row['food']) for row in rows))
+            index = {food_id: f for f, food_id in enumerate(food_ids)}
+            return (food_ids, np.array([index[str(row['food'])] for row in rows], dtype=np.int64),
+                    np.array([row['hour'] for row in rows], dtype=np.int64),
+                    np.array([row['quantity'] for row in rows], dtype=np.float64))
+
+        with engine.lock:
+            table = engine.order_table
+            columns = table.columns()
+            food_ids = list(table.foods.ids)
+        item_ts = columns['order_ts'][columns['item_order']]
+        keep = item_ts != MISSING_TS
+        return food_ids, columns['item_food'][keep], item_ts[keep] // HOUR_US, columns['item_quantity'][keep]
+
+    def food_demand(self, day, today):
+        """(food ids, foods x 24 expected orders) for a date ordinal from complete days before it"""
+        end = min(today, day)
+        food_ids, foods, hours, quantities = self.ordered_items(end - 7 * self.weeks, end)
+        n_foods = len(food_ids)
+
+        days = EPOCH_DAY + hours // 24
+        window = (days >= end - 7 * self.weeks) & (days < end)
+        if not window.any():
+            return food_ids, np.zeros((n_foods, 24))
+        days, foods, quantities = days[window], foods[window], quantities[window]
+        cells = foods.astype(np.int64) * 24 + hours[window] % 24
+
+        # Averages only cover days since the first order in the window
+        first = int(days.min())
+        n_window = end - first
+        n_recent = end - max(first, end - 7)
+        n_same = weekday_count(first, end, weekday(day))
+
+        def hourly(mask, n_days):
+            counts = np.bincount(cells[mask], weights=quantities[mask], minlength=n_foods * 24)
+            return counts.reshape(n_foods, 24) / max(n_days, 1)
+
+        recent_mask = days >= end - 7
+        recent = hourly(recent_mask, n_recent)
+        if n_same:
+            same_weekday = hourly(weekday(days) == weekday(day), n_same)
+            demand = WEEKDAY_WEIGHT * same_weekday + (1 - WEEKDAY_WEIGHT) * recent
+        else:
+            demand = recent
+
+        recent_daily = np.bincount(foods[recent_mask], weights=quantities[recent_mask],
+                                   minlength=n_foods) / max(n_recent, 1)
+        window_daily = np.bincount(foods, weights=quantities, minlength=n_foods) / n_window
+        trend = np.clip((recent_daily + TREND_SMOOTHING) / (window_daily + TREND_SMOOTHING), *TREND_LIMITS)
+        return food_ids, demand * trend[:, None]
+
+    def slot_occupancy(self, day, today):
+        """(slots, slots x 24 expected occupancy shares) for a date ordinal"""
+        with self.engine.lock:
+            index = self.engine.parking_index
+            slots = sorted(index.known_slots())
+            empty = np.zeros((7, 24), dtype=np.int64)
+            week = np.array([index.slot_week_hours.get(slot, empty) for slot in slots]).reshape(-1, 7, 24)
+            first = index.first_day
+
+        # Occupancy counts cover every day from the first reservation through today
+        end = min(today, day) + 1
+        if first is None or end <= first:
+            return slots, np.zeros((len(slots), 24))
+        n_same = weekday_count(first, end, weekday(day))
+        occupancy = week.sum(axis=1) / (end - first)
+        if n_same:
+            occupancy = WEEKDAY_WEIGHT * week[:, weekday(day)] / n_same + (1 - WEEKDAY_WEIGHT) * occupancy
+        return slots, np.clip(occupancy, 0, 1)
+
+    def build(self, day, now=None):
+        """Forecast one day and cache it"""
+        now = now or datetime.now()
+        start = time.perf_counter()
+        data_version = self.engine.data_version
+        ordinal, today = day.toordinal(), now.date().toordinal()
+        food_ids, demand = self.food_demand(ordinal, today)
+        slots, occupancy = self.slot_occupancy(ordinal, today)
+
+        # Foods with a daily capacity sell out from the hour their cumulative demand reaches it
+        sold_out = {}
+        with self.engine.lock:
+            capacities = {food_id: (self.engine.catalog.get(food_id) or {}).get('dailyCapacity')
+                          for food_id in food_ids}
+        cumulative = np.cumsum(demand, axis=1)
+        for f, food_id in enumerate(food_ids):
+            capacity = capacities[food_id]
+            if isinstance(capacity, (int, float)) and capacity > 0 and cumulative[f, -1] >= capacity:
+                sold_out[food_id] = int(np.argmax(cumulative[f] >= capacity))
+
+        full = occupancy >= self.full_occupancy
+        forecast = {
+            'date': day,
+            'data_version': data_version,
+            'built_at': time.monotonic(),
+            'generated_at': now.isoformat(),
+            'food_ids': food_ids,
+            'demand': demand,
+            'capacities': capacities,
+            'sold_out': sold_out,
+            'slots': slots,
+            'occupancy': occupancy,
+            # hour -> slots predicted to be full then
+            'full_slots': [{slots[s] for s in np.flatnonzero(full[:, hour])} for hour in range(24)]
+        }
+        with self.lock:
+            self.forecasts[ordinal] = forecast
+            self.builds += 1
+            self.last_build_seconds = time.perf_counter() - start
+        return forecast
+
+    def expired(self, forecast):
+        return forecast is None or self.stale(forecast['data_version'], forecast['built_at'])
+
+    def forecast(self, day=None, now=None):
+        """Cached forecast for a day (default: tomorrow), rebuilt first when stale"""
+        now = now or datetime.now()
+        day = day or now.date() + timedelta(days=1)
+        with self.lock:
+            forecast = self.forecasts.get(day.toordinal())
+        return self.build(day, now) if self.expired(forecast) else forecast
+
+    def cached(self, at):
+        """The last forecast covering a moment, without building one"""
+        with self.lock:
+            return self.forecasts.get(at.date().toordinal())
+
+    def avoid_foods(self, at=None):
+        """Foods predicted to have sold out by this time"""
+        at = at or datetime.now()
+        forecast = self.cached(at)
+        if forecast is None:
+            return set()
+        return {food_id for food_id, hour in forecast['sold_out'].items() if hour <= at.hour}
+
+    def avoid_slots(self, at=None):
+        """Slots predicted to be full at this time"""
+        at = at or datetime.now()
+        forecast = self.cached(at)
+        return forecast['full_slots'][at.hour] if forecast is not None else set()
+
+    def summary(self, day=None, food=None, slot=None):
+        """JSON view of a day's forecast, optionally for one food or slot"""
+        forecast = self.forecast(day)
+        day = forecast['date']
+        foods = []
+        with self.engine.lock:
+            catalog = self.engine.catalog
+            for f, food_id in enumerate(forecast['food_ids']):
+                expected = forecast['demand'][f]
+                if (food is not None and food_id != food) or (food is None and not expected.any()):
+                    continue
+                foods.append({
+                    'id': food_id,
+                    'name': (catalog.get(food_id) or {}).get('name', 'Unknown'),
+                    'expected_orders': [round(float(value), 2) for value in expected],
+                    'total': round(float(expected.sum()), 2),
+                    'peak_hour': int(expected.argmax()),
+                    'capacity': forecast['capacities'][food_id],
+                    'sells_out_at': forecast['sold_out'].get(food_id)
+                })
+        foods.sort(key=lambda item: -item['total'])
+
+        parking = []
+        for s, slot_id in enumerate(forecast['slots']):
+            if slot is not None and slot_id != slot:
+                continue
+            expected = forecast['occupancy'][s]
+            parking.append({
+                'slot': slot_id,
+                'expected_occupancy': [round(float(value), 3) for value in expected],
+                'peak_hour': int(expected.argmax()),
+                'full_hours': [int(hour) for hour in np.flatnonzero(expected >= self.full_occupancy)]
+            })
+
+        return {
+            'date': day.isoformat(),
+            'weekday': day.strftime('%A'),
+            'foods': foods,
+            'parking': parking,
+            'full_occupancy': self.full_occupancy,
+            'generatedAt': forecast['generated_at']
+        }
+
+    def refresh(self, now=None):
+        """Rebuild today's and tomorrow's forecasts when stale and drop past days"""
+        now = now or datetime.now()
+        today = now.date()
+        with self.lock:
+            for ordinal in [o for o in self.forecasts if o < today.toordinal()]:
+                del self.forecasts[ordinal]
+        built = 0
+        for day in (today, today + timedelta(days=1)):
+            with self.lock:
+                forecast = self.forecasts.get(day.toordinal())
+            if self.expired(forecast):
+                self.build(day, now)
+                built += 1
+        return built
+
+    def warm_up(self):
+        """Forecast today and tomorrow before serving, then keep them fresh in the background"""
+        if self.engine.loaded:
+            self.refresh()
+            print("📈 Demand forecasts ready for today and tomorrow")
+        return self.start()
+
+    def work(self):
+        if self.engine.loaded:
+            self.refresh()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'running': self.is_alive(),
+                'days': sorted(forecast['date'].isoformat() for forecast in self.forecasts.values()),
+                'builds': self.builds,
+                'sold_out_foods': sum(len(forecast['sold_out']) for forecast in self.forecasts.values()),
+                'max_age_seconds': self.max_age,
+                'last_build_seconds': round(self.last_build_seconds, 4)
+            }
@@ -0,0 +1,15 @@
+"""
+Gunicorn settings
+Every worker imports app, which restores the model snapshot or runs a full
+build (or waits on the snapshot lock while another worker builds) before it
+can answer. Gunicorn counts that boot against the worker timeout, so the
+30 s default would kill workers mid-build on a large database.
+
+The model is not built once in the master with preload_app: the background
+workers (ingestion, materialization, forecasts) started by app are threads,
+which do not survive the fork, and MongoClient is not fork-safe.
+"""
+
+import os
+
+timeout = int(os.getenv('ML_WORKER_TIMEOUT', 300))
@@ -0,0 +1,199 @@
+"""
+Change-stream ingestion worker
+Tails MongoDB change streams for orders, foods and parking and pushes the deltas
+into the resident RecommendationEngine. Collections whose change streams are
+unavailable (standalone servers) are polled by _id high-water mark instead.
+Resume tokens and high-water marks are persisted so a restart resumes where the
+previous process stopped.
+"""
+
+import os
+import time
+from datetime import datetime
+
+from bson import json_util
+from pymongo.errors import OperationFailure, PyMongoError
+
+from background import BackgroundWorker
+
+COLLECTIONS = ('orders', 'foods', 'parking')
+
+# Error codes meaning "change streams are not supported on this deployment"
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324, 115}
+
+
+class IngestionWorker(BackgroundWorker):
+    name = 'ingestion-worker'
+    failure = 'Ingestion error'
+
+    def __init__(self, store, engine, state_path=None, poll_interval=None):
+        super().__init__(engine, interval=1.0, retry_interval=5.0)
+        self.store = store
+        self.db = store.db
+        self.state_path = state_path or os.getenv('ML_INGEST_STATE', 'ingest_state.json')
+        self.poll_interval = float(poll_interval if poll_interval is not None
+                                   else os.getenv('ML_SYNC_INTERVAL', 30))
+        self.state = self.load_state()
+        self.streams = {}
+        self.mode = {}
+        self.events_applied = 0
+        self.last_event_at = None
+        self.last_poll = 0.0
+
+    def load_state(self):
+        """Read persisted resume tokens and high-water marks"""
+        try:
+            with open(self.state_path) as f:
+                state = json_util.loads(f.read())
+        except FileNotFoundError:
+            state = {}
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable ingestion state {self.state_path}: {e}")
+            state = {}
+        return {name: dict(state.get(name, {})) for name in COLLECTIONS}
+
+    def save_state(self):
+        """Atomically persist resume tokens and high-water marks"""
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(json_util.dumps(self.state))
+        os.replace(tmp_path, self.state_path)
+
+    def open_streams(self):
+        """Open a change stream per collection, falling back to polling where unsupported"""
+        for name in COLLECTIONS:
+            if name in self.streams:
+                continue
+            token = self.state[name].get('resume_token')
+            try:
+                self.streams[name] = self.db[name].watch(
+                    self.store.change_stream_pipeline(name),
+                    full_document='updateLookup', resume_after=token, max_await_time_ms=200
+                )
+                self.mode[name] = 'change_stream'
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    self.mode[name] = 'polling'
+                elif token is not None:
+                    # Resume point fell off the oplog: start fresh and let polling close the gap
+                    print(f"⚠️  Cannot resume {name} change stream ({e}); restarting from now")
+                    self.state[name].pop('resume_token', None)
+                    self.last_poll = 0.0
+                    self.open_streams()
+                    return
+                else:
+                    raise
+
+    def close_streams(self):
+        for stream in self.streams.values():
+            try:
+                stream.close()
+            except PyMongoError:
+                pass
+        self.streams = {}
+
+    def apply_change(self, name, change):
+        """Apply one change event to the engine"""
+        operation = change.get('operationType')
+        document = change.get('fullDocument')
+        document_id = change.get('documentKey', {}).get('_id')
+
+        if name == 'orders':
+            if operation == 'insert' and document:
+                self.engine.apply_order(document)
+                self.advance_order_mark(document.get('_id'))
+        elif operation == 'delete':
+            if name == 'foods':
+                self.engine.remove_food(document_id)
+            else:
+                self.engine.remove_reservation(document_id)
+        elif document:
+            if name == 'foods':
+                self.engine.apply_food(document)
+            else:
+                self.engine.apply_reservation(document)
+
+        self.events_applied += 1
+        self.last_event_at = datetime.now()
+
+    def advance_order_mark(self, order_id):
+        last_id = self.state['orders'].get('last_id')
+        if order_id is not None and (last_id is None or order_id > last_id):
+            self.state['orders']['last_id'] = order_id
+
+    def drain_streams(self, max_events=500):
+        """Apply pending change events from every open stream"""
+        applied = 0
+        for name, stream in list(self.streams.items()):
+            try:
+                for _ in range(max_events):
+                    change = stream.try_next()
+                    if change is None:
+                        break
+                    self.apply_change(name, change)
+                    applied += 1
+                if stream.resume_token is not None:
+                    self.state[name]['resume_token'] = stream.resume_token
+            except PyMongoError as e:
+                print(f"❌ {name} change stream failed: {e}; reopening")
+                self.streams.pop(name).close()
+        return applied
+
+    def poll_once(self, names=COLLECTIONS):
+        """Pull changes by high-water mark (orders) or full reconcile (small collections)"""
+        applied = 0
+        if 'orders' in names:
+            last_id = self.state['orders'].get('last_id')
+            if self.engine.last_order_id is not None and (last_id is None or self.engine.last_order_id > last_id):
+                last_id = self.engine.last_order_id
+            for order in self.store.load_orders(after_id=last_id):
+                if self.engine.apply_order(order):
+                    applied += 1
+                self.advance_order_mark(order.get('_id'))
+        # Foods and parking slots are small, mutable collections: re-read and diff them
+        if 'foods' in names:
+            self.engine.sync_foods(self.store.load_foods())
+        if 'parking' in names:
+            self.engine.sync_parking(self.store.load_parking())
+
+        self.last_poll = time.time()
+        self.events_applied += applied
+        return applied
+
+    def step(self):
+        """Run one ingestion iteration; returns the number of deltas applied"""
+        self.open_streams()
+        applied = self.drain_streams()
+
+        if self.last_poll == 0.0:
+            # Close the gap between the model build (or a lost resume point) and the streams opening
+            applied += self.poll_once()
+        else:
+            polled = [name for name in COLLECTIONS if self.mode.get(name) == 'polling']
+            if polled and time.time() - self.last_poll >= self.poll_interval:
+                applied += self.poll_once(polled)
+
+        if applied:
+            self.save_state()
+        return applied
+
+    def work(self):
+        # Deltas only make sense on top of a built model; the first build reads everything anyway
+        return self.engine.loaded and self.step()
+
+    def failed(self, error):
+        super().failed(error)
+        self.close_streams()
+
+    def run(self):
+        print(f"📡 Ingestion worker started (state: {self.state_path})")
+        super().run()
+        self.close_streams()
+
+    def status(self):
+        return {
+            'running': self.is_alive(),
+            'mode': dict(self.mode),
+            'events_applied': self.events_applied,
+            'last_event_at': self.last_event_at.isoformat() if self.last_event_at else None
+        }
@@ -0,0 +1,175 @@
+"""
+Integer-encoded user x item interaction counts
+Users and items (foods, parking slots) are interned to dense integer ids and
+their counts kept in CSR arrays (int32 item ids, float64 values) instead of a
+Counter per user keyed by str(ObjectId). Rows changed since the last
+compaction live in a small overlay of {item id: value} dicts that is merged
+back in bulk, so incremental updates stay O(1) while the bulk of the data
+costs 12 bytes per interaction.
+"""
+
+import numpy as np
+
+from columnar import Interner
+
+
+class InteractionMatrix:
+    def __init__(self):
+        self.users = Interner()
+        self.items = Interner()
+        # Compacted rows in CSR form, items in first-seen order within each row
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int32)
+        self.data = np.empty(0, dtype=np.float64)
+        # Rows changed since the last compaction: user id -> {item id: value}
+        self.overlay = {}
+
+    def clear(self):
+        self.__init__()
+
+    def _compact_row(self, user_idx):
+        if user_idx + 1 >= len(self.indptr):
+            return self.indices[:0], self.data[:0]
+        start, end = self.indptr[user_idx], self.indptr[user_idx + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def _mutable_row(self, user_idx):
+        row = self.overlay.get(user_idx)
+        if row is None:
+            indices, values = self._compact_row(user_idx)
+            row = self.overlay[user_idx] = dict(zip(indices.tolist(), values.tolist()))
+        return row
+
+    def _row(self, user_idx):
+        row = self.overlay.get(user_idx)
+        if row is not None:
+            return row.keys(), row.values()
+        indices, values = self._compact_row(user_idx)
+        return indices.tolist(), values.tolist()
+
+    def add(self, user_key, item_key, amount=1):
+        """Add to a user's count for an item; returns True if the user had no count for it"""
+        row = self._mutable_row(self.users.intern(user_key))
+        item_idx = self.items.intern(item_key)
+        is_new = item_idx not in row
+        row[item_idx] = row.get(item_idx, 0) + amount
+        # Compact once the overlay outgrows the CSR part, so bulk loads copy O(log n) times
+        if len(self.overlay) > max(1024, len(self.indptr) - 1):
+            self.compact()
+        return is_new
+
+    def decrement(self, user_key, item_key):
+        """Subtract one from a count, dropping it at zero"""
+        user_idx = self.users.get(user_key)
+        item_idx = self.items.get(item_key)
+        if user_idx is None or item_idx is None:
+            return
+        row = self._mutable_row(user_idx)
+        if item_idx not in row:
+            return
+        row[item_idx] -= 1
+        if row[item_idx] <= 0:
+            del row[item_idx]
+
+    def get(self, user_key, default=None):
+        """A user's counts as an {item key: value} dict, or default when they have none"""
+        user_idx = self.users.get(user_key)
+        if user_idx is None:
+            return default
+        indices, values = self._row(user_idx)
+        if not indices:
+            return default
+        item_ids = self.items.ids
+        return {item_ids[i]: value for i, value in zip(indices, values)}
+
+    def __getitem__(self, user_key):
+        row = self.get(user_key)
+        if row is None:
+            raise KeyError(user_key)
+        return row
+
+    def __contains__(self, user_key):
+        return self.get(user_key) is not None
+
+    def __iter__(self):
+        """User keys with at least one count, in first-seen order"""
+        for user_idx, user_key in enumerate(self.users.ids):
+            if len(self._row(user_idx)[0]):
+                yield user_key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def values(self):
+        for user_key in self:
+            yield self.get(user_key)
+
+    def items_of(self, user_key):
+        return self.get(user_key, {}).keys()
+
+    def update(self, other):
+        """Add another matrix's counts, as if its add() calls had followed ours"""
+        # Interning other's keys first keeps first-seen order for items that rows reach later
+        for key in other.users.ids:
+            self.users.intern(key)
+        for key in other.items.ids:
+            self.items.intern(key)
+        for user_key in other:
+            for item_key, value in other.get(user_key).items():
+                self.add(user_key, item_key, value)
+
+    def compact(self):
+        """Merge overlay rows into fresh CSR arrays"""
+        n_rows = len(self.users)
+        compacted = len(self.indptr) - 1
+        lengths = np.zeros(n_rows, dtype=np.int64)
+        lengths[:compacted] = np.diff(self.indptr)
+        for user_idx, row in self.overlay.items():
+            lengths[user_idx] = len(row)
+
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        data = np.empty(indptr[-1], dtype=np.float64)
+        # Unchanged rows are copied as contiguous runs between overlay rows
+        previous = 0
+        for user_idx in sorted(self.overlay) + [n_rows]:
+            run_end = min(user_idx, compacted)
+            if run_end > previous:
+                src, dst = self.indptr[previous], indptr[previous]
+                count = self.indptr[run_end] - src
+                indices[dst:dst + count] = self.indices[src:src + count]
+                data[dst:dst + count] = self.data[src:src + count]
+            if user_idx < n_rows:
+                row = self.overlay[user_idx]
+                start = indptr[user_idx]
+                indices[start:start + len(row)] = np.fromiter(row.keys(), dtype=np.int32, count=len(row))
+                data[start:start + len(row)] = np.fromiter(row.values(), dtype=np.float64, count=len(row))
+            previous = user_idx + 1
+
+        self.indptr, self.indices, self.data = indptr, indices, data
+        self.overlay = {}
+
+    def nbytes(self):
+        """Approximate memory held by the arrays and overlay"""
+        overlay = sum(len(row) for row in self.overlay.values())
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes + overlay * 100
+
+    def to_snapshot(self):
+        """Metadata and arrays for a model snapshot"""
+        self.compact()
+        meta = {'users': self.users.ids, 'items': self.items.ids}
+        return meta, {'indptr': self.indptr, 'indices': self.indices, 'data': self.data}
+
+    @classmethod
+    def from_snapshot(cls, meta, arrays):
+        """Rebuild from to_snapshot() output; the arrays stay backed by the snapshot"""
+        matrix = cls()
+        for key in meta['users']:
+            matrix.users.intern(key)
+        for key in meta['items']:
+            matrix.items.intern(key)
+        matrix.indptr = arrays['indptr']
+        matrix.indices = arrays['indices']
+        matrix.data = arrays['data']
+        return matrix
@@ -0,0 +1,161 @@
+"""
+Materialized top-N recommendations
+Keeps each requested user's final food recommendations precomputed so a
+recommendations request is a dictionary lookup plus the (time-dependent)
+parking pick. A background scheduler recomputes only users whose own orders
+or parking changed (a dirty set fed by the engine) and entries that are read
+but approaching the staleness bound; global changes such as a retrain or a
+catalog update mark every entry for refresh. Entries for a user whose data
+changed are never served, other entries are served for at most max_age
+seconds, and users without an entry are computed on demand and queued.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from background import BackgroundWorker
+
+
+class MaterializedRecommendations(BackgroundWorker):
+    name = 'materializer'
+    failure = 'Materialized refresh failed'
+
+    def __init__(self, engine, mode, max_entries=10000, max_age=300, refresh_age=None, interval=2.0,
+                 batch_size=500):
+        super().__init__(engine, interval)
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_age = max_age
+        # Entries read since their last refresh are recomputed once this old
+        self.refresh_age = max_age / 2 if refresh_age is None else refresh_age
+        self.batch_size = batch_size
+
+        # user_id -> [user_version, computed_at (monotonic), computed_at (wall clock), foods, trends, read]
+        self.entries = OrderedDict()
+        self.dirty = OrderedDict()
+        self.data_version = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshed = 0
+        self.last_refresh_seconds = 0.0
+
+        engine.user_listeners.append(self.mark_dirty)
+
+    def mark_dirty(self, user_id):
+        """Queue a materialized user whose orders or parking changed"""
+        with self.lock:
+            if user_id in self.entries:
+                self.dirty[user_id] = True
+
+    def get(self, user_id):
+        """Materialized recommendations for a user, or None to compute on demand (and queue them)"""
+        user_id = str(user_id)
+        user_version = self.engine.version(user_id)[1]
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] != user_version or time.monotonic() - entry[1] > self.max_age:
+                self.misses += 1
+                if len(self.dirty) < self.max_entries:
+                    self.dirty[user_id] = True
+                return None
+            entry[5] = True
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            _, _, computed_at, foods, trends, _ = entry
+
+        return {
+            'foods': foods,
+            'parking': self.engine.recommend_parking(user_id),
+            'lastUpdated': computed_at,
+            'algorithm': 'python_rule_based',
+            'engine_mode': self.mode,
+            'trends': trends
+        }
+
+    def put(self, user_id, user_version, foods, trends):
+        with self.lock:
+            self.entries[user_id] = [user_version, time.monotonic(), datetime.now().isoformat(), foods, trends,
+                                     False]
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_entries:
+                evicted, _ = self.entries.popitem(last=False)
+                self.dirty.pop(evicted, None)
+
+    def due(self):
+        """Users to recompute this cycle: dirty first, then read entries nearing max_age"""
+        data_version = self.engine.data_version
+        now = time.monotonic()
+        with self.lock:
+            if data_version != self.data_version:
+                # Retrain, snapshot swap or catalog change: every entry may now differ
+                self.data_version = data_version
+                for user_id in self.entries:
+                    self.dirty.setdefault(user_id, True)
+            for user_id, entry in self.entries.items():
+                if entry[5] and now - entry[1] >= self.refresh_age:
+                    self.dirty.setdefault(user_id, True)
+
+            user_ids = []
+            while self.dirty and len(user_ids) < self.batch_size:
+                user_ids.append(self.dirty.popitem(last=False)[0])
+        return user_ids
+
+    def refresh(self):
+        """Recompute due users; returns how many were materialized"""
+        if not self.engine.loaded:
+            return 0
+        user_ids = self.due()
+        if not user_ids:
+            return 0
+
+        start = time.perf_counter()
+        now = datetime.now()
+        for user_id in user_ids:
+            # Read the version first: a change landing mid-computation leaves the entry stale, not wrong
+            user_version = self.engine.version(user_id)[1]
+            try:
+                foods, trends = self.engine.recommend_foods(user_id, mode=self.mode, now=now)
+            except Exception as e:
+                print(f"❌ Could not materialize recommendations for {user_id}: {e}")
+                continue
+            self.put(user_id, user_version, foods, trends)
+
+        self.refreshed += len(user_ids)
+        self.last_refresh_seconds = time.perf_counter() - start
+        return len(user_ids)
+
+    def invalidate(self, user_id=None):
+        """Drop one user's entry, or every entry when user_id is None; returns entries removed"""
+        with self.lock:
+            if user_id is None:
+                removed = len(self.entries)
+                self.entries.clear()
+                self.dirty.clear()
+            else:
+                removed = 1 if self.entries.pop(str(user_id), None) is not None else 0
+                self.dirty.pop(str(user_id), None)
+            return removed
+
+    def work(self):
+        # Keep going without a pause while a backlog remains
+        return self.refresh() >= self.batch_size
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'running': self.is_alive(),
+                'engine_mode': self.mode,
+                'entries': len(self.entries),
+                'dirty': len(self.dirty),
+                'max_entries': self.max_entries,
+                'max_age_seconds': self.max_age,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'refreshed': self.refreshed,
+                'last_refresh_seconds': round(self.last_refresh_seconds, 4)
+            }
@@ -0,0 +1,135 @@
+"""
+Request stage timing and Prometheus metrics
+Records how long each stage of a recommendations request takes (data load,
+analysis, trends, personal/popular/parking scoring, serialization) into
+latency histograms, one sample per stage per request however many blocks
+it spans, keeps the current request's stage timings for a Server-Timing
+header, and renders everything in the Prometheus text exposition format for
+the /metrics endpoint.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# Upper bounds in seconds, from 100µs scoring stages up to full retrains
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{{{format_labels(labels + (("le", le),))}}} {cumulative}')
+        suffix = f'{{{format_labels(labels)}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.sum:.6f}')
+        lines.append(f'{name}_count{suffix} {self.count}')
+        return lines
+
+
+class StageTimer:
+    """Times one stage; a plain class because a @contextmanager generator costs more per use"""
+
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.metrics.record_stage(self.stage, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """Labelled latency histograms plus the current request's stage timings"""
+
+    HELP = {
+        'ml_stage_seconds': 'Time spent in each stage of a recommendations request',
+        'ml_request_seconds': 'End-to-end request latency by route'
+    }
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.histograms = {}
+        # Per request: one context per thread (Flask) or per asyncio task (ASGI)
+        self.request_timings = ContextVar('stage_timings', default=None)
+
+    def begin_request(self):
+        self.request_timings.set({})
+
+    def end_request(self):
+        """Observe each stage of the current request once, however many blocks it was timed in"""
+        timings = self.request_timings.get()
+        self.request_timings.set(None)
+        for stage, seconds in (timings or {}).items():
+            self.observe('ml_stage_seconds', seconds, stage=stage)
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def stage(self, stage):
+        """Context manager timing a block as one stage of the current request"""
+        return StageTimer(self, stage)
+
+    def record_stage(self, stage, seconds):
+        timings = self.request_timings.get()
+        if timings is None:
+            # Outside a request (builds, background workers, streamed batches) every block is a sample
+            self.observe('ml_stage_seconds', seconds, stage=stage)
+        else:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def server_timing(self):
+        """Server-Timing header value for the current request's stages, in ms"""
+        timings = self.request_timings.get() or {}
+        return ', '.join(f'{stage};dur={seconds * 1000:.3f}' for stage, seconds in timings.items())
+
+    def render(self, counters=()):
+        """Prometheus text format: histograms, then (name, help, type, [(labels, value)]) series"""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            histogram_lines = {}
+            for (name, labels), histogram in histograms:
+                histogram_lines.setdefault(name, []).extend(histogram.render(name, labels))
+
+        lines = []
+        for name, series in histogram_lines.items():
+            lines.append(f'# HELP {name} {self.HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} histogram')
+            lines.extend(series)
+        for name, description, kind, samples in counters:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                suffix = f'{{{format_labels(tuple(labels.items()))}}}' if labels else ''
+                lines.append(f'{name}{suffix} {value}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,274 @@
+"""
+Parking slot affinity index
+Maintains, per user, how often each slot was reserved together with
+hour-of-day and weekday histograms, plus global slot occupancy tables by hour
+of the day and by hour of the week. Parking recommendations become a lookup
+over the user's own slots and can prefer slots that are usually free at the
+requested time.
+
+Users and slots are interned: an InteractionMatrix maps each (user, slot)
+pair to a row of one int32 table holding its count and both histograms, so a
+pair costs 140 bytes of arrays instead of a Python object holding two numpy
+arrays.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from interactions import InteractionMatrix
+
+ACTIVE_STATUSES = ('reserved', 'occupied')
+# Longest stay credited to the occupancy table for one reservation
+MAX_STAY_HOURS = 12
+
+
+def to_datetime(value):
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+# Columns of a pair row: reservation count, reservations by hour of day, by weekday
+PAIR_COUNT = 0
+PAIR_HOURS = slice(1, 25)
+PAIR_WEEKDAYS = slice(25, 32)
+PAIR_WIDTH = 32
+
+
+class ParkingIndex:
+    def __init__(self):
+        # user x slot -> row of pair_stats (the matrix value is the row number)
+        self.user_slots = InteractionMatrix()
+        self.pair_stats = np.zeros((0, PAIR_WIDTH), dtype=np.int32)
+        self.n_pairs = 0
+        self.slot_hours = defaultdict(lambda: np.zeros(24, dtype=np.int64))
+        # Occupancy by weekday x hour, and the first day with a reservation, for demand forecasts
+        self.slot_week_hours = defaultdict(lambda: np.zeros((7, 24), dtype=np.int64))
+        self.first_day = None
+        # Current state of each slot: slot -> (status, user, parking document id)
+        self.slot_state = {}
+        self.seen = set()
+        self._free_by_hour = {}
+
+    def clear(self):
+        self.__init__()
+
+    def record(self, reservation):
+        """Count a reservation once and track the slot's current state"""
+        slot = reservation.get('slot')
+        if not slot:
+            return False
+
+        status = reservation.get('status')
+        parking_id = str(reservation.get('_id'))
+        user_id = str(reservation.get('user')) if reservation.get('user') is not None else None
+        self.slot_state[slot] = (status, user_id, parking_id)
+        self._free_by_hour = {}
+
+        started_at = to_datetime(reservation.get('reservedAt')) or to_datetime(reservation.get('occupiedAt'))
+        key = (parking_id, started_at)
+
+        if status in ACTIVE_STATUSES and user_id is not None:
+            # reserved -> occupied keeps reservedAt, so both updates count as one reservation
+            if key in self.seen:
+                return False
+            self.seen.add(key)
+
+            self.add_affinity(user_id, slot, started_at)
+            if started_at is not None:
+                self._occupy(slot, started_at, 0, 1)
+            return True
+
+        # Ended sessions keep reservedAt and gain endedAt: credit the rest of the stay
+        ended_at = to_datetime(reservation.get('endedAt'))
+        if started_at is None or ended_at is None or ended_at <= started_at:
+            return False
+        end_key = key + ('ended',)
+        if end_key in self.seen:
+            return False
+        self.seen.add(end_key)
+
+        stay = min(MAX_STAY_HOURS, int((ended_at - started_at) / timedelta(hours=1)) + 1)
+        first = 1 if key in self.seen else 0
+        if stay > first:
+            self._occupy(slot, started_at, first, stay - first)
+        return False
+
+    def _pair(self, user_id, slot):
+        """Row of pair_stats for a user and slot, adding an empty one the first time"""
+        slots = self.user_slots.get(user_id)
+        pair = slots.get(slot) if slots else None
+        if pair is not None:
+            return int(pair)
+
+        pair = self.n_pairs
+        if pair == len(self.pair_stats) or not self.pair_stats.flags.writeable:
+            # Double the table; a snapshot-backed one is copied on the first write
+            grown = np.zeros((max(1024, 2 * pair), PAIR_WIDTH), dtype=np.int32)
+            grown[:pair] = self.pair_stats[:pair]
+            self.pair_stats = grown
+        self.user_slots.add(user_id, slot, pair)
+        self.n_pairs += 1
+        return pair
+
+    def add_affinity(self, user_id, slot, started_at=None):
+        """Count one reservation of a slot by a user"""
+        pair = self._pair(user_id, slot)
+        stats = self.pair_stats[pair]
+        stats[PAIR_COUNT] += 1
+        if started_at is not None:
+            stats[PAIR_HOURS][started_at.hour] += 1
+            stats[PAIR_WEEKDAYS][started_at.weekday()] += 1
+
+    def compact(self):
+        """Merge the pair overlay and drop the pair table's spare capacity, after a bulk load"""
+        self.user_slots.compact()
+        if self.pair_stats.flags.writeable:
+            self.pair_stats = self.pair_stats[:self.n_pairs].copy()
+
+    def has_user(self, user_id):
+        return user_id in self.user_slots
+
+    def users(self):
+        """Users with at least one reservation, in first-seen order"""
+        return iter(self.user_slots)
+
+    def _occupy(self, slot, started_at, first, hours):
+        """Credit hours of a stay, starting `first` hours after started_at"""
+        occupancy = self.slot_hours[slot]
+        week = self.slot_week_hours[slot].reshape(-1)
+        start = started_at.weekday() * 24 + started_at.hour + first
+        for offset in range(hours):
+            occupancy[(start + offset) % 24] += 1
+            week[(start + offset) % 168] += 1
+        day = started_at.toordinal()
+        if self.first_day is None or day < self.first_day:
+            self.first_day = day
+
+    def forget_slot(self, slot, parking_id):
+        """A parking document was deleted; drop the slot state it set"""
+        state = self.slot_state.get(slot)
+        if state is not None and state[2] == str(parking_id):
+            del self.slot_state[slot]
+            self._free_by_hour = {}
+
+    def known_slots(self):
+        """Slots with a parking document, or every slot seen when none are loaded"""
+        return set(self.slot_state) or set(self.slot_hours)
+
+    def is_taken_by_other(self, slot, user_id):
+        status, holder, _ = self.slot_state.get(slot, (None, None, None))
+        return status in ACTIVE_STATUSES and holder != user_id
+
+    def busyness(self, slot, hour):
+        """Historical reservations overlapping this hour of the day"""
+        hours = self.slot_hours.get(slot)
+        return int(hours[hour]) if hours is not None else 0
+
+    def free_slots(self, hour):
+        """All known slots ordered from usually-free to usually-busy at this hour"""
+        ranked = self._free_by_hour.get(hour)
+        if ranked is None:
+            ranked = sorted(self.known_slots(), key=lambda slot: (self.busyness(slot, hour), slot))
+            self._free_by_hour[hour] = ranked
+        return ranked
+
+    def recommend(self, user_id, at=None, top_n=3, avoid=()):
+        """Parking recommendations for a user at a given time (default: now); slots in avoid go last"""
+        user_id = str(user_id)
+        live = at is None
+        at = at or datetime.now()
+        hour = at.hour
+
+        known = self.known_slots()
+        if not known:
+            # No parking data at all: there is nothing real to suggest
+            return []
+
+        slots = self.user_slots.get(user_id)
+        if slots:
+            # Most used first; ties go to the slot this user takes at this hour, then the least busy
+            counts = {slot: (int(self.pair_stats[int(pair), PAIR_COUNT]),
+                             int(self.pair_stats[int(pair), PAIR_HOURS][hour]))
+                      for slot, pair in slots.items()
+                      if slot in known and not (live and self.is_taken_by_other(slot, user_id))}
+            ranked = sorted(counts, key=lambda slot: (slot in avoid, -counts[slot][0], -counts[slot][1],
+                                                      self.busyness(slot, hour)))
+            if ranked:
+                return [{
+                    'slot': slot,
+                    'score': counts[slot][0],
+                    'reason': f'Reserved {counts[slot][0]} times' if counts[slot][0] > 1 else 'Your preferred spot'
+                } for slot in ranked[:top_n]]
+
+        # No usable history: suggest slots that are usually free at this time
+        ranked = self.free_slots(hour)
+        busiest = self.busyness(ranked[-1], hour) or 1
+        candidates = [slot for slot in ranked if not (live and self.is_taken_by_other(slot, user_id))]
+        if avoid:
+            candidates.sort(key=lambda slot: slot in avoid)
+        return [{
+            'slot': slot,
+            'score': round(1 - self.busyness(slot, hour) / busiest, 2),
+            'reason': 'Usually free at this time'
+        } for slot in candidates[:top_n]]
+
+    def to_snapshot(self):
+        """Metadata (JSON-serialisable, datetimes via bson.json_util) and arrays for a model snapshot"""
+        slots_meta, slots_arrays = self.user_slots.to_snapshot()
+        arrays = {f'user_slots.{name}': array for name, array in slots_arrays.items()}
+        arrays['pair_stats'] = self.pair_stats[:self.n_pairs]
+        return {
+            'user_slots': slots_meta,
+            'slot_hours': {slot: hours.tolist() for slot, hours in self.slot_hours.items()},
+            'slot_week_hours': {slot: week.tolist() for slot, week in self.slot_week_hours.items()},
+            'first_day': self.first_day,
+            'slot_state': self.slot_state,
+            # Reservation start times as ISO strings so they round-trip to the exact key
+            'seen': [[key[0], key[1].isoformat() if key[1] else None, *key[2:]] for key in self.seen]
+        }, arrays
+
+    @classmethod
+    def from_snapshot(cls, state, arrays=None):
+        """Rebuild from to_snapshot() output; the pair table stays backed by the snapshot until written"""
+        index = cls()
+        if arrays and 'pair_stats' in arrays:
+            slots_arrays = {name.split('.', 1)[1]: array for name, array in arrays.items()
+                            if name.startswith('user_slots.')}
+            index.user_slots = InteractionMatrix.from_snapshot(state['user_slots'], slots_arrays)
+            index.pair_stats = arrays['pair_stats']
+            index.n_pairs = len(index.pair_stats)
+        else:
+            # Older snapshots keep {user: {slot: [count, hours, weekdays]}} in the metadata
+            for user_id, slots in state['user_slots'].items():
+                for slot, (count, hours, weekdays) in slots.items():
+                    pair = index._pair(user_id, slot)
+                    stats = index.pair_stats[pair]
+                    stats[PAIR_COUNT] = count
+                    stats[PAIR_HOURS] = hours
+                    stats[PAIR_WEEKDAYS] = weekdays
+        for slot, hours in state['slot_hours'].items():
+            index.slot_hours[slot][:] = hours
+        # Snapshots from before the weekly table leave it empty until the next full rebuild
+        for slot, week in state.get('slot_week_hours', {}).items():
+            index.slot_week_hours[slot][:] = week
+        index.first_day = state.get('first_day')
+        index.slot_state = {slot: tuple(value) for slot, value in state['slot_state'].items()}
+        index.seen = {(key[0], to_datetime(key[1]), *key[2:]) for key in state['seen']}
+        return index
+
+    def stats(self):
+        return {
+            'users': len(self.user_slots.users),
+            'slots': len(self.known_slots()),
+            'reservations_seen': len(self.seen)
+        }
@@ -0,0 +1,191 @@
+"""
+Time-decayed food popularity
+Ranks foods by exponentially decayed ordered quantity, so "popular now"
+follows recent demand, and keeps the ranking in max-heaps (one over every
+food and one per catalog category) so the top K foods are read by walking
+the heap best-first instead of sorting the whole menu. Decay is applied
+lazily: each order adds its quantity scaled up by exp(rate * (t - origin)),
+so a single global factor exp(-rate * (now - origin)) turns every stored
+value into its decayed score. An order only touches its own food (an
+O(log n) heap push) and the ranking never changes as time passes alone.
+Superseded heap entries are skipped when read and dropped when the heap is
+compacted. The origin sits on a fixed grid and moves forward, rescaling
+every value, before stored values can overflow.
+"""
+
+import heapq
+import math
+from datetime import datetime
+from itertools import islice
+
+from columnar import EPOCH, MICROSECOND, MISSING_TS, to_microseconds
+
+DAY_US = 86_400_000_000
+# Largest growth exponent stored before the origin moves forward (exp(709) overflows)
+REBASE_EXPONENT = 300.0
+
+
+class LazyHeap:
+    """Max-heap of (-value, seq, food id) entries where newer entries supersede older ones for a food"""
+
+    def __init__(self, entries=()):
+        self.entries = list(entries)
+        heapq.heapify(self.entries)
+        self.compacted_size = len(self.entries)
+
+    def push(self, entry, is_current):
+        heapq.heappush(self.entries, entry)
+        # Amortised O(1): rebuild once superseded entries could outnumber current ones
+        if len(self.entries) > 2 * self.compacted_size + 64:
+            self.__init__(e for e in self.entries if is_current(e))
+
+    def ranked(self, is_current):
+        """Current entries, best first, visiting O(k log k) heap slots for the first k"""
+        entries = self.entries
+        frontier = [(entries[0], 0)] if entries else []
+        while frontier:
+            entry, slot = heapq.heappop(frontier)
+            for child in (2 * slot + 1, 2 * slot + 2):
+                if child < len(entries):
+                    heapq.heappush(frontier, (entries[child], child))
+            if is_current(entry):
+                yield entry
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class DecayedPopularity:
+    def __init__(self, half_life_days=7.0, origin=None, now=None):
+        self.half_life_days = half_life_days
+        # Decay rate per microsecond: a quantity ordered half_life_days ago counts half
+        self.rate = math.log(2) / (half_life_days * DAY_US)
+        # Origins are multiples of the grid spacing, so separate builds of the same orders line up
+        self.grid = int(REBASE_EXPONENT / self.rate)
+        self.origin = self.grid_origin(to_microseconds(now or datetime.now())) if origin is None else origin
+
+        # food id -> decayed quantity scaled to the origin; seq is first-seen order, which breaks ties
+        self.values = {}
+        self.seq = {}
+        self.categories = {}
+        # Built on first read after a bulk load or catalog change, then maintained per order
+        self.heap = None
+        self.category_heaps = None
+
+    def grid_origin(self, timestamp):
+        return timestamp // self.grid * self.grid
+
+    @property
+    def origin_datetime(self):
+        return EPOCH + self.origin * MICROSECOND
+
+    def clear(self):
+        """Drop every count; categories follow the catalog, not the orders, so they are kept"""
+        categories = self.categories
+        self.__init__(self.half_life_days)
+        self.categories = categories
+
+    def add(self, food_id, quantity, timestamp=MISSING_TS):
+        """Count an ordered quantity; orders without a timestamp count as placed now"""
+        if timestamp == MISSING_TS:
+            timestamp = to_microseconds(datetime.now())
+        if timestamp - self.origin > self.grid:
+            self.rebase(self.grid_origin(timestamp))
+        value = self.values.get(food_id, 0.0) + quantity * math.exp(self.rate * (timestamp - self.origin))
+        self._set(food_id, value)
+
+    def _set(self, food_id, value):
+        if food_id not in self.seq:
+            self.seq[food_id] = len(self.seq)
+        self.values[food_id] = value
+        if self.heap is None:
+            return
+        entry = (-value, self.seq[food_id], food_id)
+        self.heap.push(entry, self._is_current)
+        category = self.categories.get(food_id)
+        heap = self.category_heaps.get(category)
+        if heap is None:
+            heap = self.category_heaps[category] = LazyHeap()
+        heap.push(entry, self._in_category(category))
+
+    def _is_current(self, entry):
+        return self.values.get(entry[2]) == -entry[0]
+
+    def _in_category(self, category):
+        return lambda entry: self._is_current(entry) and self.categories.get(entry[2]) == category
+
+    def freeze(self):
+        """Build the heaps from the current values"""
+        entries = [(-value, self.seq[food_id], food_id) for food_id, value in self.values.items()]
+        self.heap = LazyHeap(entries)
+        by_category = {}
+        for entry in entries:
+            by_category.setdefault(self.categories.get(entry[2]), []).append(entry)
+        self.category_heaps = {category: LazyHeap(group) for category, group in by_category.items()}
+
+    def rebase(self, origin):
+        """Move the origin forward, rescaling every stored value"""
+        factor = math.exp(-self.rate * (origin - self.origin))
+        self.values = {food_id: value * factor for food_id, value in self.values.items()}
+        self.origin = origin
+        if self.heap is not None:
+            self.freeze()
+
+    def set_categories(self, catalog):
+        """Group foods by their catalog category; foods missing from the catalog share the None group"""
+        categories = {food_id: food.get('category') for food_id, food in catalog.by_id.items()}
+        if categories != self.categories:
+            self.categories = categories
+            if self.heap is not None:
+                self.freeze()
+
+    def merge(self, other):
+        """Add another partial's values, in its first-seen order"""
+        if other.origin > self.origin:
+            self.rebase(other.origin)
+        factor = math.exp(-self.rate * (self.origin - other.origin))
+        for food_id, value in other.values.items():
+            self._set(food_id, self.values.get(food_id, 0.0) + value * factor)
+
+    def scale(self, now=None):
+        """Global decay factor turning stored values into scores as of now"""
+        return math.exp(-self.rate * (to_microseconds(now or datetime.now()) - self.origin))
+
+    def ranked(self, category=None, now=None):
+        """(food id, decayed score) pairs best first, lazily; category=None ranks every food"""
+        if self.heap is None:
+            self.freeze()
+        if category is None:
+            heap, is_current = self.heap, self._is_current
+        else:
+            heap, is_current = self.category_heaps.get(category, LazyHeap()), self._in_category(category)
+        scale = self.scale(now)
+        for value, _, food_id in heap.ranked(is_current):
+            yield food_id, -value * scale
+
+    def top(self, k=None, category=None, now=None):
+        """The k most popular foods right now as (food id, decayed score) pairs; k=None ranks them all"""
+        return list(islice(self.ranked(category, now), k))
+
+    def to_snapshot(self):
+        return {
+            'half_life_days': self.half_life_days,
+            'origin': self.origin,
+            'foods': list(self.values),
+            'values': list(self.values.values())
+        }
+
+    @classmethod
+    def from_totals(cls, food_ids, values, half_life_days, origin):
+        """Rebuild from per-food values already scaled to origin, listed in first-seen order"""
+        popularity = cls(half_life_days, origin=origin)
+        for food_id, value in zip(food_ids, values):
+            popularity._set(food_id, value)
+        return popularity
+
+    @classmethod
+    def from_snapshot(cls, meta):
+        return cls.from_totals(meta['foods'], meta['values'], meta['half_life_days'], meta['origin'])
+
+    def __len__(self):
+        return len(self.values)
@@ -0,0 +1,150 @@
+"""
+Parallel full retrain
+Splits the order history into contiguous time-range shards (orders arrive in
+_id order, so each shard is a slice of the stream), builds each shard's
+partial order table, decayed popularity and user x food matrix in a process
+pool, and merges the partials in shard order. Merging in stream order keeps
+every first-seen ordering the serial path produces (popularity ties, interned
+ids, per-user food order), so the merged model is identical to calling
+apply_order for every order. Co-occurrence counts need each user's complete
+food set, so they are computed after the merge with vectorized pair counting.
+Orders streamed from a cursor are cut into batches and fed to the pool as they
+arrive instead of being sliced from a list.
+"""
+
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+
+from columnar import IdSet, OrderTable
+from cooccurrence import CooccurrenceModel
+from interactions import InteractionMatrix
+from popularity import DecayedPopularity
+
+# Below this many orders the pool start-up costs more than the serial pass
+MIN_PARALLEL_ORDERS = 20000
+# Orders per pool task when the orders arrive as a stream of unknown length
+STREAM_BATCH_SIZE = 5000
+
+# Orders of the retrain in progress, inherited by forked pool workers
+_orders = None
+
+
+def build_shard(orders, decay):
+    """Partial model for a slice of already-deduplicated orders, mirroring apply_order"""
+    table = OrderTable()
+    preferences = InteractionMatrix()
+    # Decayed values are scaled to the merged model's origin (half-life, origin)
+    decayed = DecayedPopularity(*decay)
+    versions = Counter()
+    for order in orders:
+        user_id = str(order.get('user', ''))
+        versions[str(order.get('user'))] += 1
+        ordered_at = table.append(order)
+        if user_id:
+            for item in order.get('items', []):
+                food_id = str(item.get('food', ''))
+                quantity = item.get('quantity', 1)
+                preferences.add(user_id, food_id, quantity)
+                decayed.add(food_id, quantity, ordered_at)
+    # concat() regroups the merged rows, so shards send only the columns
+    return table.to_snapshot(groups=False), preferences.to_snapshot(), decayed.to_snapshot(), versions
+
+
+def _build_slice(bounds, decay):
+    return build_shard(_orders[bounds[0]:bounds[1]], decay)
+
+
+class Deduplicator:
+    """Drops orders apply_order would skip, tracking the ids seen and the highest id"""
+
+    def __init__(self):
+        self.order_ids = IdSet()
+        self.last_order_id = None
+
+    def filter(self, orders):
+        unique = []
+        for order in orders:
+            order_id = order.get('_id')
+            if order_id is not None:
+                if str(order_id) in self.order_ids:
+                    continue
+                self.order_ids.add(str(order_id))
+                if self.last_order_id is None or order_id > self.last_order_id:
+                    self.last_order_id = order_id
+            unique.append(order)
+        return unique
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def shard_bounds(count, shards):
+    """(start, end) of `shards` contiguous, near-equal slices of `count` orders"""
+    edges = [count * i // shards for i in range(shards + 1)]
+    return [(start, end) for start, end in zip(edges, edges[1:]) if end > start]
+
+
+def build_partials(orders, workers, decay):
+    """Shard partials in stream order, built across a pool of worker processes"""
+    global _orders
+    bounds = shard_bounds(len(orders), workers)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # Forked workers read their slice of the parent's list instead of unpickling it
+        _orders = orders
+        try:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                return list(pool.map(partial(_build_slice, decay=decay), bounds))
+        finally:
+            _orders = None
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(partial(build_shard, decay=decay), [orders[start:end] for start, end in bounds]))
+
+
+def stream_partials(batches, workers, decay):
+    """Shard partials for a stream of order batches, yielded in order as they complete"""
+    # A bounded number of batches in flight keeps memory independent of the stream length
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(build_shard, batch, decay))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def parallel_analyze(engine, orders, workers):
+    """Rebuild the engine's order-derived state from orders using a process pool"""
+    deduplicator = Deduplicator()
+    decayed = engine.popularity
+    decay = (decayed.half_life_days, decayed.origin)
+    if isinstance(orders, list):
+        partials = build_partials(deduplicator.filter(orders), workers, decay)
+    else:
+        batch_size = getattr(orders, 'batch_size', None) or STREAM_BATCH_SIZE
+        partials = stream_partials((deduplicator.filter(batch) for batch in batched(orders, batch_size)), workers,
+                                   decay)
+
+    preferences = InteractionMatrix()
+    tables = []
+    for table, (meta, arrays), shard_decayed, versions in partials:
+        tables.append(table)
+        preferences.update(InteractionMatrix.from_snapshot(meta, arrays))
+        decayed.merge(DecayedPopularity.from_snapshot(shard_decayed))
+        engine.user_versions.update(versions)
+
+    engine.order_table = OrderTable.concat(tables)
+    engine.user_preferences = preferences
+    engine.cooccurrence = CooccurrenceModel.from_interactions(preferences)
+    engine.order_ids = deduplicator.order_ids
+    engine.last_order_id = deduplicator.last_order_id
+    return len(tables)
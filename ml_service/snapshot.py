@@ -0,0 +1,144 @@
+"""
+Model snapshot files
+A snapshot is one file: a magic string, the length of a JSON header, the
+header itself, then numpy arrays aligned to 64 bytes. The header holds the
+format version, small state (catalog, parking documents, id lists) and the
+dtype/shape/offset of every array, so loading maps the file and wraps each
+array with np.frombuffer instead of copying or parsing it. Files are written
+to a temporary path and renamed into place, so readers never see a partial
+snapshot.
+
+The mapping is shared and read-only, so gunicorn workers that load the same
+snapshot share one copy of the large tables in the page cache. A worker that
+retrains publishes a new file; the others notice the changed file stamp and
+swap to it.
+"""
+
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process boot lock
+    fcntl = None
+
+import numpy as np
+from bson import json_util
+from bson.json_util import CANONICAL_JSON_OPTIONS
+
+from background import BackgroundWorker
+
+MAGIC = b'SCMLSNAP'
+FORMAT_VERSION = 1
+ALIGN = 64
+# Keeps ints/floats and ObjectIds distinct and datetimes naive, like pymongo returns them
+JSON_OPTIONS = CANONICAL_JSON_OPTIONS.with_options(tz_aware=False)
+
+
+class SnapshotError(Exception):
+    """A snapshot file is missing, truncated or from an incompatible format"""
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def file_stamp(stat):
+    """Identity of one published snapshot file: a rename-based publish always changes it"""
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def current_stamp(path):
+    try:
+        return file_stamp(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def snapshot_lock(path):
+    """Exclusive cross-process lock so only one worker builds a missing snapshot"""
+    if not path or fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_snapshot(path, meta, arrays):
+    """Atomically write meta (JSON-serialisable via bson.json_util) and named numpy arrays; returns its stamp"""
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _aligned(offset + array.nbytes)
+
+    header = json_util.dumps({'format': FORMAT_VERSION, 'meta': meta, 'arrays': layout},
+                             json_options=JSON_OPTIONS).encode()
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+        stamp = file_stamp(os.fstat(f.fileno()))
+    os.replace(tmp_path, path)
+    return stamp
+
+
+def read_snapshot(path):
+    """Map a snapshot file; returns (meta, arrays, stamp) with read-only arrays backed by the file"""
+    try:
+        with open(path, 'rb') as f:
+            stamp = file_stamp(os.fstat(f.fileno()))
+            # Shared, read-only mapping: every worker reading this file uses the same page cache pages
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Cannot open snapshot {path}: {e}")
+
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise SnapshotError(f"{path} is not a model snapshot")
+    (header_length,) = struct.unpack_from('<Q', buffer, len(MAGIC))
+    header_start = len(MAGIC) + 8
+    try:
+        header = json_util.loads(buffer[header_start:header_start + header_length].decode(),
+                                 json_options=JSON_OPTIONS)
+    except ValueError as e:
+        raise SnapshotError(f"Corrupt snapshot header in {path}: {e}")
+    if header.get('format') != FORMAT_VERSION:
+        raise SnapshotError(f"Snapshot format {header.get('format')} is not supported (expected {FORMAT_VERSION})")
+
+    data_start = _aligned(header_start + header_length)
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape']))
+        if data_start + spec['offset'] + count * dtype.itemsize > len(buffer):
+            raise SnapshotError(f"Snapshot {path} is truncated")
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                     offset=data_start + spec['offset']).reshape(spec['shape'])
+
+    return header['meta'], arrays, stamp
+
+
+class SnapshotWatcher(BackgroundWorker):
+    """Adopts snapshots published by other workers (e.g. after their /train)"""
+    name = 'snapshot-watcher'
+    failure = 'Snapshot refresh failed'
+
+    def work(self):
+        self.engine.refresh_snapshot()
@@ -0,0 +1,17 @@
+import os
+import sys
+
+ML_SERVICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ML_SERVICE)
+# The synthetic workload generator and the benchmark checks are shared with the tests
+sys.path.insert(0, os.path.join(ML_SERVICE, 'benchmarks'))
+
+# Importing app builds its module-level engine: keep it on mock data without a snapshot or workers
+os.environ.update({
+    'MONGO_URI': '',
+    'ML_SNAPSHOT_PATH': '',
+    'ML_INGESTION': 'false',
+    'ML_MATERIALIZE': 'false',
+    'ML_COLD_START': 'false',
+    'ML_FORECAST': 'false'
+})
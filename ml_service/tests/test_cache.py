@@ -0,0 +1,58 @@
+"""
+Recommendation cache
+Food recommendations are served from the cache while the user's data
+version holds; parking is recomputed per request, so a slot another user
+has just taken is not suggested from a cached response.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import app
+from cache import RecommendationCache
+from datastore import MongoDataStore
+from fakedb import FakeDatabase
+
+USER, OTHER = str(ObjectId()), str(ObjectId())
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    data = {
+        'foods': [{'_id': f'food_{i}', 'name': f'Food {i}', 'price': 100, 'category': 'Main Course',
+                   'available': True} for i in range(3)],
+        'orders': [{'_id': ObjectId(), 'user': USER, 'items': [{'food': 'food_1', 'quantity': 2}],
+                    'orderedAt': datetime.now(), 'status': 'completed'}],
+        'parking': [{'_id': f'parking_{i}', 'slot': f'A-0{i}', 'status': 'available'} for i in range(1, 4)]
+    }
+    engine = app.RecommendationEngine(MongoDataStore(FakeDatabase.from_data(data)))
+    engine.build()
+    # USER's history: A-01 twice, A-02 once
+    for i, slot in enumerate(['A-01', 'A-01', 'A-02']):
+        engine.apply_reservation({'_id': f'past_{i}', 'slot': slot, 'user': USER, 'status': 'reserved',
+                                  'reservedAt': datetime.now() - timedelta(days=i + 1)})
+    # ...and every slot is free again
+    for parking in data['parking']:
+        engine.apply_reservation(dict(parking))
+    monkeypatch.setattr(app, 'engine', engine)
+    monkeypatch.setattr(app, 'recommendation_cache', RecommendationCache())
+    return engine
+
+
+def slots(response):
+    assert response.status_code == 200
+    return [suggestion['slot'] for suggestion in response.get_json()['parking']]
+
+
+def test_cached_response_recomputes_parking(engine):
+    client = app.app.test_client()
+    assert slots(client.get(f'/recommendations/{USER}')) == ['A-01', 'A-02']
+
+    engine.apply_reservation({'_id': 'parking_1', 'slot': 'A-01', 'user': OTHER, 'status': 'reserved',
+                              'reservedAt': datetime.now()})
+    response = client.get(f'/recommendations/{USER}')
+    assert app.recommendation_cache.hits == 1
+    assert slots(response) == ['A-02']
+    assert response.get_json()['foods'][0]['id'] == 'food_1'
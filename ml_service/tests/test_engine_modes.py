@@ -0,0 +1,58 @@
+"""
+Dict and columnar engine modes
+Scores a small synthetic campus workload with both in-process engine modes
+against the same resident model and requires identical recommendations,
+including after orders are ingested incrementally and for users without
+history.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import app
+from datastore import MongoDataStore
+from workload import generate, load_fake_database, strip
+
+
+@pytest.fixture(scope='module')
+def workload():
+    data = generate(users=150, foods=30, orders_per_user=12, days=45, seed=7)
+    # Other clients may have written orderedAt as an ISO string; both modes must parse it the same way
+    for order in data['orders'][::3]:
+        order['orderedAt'] = order['orderedAt'].isoformat()
+    return data
+
+
+@pytest.fixture
+def engine(workload):
+    engine = app.RecommendationEngine(MongoDataStore(load_fake_database(workload)))
+    engine.build()
+    return engine
+
+
+def differing_users(engine, user_ids, now):
+    return [user_id for user_id in user_ids
+            if strip(engine.recommend(user_id, mode='dict', now=now))
+            != strip(engine.recommend(user_id, mode='columnar', now=now))]
+
+
+def test_modes_match_after_a_build(engine, workload):
+    user_ids = [str(user['_id']) for user in workload['users']]
+    now = datetime.now()
+    assert engine.recommend(user_ids[0], mode='columnar', now=now)['foods']
+    assert differing_users(engine, user_ids + ['unknown_user'], now) == []
+    # Trend windows and decay are relative to the scoring time
+    assert differing_users(engine, user_ids[:40], now - timedelta(days=20)) == []
+
+
+def test_modes_match_after_incremental_orders(engine, workload):
+    users = [user['_id'] for user in workload['users'][:20]]
+    foods = [food['_id'] for food in workload['foods']]
+    for i, user in enumerate(users):
+        engine.apply_order({'_id': ObjectId(), 'user': user, 'status': 'completed',
+                            'orderedAt': datetime.now() - timedelta(hours=i),
+                            'items': [{'food': foods[i % len(foods)], 'quantity': 1 + i % 3},
+                                      {'food': foods[(i * 7) % len(foods)]}]})
+    assert differing_users(engine, [str(user) for user in users], datetime.now()) == []
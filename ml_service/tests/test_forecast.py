@@ -0,0 +1,50 @@
+"""
+Demand forecasts
+Forecasts food demand from the resident order table of a full model and from
+hourly totals grouped by MongoDB for a pushdown model, which keeps no
+per-order rows, and requires the same expected orders and sell-out hours.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import app
+from datastore import MongoDataStore
+from forecast import DemandForecast
+from workload import generate, load_fake_database
+
+NOW = datetime(2026, 3, 4, 10, 30)
+
+
+@pytest.fixture(scope='module')
+def db():
+    data = generate(users=150, foods=20, orders_per_user=15, days=40, seed=9, now=NOW)
+    # The most ordered foods run out part-way through the day
+    for food in data['foods'][:4]:
+        food['dailyCapacity'] = 5
+    return load_fake_database(data)
+
+
+def forecast(db, pushdown, day):
+    engine = app.RecommendationEngine(MongoDataStore(db), pushdown=pushdown)
+    engine.build()
+    assert engine.aggregated == pushdown
+    return DemandForecast(engine).build(day, now=NOW)
+
+
+@pytest.mark.parametrize('days_ahead', [0, 1, 5])
+def test_pushdown_forecast_matches_the_order_table(db, days_ahead):
+    day = NOW.date() + timedelta(days=days_ahead)
+    full, pushdown = forecast(db, False, day), forecast(db, True, day)
+
+    expected = dict(zip(full['food_ids'], full['demand']))
+    assert pushdown['demand'].any()
+    assert set(pushdown['food_ids']) <= set(expected)
+    for food_id, demand in zip(pushdown['food_ids'], pushdown['demand']):
+        assert np.allclose(demand, expected[food_id])
+    # Foods without orders in the window are simply not in the grouped rows
+    assert not any(expected[food_id].any() for food_id in set(expected) - set(pushdown['food_ids']))
+    assert pushdown['sold_out'] == full['sold_out']
+    assert full['sold_out']
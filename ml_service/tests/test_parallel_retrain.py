@@ -0,0 +1,63 @@
+"""
+Serial vs parallel retrain
+Builds the same generated workload, with duplicated orders as replayed change
+events deliver them, through the serial apply_order pass and the sharded
+process-pool retrain (with the size threshold lowered so a small workload is
+sharded), and requires the same model state and recommendations.
+"""
+
+from datetime import datetime
+
+import pytest
+
+import app
+from compare_retrain import model_state
+from workload import close, generate, strip
+
+
+@pytest.fixture(scope='module')
+def workload():
+    data = generate(users=120, foods=25, orders_per_user=10, seed=11)
+    data['orders'].extend(data['orders'][::29])
+    return data
+
+
+def build(data, workers):
+    engine = app.RecommendationEngine(train_workers=workers)
+    engine.analyze_data(data['orders'], data['parking'])
+    engine.sync_foods(data['foods'])
+    return engine
+
+
+def test_parallel_retrain_matches_serial(workload, monkeypatch):
+    sharded = []
+
+    def parallel_analyze(engine, orders, workers):
+        sharded.append(workers)
+        return app_parallel_analyze(engine, orders, workers)
+
+    app_parallel_analyze = app.parallel_analyze
+    monkeypatch.setattr(app, 'parallel_analyze', parallel_analyze)
+    monkeypatch.setattr(app, 'MIN_PARALLEL_ORDERS', 0)
+    serial, parallel = build(workload, 1), build(workload, 3)
+    assert sharded == [3]
+
+    serial_state, parallel_state = model_state(serial), model_state(parallel)
+    assert [name for name in serial_state if serial_state[name] != parallel_state[name]] == []
+
+    # Shards sum decayed popularity in a different order, so scores are compared up to rounding
+    now = datetime.now()
+    assert close(serial.popularity.top(now=now), parallel.popularity.top(now=now))
+    for user in workload['users'][:40]:
+        for mode in ('dict', 'columnar'):
+            assert close(strip(serial.recommend(str(user['_id']), mode=mode, now=now)),
+                         strip(parallel.recommend(str(user['_id']), mode=mode, now=now)))
+
+
+def test_small_retrains_stay_serial(workload, monkeypatch):
+    def fail(*args):
+        raise AssertionError('sharded a retrain below MIN_PARALLEL_ORDERS')
+
+    monkeypatch.setattr(app, 'parallel_analyze', fail)
+    monkeypatch.setattr(app, 'MIN_PARALLEL_ORDERS', len(workload['orders']) + 1)
+    assert build(workload, 3).order_ids.to_array().size
@@ -0,0 +1,123 @@
+"""
+Time-decayed popularity
+Checks the lazy-heap ranking against a plain sort of decayed quantities
+computed directly from the orders: overall and per category, while the
+heaps are maintained per order, across origin rebases, after foods change
+category, and when shard partials are merged as the parallel retrain does.
+"""
+
+import math
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from catalog import FoodCatalog
+from columnar import to_microseconds
+from popularity import DecayedPopularity
+from workload import close
+
+# A half-life this short moves the origin forward (rescaling every value) every ~216 days
+HALF_LIFE_DAYS = 0.5
+NOW = datetime(2026, 6, 1, 12, 0)
+FOODS = [f'food_{i}' for i in range(40)]
+CATEGORIES = ['Main Course', 'Beverage', 'Snack', None]
+
+
+@pytest.fixture(scope='module')
+def orders():
+    rng = random.Random(5)
+    # Over 400 days, most of them recent so the ranking is decided by more than rounding
+    return [(rng.choice(FOODS), rng.uniform(1, 5), NOW - timedelta(days=rng.expovariate(1 / 20) % 400))
+            for _ in range(3000)]
+
+
+def catalog(seed):
+    rng = random.Random(seed)
+    return FoodCatalog([{'_id': food_id, 'category': rng.choice(CATEGORIES)} for food_id in FOODS[:-3]])
+
+
+def expected(orders, categories=None, category=None, now=NOW):
+    """Decayed quantity per food, best first, first-seen order breaking ties"""
+    rate = math.log(2) / (HALF_LIFE_DAYS * 86_400_000_000)
+    scores, first_seen = {}, {}
+    for food_id, quantity, ordered_at in orders:
+        first_seen.setdefault(food_id, len(first_seen))
+        scores[food_id] = scores.get(food_id, 0.0) + quantity * math.exp(
+            -rate * (to_microseconds(now) - to_microseconds(ordered_at)))
+    if categories is not None:
+        scores = {food_id: score for food_id, score in scores.items() if categories.get(food_id) == category}
+    return sorted(scores.items(), key=lambda item: (-item[1], first_seen[item[0]]))
+
+
+def assert_ranked(popularity, orders, categories=None, category=None):
+    ranked = popularity.top(category=category, now=NOW)
+    reference = expected(orders, categories, category)
+    assert [food_id for food_id, _ in ranked] == [food_id for food_id, _ in reference]
+    assert close(ranked, reference)
+
+
+def build(orders, origin=None):
+    popularity = DecayedPopularity(HALF_LIFE_DAYS, origin=origin, now=orders[0][2])
+    for food_id, quantity, ordered_at in orders:
+        popularity.add(food_id, quantity, to_microseconds(ordered_at))
+    return popularity
+
+
+def test_top_matches_a_sort_of_decayed_values(orders):
+    orders = sorted(orders, key=lambda order: order[2])
+    popularity = DecayedPopularity(HALF_LIFE_DAYS, now=orders[0][2])
+    first_origin = popularity.origin
+    half = len(orders) // 2
+    for food_id, quantity, ordered_at in orders[:half]:
+        popularity.add(food_id, quantity, to_microseconds(ordered_at))
+    # Read once so the heaps exist and the second half is pushed into them order by order
+    assert_ranked(popularity, orders[:half])
+    for food_id, quantity, ordered_at in orders[half:]:
+        popularity.add(food_id, quantity, to_microseconds(ordered_at))
+
+    assert popularity.origin > first_origin
+    assert_ranked(popularity, orders)
+    assert popularity.top(k=5, now=NOW) == popularity.top(now=NOW)[:5]
+
+
+def test_explicit_rebase_keeps_the_ranking(orders):
+    popularity = build(sorted(orders, key=lambda order: order[2]))
+    popularity.top(now=NOW)
+    popularity.rebase(popularity.origin + popularity.grid)
+    assert_ranked(popularity, orders)
+
+
+def test_category_rankings_follow_catalog_changes(orders):
+    popularity = build(sorted(orders, key=lambda order: order[2]))
+    for seed in (1, 2):
+        foods = catalog(seed)
+        popularity.set_categories(foods)
+        categories = {food_id: food.get('category') for food_id, food in foods.by_id.items()}
+        # category=None ranks every food, including those missing from the catalog
+        for category in CATEGORIES[:-1]:
+            assert_ranked(popularity, orders, categories, category)
+        assert_ranked(popularity, orders)
+
+
+def test_merged_shards_match_a_single_pass(orders):
+    orders = sorted(orders, key=lambda order: order[2])
+    single = build(orders)
+    merged = DecayedPopularity(HALF_LIFE_DAYS, now=orders[0][2])
+    bounds = [0, 700, 1900, len(orders)]
+    for start, end in zip(bounds, bounds[1:]):
+        # Each shard decays from the merged model's origin and may rebase on its own
+        merged.merge(build(orders[start:end], origin=merged.origin))
+
+    assert list(merged.values) == list(single.values)
+    assert close(merged.top(now=NOW), single.top(now=NOW))
+    assert_ranked(merged, orders)
+
+
+def test_superseded_heap_entries_are_compacted():
+    popularity = DecayedPopularity(HALF_LIFE_DAYS, now=NOW)
+    popularity.top(now=NOW)
+    for i in range(5000):
+        popularity.add(FOODS[i % 10], 1, to_microseconds(NOW))
+    assert len(popularity.heap) < 200
+    assert [food_id for food_id, _ in popularity.top(now=NOW)] == FOODS[:10]
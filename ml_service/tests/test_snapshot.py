@@ -0,0 +1,109 @@
+"""
+Model snapshots
+Restores a saved model next to a fresh build from the same FakeDatabase and
+requires the same recommendations in every engine mode: straight after a
+restore, after replaying orders and parking changes made since the snapshot,
+and after switching to a snapshot another worker published. Snapshots built
+for the other pushdown setting are rejected.
+"""
+
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+import app
+from datastore import MongoDataStore
+from snapshot import SnapshotError
+from workload import generate, load_fake_database, strip
+
+
+@pytest.fixture
+def workload():
+    return generate(users=80, foods=20, orders_per_user=8, parking_slots=20, seed=3)
+
+
+@pytest.fixture
+def db(workload):
+    return load_fake_database(workload)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'model_snapshot.bin')
+
+
+def engine(db, path=None, **kwargs):
+    return app.RecommendationEngine(MongoDataStore(db), snapshot_path=path, **kwargs)
+
+
+def assert_same_recommendations(restored, built, workload):
+    now = datetime.now()
+    user_ids = [str(user['_id']) for user in workload['users'][:30]] + ['unknown_user']
+    for user_id in user_ids:
+        for mode in app.ENGINE_MODES:
+            assert strip(restored.recommend(user_id, mode=mode, now=now)) == \
+                strip(built.recommend(user_id, mode=mode, now=now)), (user_id, mode)
+
+
+def add_changes(db, workload):
+    users = [user['_id'] for user in workload['users']]
+    foods = [food['_id'] for food in workload['foods']]
+    db.orders.insert_many([{'_id': ObjectId(), 'user': users[i], 'status': 'completed', 'orderedAt': datetime.now(),
+                            'items': [{'food': foods[i % 5], 'quantity': 2}]} for i in range(12)])
+    db.parking.update_one({'_id': workload['parking'][0]['_id']},
+                          {'$set': {'status': 'reserved', 'user': users[0], 'reservedAt': datetime.now()}})
+
+
+def test_restore_serves_the_same_recommendations(db, workload, path):
+    built = engine(db, path)
+    built.build()
+    built.save_snapshot()
+
+    restored = engine(db, path)
+    assert restored.boot()
+    assert restored.snapshot_info['restored']
+    # Large tables stay backed by the read-only mapping
+    assert not restored.order_table.order_ts.base.flags.writeable
+    assert restored.last_order_id == built.last_order_id
+    assert_same_recommendations(restored, built, workload)
+
+
+def test_catch_up_replays_changes_made_after_the_snapshot(db, workload, path):
+    engine(db, path).boot()
+    add_changes(db, workload)
+
+    restored = engine(db, path)
+    restored.boot()
+    built = engine(db)
+    built.build()
+    assert restored.last_order_id == built.last_order_id
+    assert restored.parking_index.has_user(str(workload['users'][0]['_id']))
+    assert_same_recommendations(restored, built, workload)
+
+
+def test_refresh_switches_to_a_newer_snapshot(db, workload, path):
+    follower = engine(db, path)
+    follower.boot()
+    assert not follower.refresh_snapshot()
+
+    add_changes(db, workload)
+    publisher = engine(db, path)
+    publisher.build()
+    publisher.save_snapshot()
+    assert follower.refresh_snapshot()
+    assert follower.last_order_id == publisher.last_order_id
+    assert_same_recommendations(follower, publisher, workload)
+
+
+def test_snapshot_for_the_other_build_mode_is_rejected(db, workload, path):
+    engine(db, path).boot()
+
+    pushdown = engine(db, path, pushdown=True)
+    with pytest.raises(SnapshotError):
+        pushdown.load_snapshot()
+    assert not pushdown.refresh_snapshot()
+    assert pushdown.rejected_stamp is not None
+    # Booting falls back to a pushdown build rather than serving the full model
+    assert pushdown.boot()
+    assert pushdown.aggregated